@@ -0,0 +1,296 @@
+"""
+Server-side achievement rules evaluated on activity events.
+
+Every rule declares the event types it listens to and the counters it reads.
+Rules are indexed by event type, so an incoming write is only checked against
+the rules that can possibly change because of it. The counters themselves are
+kept per user in ``achievement_counters`` and bumped with ``$inc`` as events
+arrive, so evaluating a rule never needs to count documents.
+"""
+
+import asyncio
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from pymongo import ReturnDocument
+
+COUNTERS_COLLECTION = "achievement_counters"
+
+# Counters copied from user_progress after the streak/level update (kept as max)
+PROGRESS_COUNTERS = ("longest_streak", "level")
+
+
+class EventSource:
+    """How an event type maps onto counters, live and when seeding from history"""
+
+    def __init__(self, collection: str, extract: Callable[[Dict[str, Any]], Dict[str, int]],
+                 seed: Dict[str, Any], match_field: str = "user_id"):
+        self.collection = collection
+        self.extract = extract
+        self.seed = seed
+        self.match_field = match_field
+
+
+def _flag(condition: Any) -> Dict[str, Any]:
+    return {"$sum": {"$cond": [condition, 1, 0]}}
+
+
+EVENT_SOURCES: Dict[str, EventSource] = {
+    "pomodoro": EventSource(
+        "pomodoro_sessions",
+        lambda doc: {
+            "pomodoro_sessions": 1,
+            "focus_minutes": doc.get("work_duration") or 0,
+            "completed_pomodoros": int(doc.get("completion_status") == "completed"),
+        },
+        {
+            "pomodoro_sessions": {"$sum": 1},
+            "focus_minutes": {"$sum": "$work_duration"},
+            "completed_pomodoros": _flag({"$eq": ["$completion_status", "completed"]}),
+        },
+    ),
+    "mindfulness": EventSource(
+        "meditation_sessions",
+        lambda doc: {"meditation_sessions": 1, "meditation_minutes": doc.get("duration_actual") or 0},
+        {"meditation_sessions": {"$sum": 1}, "meditation_minutes": {"$sum": "$duration_actual"}},
+    ),
+    "five_minute_rule": EventSource(
+        "five_minute_sessions",
+        lambda doc: {"five_minute_sessions": 1, "momentum_sessions": int(bool(doc.get("momentum_created")))},
+        {"five_minute_sessions": {"$sum": 1}, "momentum_sessions": _flag("$momentum_created")},
+    ),
+    "physical_activity": EventSource(
+        "activity_sessions",
+        lambda doc: {"activity_sessions": 1, "activity_minutes": doc.get("duration") or 0},
+        {"activity_sessions": {"$sum": 1}, "activity_minutes": {"$sum": "$duration"}},
+    ),
+    "sleep_circadian": EventSource(
+        "sleep_data",
+        lambda doc: {"sleep_nights": 1, "good_sleep_nights": int((doc.get("sleep_quality") or 0) >= 8)},
+        {"sleep_nights": {"$sum": 1}, "good_sleep_nights": _flag({"$gte": ["$sleep_quality", 8]})},
+    ),
+    "cbt": EventSource(
+        "thought_records",
+        lambda doc: {"thought_records": 1},
+        {"thought_records": {"$sum": 1}},
+    ),
+    "coins": EventSource(
+        "coin_transactions",
+        lambda doc: {"coins_earned": max(doc.get("amount") or 0, 0)},
+        {"coins_earned": {"$sum": {"$max": ["$amount", 0]}}},
+    ),
+}
+
+ACTIVITY_EVENTS = ("pomodoro", "mindfulness", "five_minute_rule", "physical_activity", "sleep_circadian", "cbt")
+
+
+class AchievementRule:
+    """An achievement unlocked once ``counter`` reaches ``threshold``"""
+
+    def __init__(self, rule_id: str, title: str, description: str, counter: str, threshold: int,
+                 events: Iterable[str], points: int, category: str, rarity: str = "common"):
+        self.id = rule_id
+        self.title = title
+        self.description = description
+        self.counter = counter
+        self.threshold = threshold
+        self.events = tuple(events)
+        self.points = points
+        self.category = category
+        self.rarity = rarity
+
+    def matches(self, counters: Dict[str, Any]) -> bool:
+        return counters.get(self.counter, 0) >= self.threshold
+
+    def to_achievement(self, user_id: str) -> Dict[str, Any]:
+        """Build a document shaped like the ``Achievement`` model"""
+        return {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "achievement_type": self.id,
+            "title": self.title,
+            "description": self.description,
+            "points_earned": self.points,
+            "unlock_date": datetime.utcnow(),
+            "category": self.category,
+            "rarity": self.rarity,
+        }
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "title": self.title,
+            "description": self.description,
+            "counter": self.counter,
+            "threshold": self.threshold,
+            "events": list(self.events),
+            "points": self.points,
+            "category": self.category,
+            "rarity": self.rarity,
+        }
+
+
+DEFAULT_RULES = [
+    AchievementRule("first_focus", "First Focus", "Complete your first Pomodoro session",
+                    "pomodoro_sessions", 1, ["pomodoro"], 10, "pomodoro"),
+    AchievementRule("focus_10", "Focused Ten", "Log 10 Pomodoro sessions",
+                    "pomodoro_sessions", 10, ["pomodoro"], 50, "pomodoro"),
+    AchievementRule("focus_100", "Centurion", "Log 100 Pomodoro sessions",
+                    "pomodoro_sessions", 100, ["pomodoro"], 300, "pomodoro", "epic"),
+    AchievementRule("deep_work_1000", "Deep Worker", "Spend 1000 minutes in focus sessions",
+                    "focus_minutes", 1000, ["pomodoro"], 200, "pomodoro", "rare"),
+    AchievementRule("first_meditation", "First Breath", "Complete your first meditation",
+                    "meditation_sessions", 1, ["mindfulness"], 10, "mindfulness"),
+    AchievementRule("mindful_300", "Still Mind", "Meditate for 300 minutes in total",
+                    "meditation_minutes", 300, ["mindfulness"], 150, "mindfulness", "rare"),
+    AchievementRule("momentum_10", "Momentum Maker", "Turn 10 five-minute starts into momentum",
+                    "momentum_sessions", 10, ["five_minute_rule"], 75, "five_minute_rule", "rare"),
+    AchievementRule("active_10", "On the Move", "Log 10 physical activity sessions",
+                    "activity_sessions", 10, ["physical_activity"], 50, "physical_activity"),
+    AchievementRule("sleep_log_7", "Sleep Tracker", "Log sleep for 7 nights",
+                    "sleep_nights", 7, ["sleep_circadian"], 30, "sleep_circadian"),
+    AchievementRule("well_rested_7", "Well Rested", "Have 7 nights of high-quality sleep",
+                    "good_sleep_nights", 7, ["sleep_circadian"], 75, "sleep_circadian", "rare"),
+    AchievementRule("first_thought_record", "Thought Detective", "Complete your first thought record",
+                    "thought_records", 1, ["cbt"], 10, "cbt"),
+    AchievementRule("thought_records_25", "Cognitive Reframer", "Complete 25 thought records",
+                    "thought_records", 25, ["cbt"], 150, "cbt", "rare"),
+    AchievementRule("streak_3", "Warming Up", "Stay active 3 days in a row",
+                    "longest_streak", 3, ACTIVITY_EVENTS, 25, "streak"),
+    AchievementRule("streak_7", "Week Warrior", "Stay active 7 days in a row",
+                    "longest_streak", 7, ACTIVITY_EVENTS, 75, "streak", "rare"),
+    AchievementRule("streak_30", "Unstoppable", "Stay active 30 days in a row",
+                    "longest_streak", 30, ACTIVITY_EVENTS, 400, "streak", "legendary"),
+    AchievementRule("coins_100", "Coin Collector", "Earn 100 coins",
+                    "coins_earned", 100, ["coins"], 50, "store", "rare"),
+]
+
+
+class AchievementEngine:
+    """Dispatches activity events to the rules indexed for them
+
+    ``award_points`` is called with the user and points of each unlock.
+    Seeding counters from history reads bucketed sessions through
+    ``storage`` (a ``SessionStorage``) and archived records through
+    ``archive`` (``ColdStorage``) when given.
+    """
+
+    def __init__(self, db, award_points: Callable[[str, int], Awaitable[Any]],
+                 rules: Optional[List[AchievementRule]] = None, storage=None, archive=None):
+        self.db = db
+        self.award_points = award_points
+        self.storage = storage
+        self.archive = archive
+        self.rules = list(rules if rules is not None else DEFAULT_RULES)
+        self.index: Dict[str, List[AchievementRule]] = defaultdict(list)
+        for rule in self.rules:
+            for event in rule.events:
+                self.index[event].append(rule)
+
+    @property
+    def counters(self):
+        return self.db[COUNTERS_COLLECTION]
+
+    async def ensure_indexes(self):
+        await self.counters.create_index("user_id", unique=True)
+
+    async def dispatch(self, user_id: str, event: str, doc: Dict[str, Any],
+                       progress: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Update counters for an event and award any rules it satisfies
+
+        ``progress`` is the user_progress document after the write, used for
+        streak and level rules. Returns the newly awarded achievements.
+        """
+        update: Dict[str, Any] = {"$inc": EVENT_SOURCES[event].extract(doc)}
+        if progress:
+            maxed = {name: progress[name] for name in PROGRESS_COUNTERS if name in progress}
+            if maxed:
+                update["$max"] = maxed
+        counters = await self.counters.find_one_and_update(
+            {"user_id": user_id}, update, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        if not counters.get("seeded"):
+            counters = await self.seed(user_id, progress)
+        return await self._award_matching(user_id, counters, self.index.get(event, ()))
+
+    async def reseed(self, user_id: str, progress: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Recount a user's counters from history and award every rule they now satisfy
+
+        For history written without going through ``dispatch``, such as a bulk
+        import. Returns the newly awarded achievements.
+        """
+        counters = await self.seed(user_id, progress)
+        return await self._award_matching(user_id, counters, self.rules)
+
+    async def _award_matching(self, user_id: str, counters: Dict[str, Any],
+                              rules: Iterable[AchievementRule]) -> List[Dict[str, Any]]:
+        unlocked = set(counters.get("unlocked", []))
+        awarded = []
+        for rule in rules:
+            if rule.id not in unlocked and rule.matches(counters):
+                achievement = await self._award(user_id, rule)
+                if achievement:
+                    awarded.append(achievement)
+        return awarded
+
+    async def _award(self, user_id: str, rule: AchievementRule) -> Optional[Dict[str, Any]]:
+        # Claim the rule first so concurrent events cannot award it twice
+        result = await self.counters.update_one(
+            {"user_id": user_id, "unlocked": {"$ne": rule.id}},
+            {"$addToSet": {"unlocked": rule.id}},
+        )
+        if result.modified_count != 1:
+            return None
+        achievement = rule.to_achievement(user_id)
+        await self.db.achievements.insert_one(dict(achievement))
+        await self.award_points(user_id, rule.points)
+        return achievement
+
+    async def seed(self, user_id: str, progress: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Initialise a user's counters from history the first time they are used"""
+        # Store collections such as coin_transactions reference users by their _id
+        user_ids: List[Any] = [user_id]
+        user = await self.db.users.find_one({"id": user_id}, {"_id": 1})
+        if user:
+            user_ids.append(user["_id"])
+
+        async def totals(source: EventSource) -> Dict[str, Any]:
+            query = {source.match_field: {"$in": user_ids}}
+            group = [{"$group": {"_id": None, **source.seed}}]
+            if self.storage and self.storage.manages(source.collection):
+                cursors = self.storage.aggregate(source.collection, query, group)
+            else:
+                cursors = [self.db[source.collection].aggregate([{"$match": query}, *group])]
+            # Seed accumulators are all sums, so totals from several places add up
+            counters: Dict[str, Any] = {}
+            for cursor in cursors:
+                for row in await cursor.to_list(1):
+                    row.pop("_id")
+                    for name, value in row.items():
+                        counters[name] = counters.get(name, 0) + value
+            if self.archive and self.archive.manages(source.collection):
+                for archived_id in user_ids:
+                    async for doc in self.archive.iter_records(source.collection, archived_id):
+                        for name, value in source.extract(doc).items():
+                            counters[name] = counters.get(name, 0) + value
+            return counters
+
+        results = await asyncio.gather(*(totals(source) for source in EVENT_SOURCES.values()))
+        counters: Dict[str, Any] = {"seeded": True}
+        for result in results:
+            counters.update(result)
+        if progress:
+            counters.update({name: progress[name] for name in PROGRESS_COUNTERS if name in progress})
+
+        # Achievements already on record (client-awarded or earlier rules)
+        existing = await self.db.achievements.distinct("achievement_type", {"user_id": user_id})
+        rule_ids = {rule.id for rule in self.rules}
+        update: Dict[str, Any] = {"$set": counters}
+        already = [rule_id for rule_id in existing if rule_id in rule_ids]
+        if already:
+            update["$addToSet"] = {"unlocked": {"$each": already}}
+        return await self.counters.find_one_and_update(
+            {"user_id": user_id}, update, upsert=True, return_document=ReturnDocument.AFTER
+        )
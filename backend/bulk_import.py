@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Bulk import of historical records from NDJSON or CSV.
+
+Input is streamed line by line and cut into batches. Each batch is validated
+against the collection's pydantic model in one call (a ``TypeAdapter`` over
+the whole list, so the per-row loop runs inside pydantic-core), rows that
+fail are reported with their errors, ids already present in the file or in
+Mongo are skipped, and the rest go out with one unordered ``insert_many``;
+the unique index on ``id`` turns away any that a concurrent import inserted
+in between. The insert of one batch overlaps with parsing and validating the
+next. Afterwards ``refresh`` recomputes what the app derives from history
+(insight features, progress, achievements, leaderboard scores) for the
+imported users; the API does that in the background once the response is
+sent.
+
+    python bulk_import.py sleep_data history.csv --format csv
+    python bulk_import.py pomodoro_sessions sessions.ndjson --batch-size 2000
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Type
+
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from pymongo.errors import BulkWriteError, OperationFailure
+
+from session_storage import create_index
+
+logger = logging.getLogger(__name__)
+
+MAX_REPORTED_REJECTIONS = 1000
+DUPLICATE_KEY = 11000
+
+
+# ===============================
+# PARSING
+# ===============================
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Split a byte stream into decoded lines without holding more than one chunk"""
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8").rstrip("\r")
+    if pending:
+        yield pending.decode("utf-8").rstrip("\r")
+
+
+async def ndjson_rows(lines: AsyncIterator[str]) -> AsyncIterator[Any]:
+    """Parsed objects; a line that is not valid JSON is passed on as an error string"""
+    async for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            yield f"invalid JSON: {e}"
+
+
+def _csv_value(value: str) -> Any:
+    # Lists and dicts (distractions, caffeine_intake, ...) are written as JSON cells
+    if value[:1] in ("[", "{"):
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            pass
+    return value
+
+
+async def csv_rows(lines: AsyncIterator[str]) -> AsyncIterator[Any]:
+    """Rows as dicts keyed by the header; empty cells are left out so model defaults apply"""
+    header: Optional[List[str]] = None
+    record = ""
+    async for line in lines:
+        record = f"{record}\n{line}" if record else line
+        # An odd number of quotes means a quoted cell continues on the next line
+        if record.count('"') % 2:
+            continue
+        if not record.strip():
+            record = ""
+            continue
+        cells = next(csv.reader([record]))
+        record = ""
+        if header is None:
+            header = cells
+            continue
+        if len(cells) != len(header):
+            yield f"expected {len(header)} cells, got {len(cells)}"
+            continue
+        yield {key: _csv_value(value) for key, value in zip(header, cells) if value != ""}
+
+
+# ===============================
+# IMPORTER
+# ===============================
+
+class ImportReport:
+    def __init__(self, collection: str):
+        self.collection = collection
+        self.rows = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.rejections: List[Dict[str, Any]] = []
+        self.batches: List[Dict[str, Any]] = []
+        self.batch_count = 0
+        self.user_ids = set()
+        self.started = time.perf_counter()
+
+    def reject(self, row_number: int, errors: Any):
+        self.rejected += 1
+        if len(self.rejections) < MAX_REPORTED_REJECTIONS:
+            self.rejections.append({"row": row_number, "errors": errors})
+
+    def to_dict(self) -> Dict[str, Any]:
+        seconds = time.perf_counter() - self.started
+        return {
+            "collection": self.collection,
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(self.rows / seconds, 1) if seconds else None,
+            "batches": self.batches,
+            "rejections": self.rejections,
+            "rejections_truncated": self.rejected > len(self.rejections),
+            "users": len(self.user_ids),
+        }
+
+
+def _errors(error: Dict[str, Any]) -> Dict[str, Any]:
+    return {"field": ".".join(str(part) for part in error["loc"][1:]), "message": error["msg"]}
+
+
+class BulkImporter:
+    """Validated, deduplicated batch inserts into the module collections
+
+    ``models`` maps each importable collection to its pydantic model and
+    ``prepare`` optionally maps a collection to a function applied to each
+    validated document before it is stored (to match the create routes),
+    ``storage`` writes the session collections in their configured layout, and
+    ``on_import`` is called by ``refresh`` with the collection and the users
+    whose history an import added to, to bring the state derived from it up
+    to date.
+    """
+
+    def __init__(self, db, models: Dict[str, Type[BaseModel]],
+                 prepare: Optional[Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]]] = None,
+                 batch_size: int = 1000, storage=None,
+                 on_import: Optional[Callable[[str, List[str]], Awaitable[Any]]] = None):
+        self.db = db
+        self.storage = storage
+        self.on_import = on_import
+        self.models = models
+        self.prepare = prepare or {}
+        self.batch_size = batch_size
+        self._adapters = {name: TypeAdapter(List[model]) for name, model in models.items()}
+
+    async def ensure_indexes(self):
+        """A unique index on ``id``, so concurrent imports cannot both insert a record
+
+        Time-series collections cannot have unique indexes and bucketed ones
+        are views; imports into those are deduplicated by lookup only, as is
+        a collection that already holds duplicate ids.
+        """
+        for collection in self.models:
+            if self.storage and self.storage.manages(collection) and self.storage.mode == "timeseries":
+                await create_index(self.db[collection], "id")
+                continue
+            try:
+                await create_index(self.db[collection], "id", unique=True)
+            except OperationFailure as e:
+                if e.code != DUPLICATE_KEY:
+                    raise
+                logger.warning(f"{collection} holds duplicate ids; imports into it are deduplicated by lookup only")
+                await create_index(self.db[collection], "id")
+
+    def validate(self, collection: str, rows: List[Any], first_row: int, report: ImportReport) -> List[BaseModel]:
+        """Validate a whole batch at once, dropping and reporting the rows that fail"""
+        candidates = []
+        for offset, row in enumerate(rows):
+            if isinstance(row, dict):
+                candidates.append((first_row + offset, row))
+            else:
+                report.reject(first_row + offset, [{"field": "", "message": str(row)}])
+        adapter = self._adapters[collection]
+        try:
+            return adapter.validate_python([row for _, row in candidates])
+        except ValidationError as e:
+            failures: Dict[int, List[Dict[str, Any]]] = {}
+            for error in e.errors():
+                failures.setdefault(error["loc"][0], []).append(_errors(error))
+        for index, errors in failures.items():
+            report.reject(candidates[index][0], errors)
+        valid = [row for index, (_, row) in enumerate(candidates) if index not in failures]
+        return adapter.validate_python(valid)
+
+    async def _write(self, collection: str, documents: List[Dict[str, Any]], stats: Dict[str, Any],
+                     report: ImportReport, started: float):
+        inserted = 0
+        if documents:
+            try:
+                if self.storage and self.storage.manages(collection):
+                    inserted = await self.storage.insert_many(collection, documents)
+                else:
+                    result = await self.db[collection].insert_many(documents, ordered=False)
+                    inserted = len(result.inserted_ids)
+            except BulkWriteError as e:
+                inserted = e.details.get("nInserted", 0)
+                duplicates = sum(1 for error in e.details.get("writeErrors", []) if error.get("code") == DUPLICATE_KEY)
+                report.duplicates += duplicates
+                stats["duplicates"] += duplicates
+        report.inserted += inserted
+        seconds = time.perf_counter() - started
+        stats.update({
+            "inserted": inserted,
+            "seconds": round(seconds, 4),
+            "rows_per_second": round(stats["rows"] / seconds, 1) if seconds else None,
+        })
+        report.batches.append(stats)
+
+    async def _process(self, collection: str, rows: List[Any], first_row: int, seen: set,
+                       report: ImportReport) -> Optional[asyncio.Task]:
+        started = time.perf_counter()
+        rejected_before = report.rejected
+        models = self.validate(collection, rows, first_row, report)
+
+        documents = []
+        duplicates = 0
+        for model in models:
+            if model.id in seen:
+                duplicates += 1
+                continue
+            seen.add(model.id)
+            documents.append(model.dict())
+        if documents:
+            query: Dict[str, Any] = {"id": {"$in": [document["id"] for document in documents]}}
+            if self.storage and self.storage.manages(collection):
+                # Bucketed sessions are only reachable through their users' buckets
+                query["user_id"] = {"$in": list({document["user_id"] for document in documents})}
+                existing = await self.storage.distinct(collection, "id", query)
+            else:
+                existing = await self.db[collection].distinct("id", query)
+            if existing:
+                existing = set(existing)
+                duplicates += sum(1 for document in documents if document["id"] in existing)
+                documents = [document for document in documents if document["id"] not in existing]
+        prepare = self.prepare.get(collection)
+        if prepare:
+            documents = [prepare(document) for document in documents]
+        report.user_ids.update(document["user_id"] for document in documents if "user_id" in document)
+        report.duplicates += duplicates
+
+        report.batch_count += 1
+        stats = {
+            "batch": report.batch_count,
+            "rows": len(rows),
+            "rejected": report.rejected - rejected_before,
+            "duplicates": duplicates,
+            "validate_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+        return asyncio.create_task(self._write(collection, documents, stats, report, started))
+
+    async def import_rows(self, collection: str, rows: AsyncIterator[Any]) -> ImportReport:
+        """Import parsed rows (dicts, or error strings from the parser) into ``collection``"""
+        if collection not in self.models:
+            raise ValueError(f"Collection {collection} cannot be imported")
+        report = ImportReport(collection)
+        seen: set = set()
+        batch: List[Any] = []
+        writing: Optional[asyncio.Task] = None
+        first_row = 1
+        try:
+            async for row in rows:
+                batch.append(row)
+                report.rows += 1
+                if len(batch) >= self.batch_size:
+                    task = await self._process(collection, batch, first_row, seen, report)
+                    if writing:
+                        await writing
+                    writing = task
+                    first_row += len(batch)
+                    batch = []
+            if batch:
+                task = await self._process(collection, batch, first_row, seen, report)
+                if writing:
+                    await writing
+                writing = task
+        finally:
+            # Also when reading or validating fails, so the batch in flight is not left running unobserved
+            if writing:
+                await writing
+        return report
+
+    async def import_stream(self, collection: str, chunks: AsyncIterator[bytes], fmt: str = "ndjson") -> ImportReport:
+        if fmt == "ndjson":
+            rows = ndjson_rows(iter_lines(chunks))
+        elif fmt == "csv":
+            rows = csv_rows(iter_lines(chunks))
+        else:
+            raise ValueError(f"Unknown import format: {fmt}")
+        return await self.import_rows(collection, rows)
+
+    async def refresh(self, report: ImportReport):
+        """Run ``on_import`` for the users an import added records for"""
+        if self.on_import and report.inserted and report.user_ids:
+            await self.on_import(report.collection, sorted(report.user_ids))
+
+
+async def _file_chunks(path: Path, size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+    with open(path, "rb") as source:
+        while True:
+            chunk = source.read(size)
+            if not chunk:
+                break
+            yield chunk
+
+
+async def _main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("collection")
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--format", choices=["ndjson", "csv"], help="default: from the file extension")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    fmt = args.format or ("csv" if args.path.suffix == ".csv" else "ndjson")
+
+    # The models and storage conventions live with the app
+    import server
+
+    importer = BulkImporter(server.db, server.IMPORT_MODELS, server.IMPORT_PREPARE, batch_size=args.batch_size,
+                            storage=server.session_storage, on_import=server.refresh_imported_history)
+    try:
+        await server.session_storage.ensure_layout()
+        await importer.ensure_indexes()
+        report = await importer.import_stream(args.collection, _file_chunks(args.path), fmt)
+        await importer.refresh(report)
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        server.client.close()
+    for batch in report.batches:
+        print(
+            f"batch {batch['batch']}: {batch['rows']} rows, {batch['inserted']} inserted, "
+            f"{batch['duplicates']} duplicates, {batch['rejected']} rejected, {batch['rows_per_second']} rows/s"
+        )
+    summary = report.to_dict()
+    print(
+        f"Imported {summary['inserted']} of {summary['rows']} rows into {args.collection} "
+        f"in {summary['seconds']}s ({summary['rows_per_second']} rows/s); "
+        f"{summary['duplicates']} duplicates, {summary['rejected']} rejected"
+    )
+    for rejection in report.rejections[:20]:
+        print(f"  row {rejection['row']}: {json.dumps(rejection['errors'])}")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
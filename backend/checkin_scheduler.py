@@ -0,0 +1,389 @@
+"""
+Reminders for accountability check-ins, fired from a timer wheel.
+
+Two kinds of reminders are scheduled, both a configurable lead time before
+the check-in:
+
+* one-off ``CheckInSession`` documents, by ``scheduled_time``
+* recurring partnership schedules from ``check_in_schedule``, e.g.
+  ``{"time": "18:30", "days": ["mon", "thu"], "utc_offset_minutes": 60}``
+
+Work is split into a fixed number of shards by a hash of the owning user id
+(stored on each document as ``reminder_shard``). Workers hold shards under
+renewable leases in ``scheduler_shards`` and balance them by the number of
+live workers. Each shard keeps a cursor, the latest reminder deadline it has
+fired, so a worker that takes over a shard after a restart resumes from there
+instead of refiring or silently skipping reminders. Upcoming work is loaded
+into the wheel with indexed range queries, never by polling for due items.
+"""
+
+import asyncio
+import logging
+import math
+import random
+import time
+import uuid
+import zlib
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from timer_wheel import TimerWheel
+
+logger = logging.getLogger(__name__)
+
+SHARDS_COLLECTION = "scheduler_shards"
+WORKERS_COLLECTION = "scheduler_workers"
+SHARD_FIELD = "reminder_shard"
+
+WEEKDAYS = {"mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6}
+
+
+def shard_of(user_id: str, shards: int) -> int:
+    return zlib.crc32(str(user_id).encode()) % shards
+
+
+def _epoch(value: datetime) -> float:
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _utc(seconds: float) -> datetime:
+    return datetime.utcfromtimestamp(seconds)
+
+
+def next_occurrence(schedule: Dict[str, Any], after: float) -> Optional[float]:
+    """Epoch time of the next check-in in a recurring schedule strictly after ``after``
+
+    Schedules without a usable ``time`` have no reminders.
+    """
+    try:
+        hour, minute = (int(part) for part in str(schedule["time"]).split(":")[:2])
+        offset = timedelta(minutes=int(schedule.get("utc_offset_minutes", 0)))
+        days = schedule.get("days")
+        if days:
+            weekdays = {day if isinstance(day, int) else WEEKDAYS[str(day).lower()[:3]] for day in days}
+        else:
+            weekdays = set(range(7))
+    except (KeyError, ValueError, TypeError):
+        return None
+
+    local = _utc(after) + offset
+    for days_ahead in range(8):
+        day = local.date() + timedelta(days=days_ahead)
+        if day.weekday() in weekdays:
+            occurrence = _epoch(datetime(day.year, day.month, day.day, hour, minute) - offset)
+            if occurrence > after:
+                return occurrence
+    return None
+
+
+class CheckInScheduler:
+    def __init__(self, db, on_reminder: Callable[[Dict[str, Any]], Awaitable[Any]], shards: int = 64,
+                 lead: float = 600.0, horizon: float = 3600.0, refresh_interval: float = 60.0,
+                 lease_ttl: float = 30.0, max_catchup: float = 3600.0, tick: float = 1.0):
+        self.db = db
+        self.on_reminder = on_reminder
+        self.shards = shards
+        self.lead = lead
+        self.horizon = horizon
+        self.refresh_interval = refresh_interval
+        self.lease_ttl = lease_ttl
+        self.max_catchup = max_catchup
+        self.worker_id = str(uuid.uuid4())
+        self.wheel = TimerWheel(tick=tick)
+        self.owned: Set[int] = set()
+        self.cursors: Dict[int, float] = {}
+        self.loaded_until = 0.0
+        self.last_refresh = 0.0
+        self.live_workers = 1
+        self._tasks: List[asyncio.Task] = []
+
+        self.fired = 0
+        self.skipped = 0
+        self.failed = 0
+        self.lateness = deque(maxlen=1000)
+        self.last_refresh_ms = 0.0
+
+    @property
+    def leases(self):
+        return self.db[SHARDS_COLLECTION]
+
+    @property
+    def workers(self):
+        return self.db[WORKERS_COLLECTION]
+
+    def shard_of(self, user_id: str) -> int:
+        return shard_of(user_id, self.shards)
+
+    async def ensure_indexes(self):
+        await self.db.check_in_sessions.create_index([(SHARD_FIELD, 1), ("completed", 1), ("scheduled_time", 1)])
+        await self.db.check_in_sessions.create_index([(SHARD_FIELD, 1), ("_id", 1)])
+        await self.db.accountability_partners.create_index([(SHARD_FIELD, 1), ("active", 1)])
+        await self.workers.create_index("expires")
+
+    async def assign_shards(self, batch_size: int = 500):
+        """Stamp ``reminder_shard`` on documents written before the scheduler existed"""
+        for collection, user_field in (("check_in_sessions", "initiator_id"), ("accountability_partners", "user_id")):
+            operations = []
+            cursor = self.db[collection].find({SHARD_FIELD: {"$exists": False}}, {"_id": 1, user_field: 1})
+            async for doc in cursor:
+                operations.append(UpdateOne(
+                    {"_id": doc["_id"]}, {"$set": {SHARD_FIELD: self.shard_of(doc.get(user_field, ""))}}
+                ))
+                if len(operations) >= batch_size:
+                    await self.db[collection].bulk_write(operations, ordered=False)
+                    operations = []
+            if operations:
+                await self.db[collection].bulk_write(operations, ordered=False)
+
+    # ---- shard leases ----
+
+    async def rebalance(self):
+        """Renew leases, then take or give back shards toward an even split"""
+        now = time.time()
+        await self.workers.update_one(
+            {"_id": self.worker_id}, {"$set": {"expires": now + self.lease_ttl}}, upsert=True
+        )
+        self.live_workers = max(await self.workers.count_documents({"expires": {"$gt": now}}), 1)
+        target = math.ceil(self.shards / self.live_workers)
+
+        await self.persist_cursors(now + self.lease_ttl)
+        still_owned = {doc["_id"] async for doc in self.leases.find({"owner": self.worker_id}, {"_id": 1})}
+        for shard in self.owned - still_owned:
+            self._release_local(shard)
+
+        for shard in sorted(self.owned)[target:]:
+            await self.leases.update_one(
+                {"_id": shard, "owner": self.worker_id}, {"$set": {"owner": None, "lease_until": 0}}
+            )
+            self._release_local(shard)
+
+        claimed = []
+        candidates = [shard for shard in range(self.shards) if shard not in self.owned]
+        random.shuffle(candidates)
+        for shard in candidates:
+            if len(self.owned) >= target:
+                break
+            doc = await self.leases.find_one_and_update(
+                {"_id": shard, "$or": [{"owner": None}, {"lease_until": {"$lt": now}}]},
+                {"$set": {"owner": self.worker_id, "lease_until": now + self.lease_ttl}},
+            )
+            if doc is not None:
+                self.owned.add(shard)
+                self.cursors[shard] = doc.get("cursor") or now
+                claimed.append(shard)
+        if claimed:
+            await self.load(claimed, self.cursors)
+
+    async def persist_cursors(self, lease_until: float):
+        if not self.owned:
+            return
+        await self.leases.bulk_write([
+            UpdateOne(
+                {"_id": shard, "owner": self.worker_id},
+                {"$set": {"lease_until": lease_until, "cursor": self.cursors[shard]}},
+            )
+            for shard in self.owned
+        ], ordered=False)
+
+    def _release_local(self, shard: int):
+        self.owned.discard(shard)
+        self.cursors.pop(shard, None)
+        # Timers of released shards are skipped when they fire
+
+    # ---- loading ----
+
+    def _schedule_check_in(self, doc: Dict[str, Any]):
+        deadline = _epoch(doc["scheduled_time"]) - self.lead
+        if deadline > self.cursors.get(doc[SHARD_FIELD], math.inf):
+            self.wheel.schedule(("check_in", doc["id"]), deadline, doc[SHARD_FIELD])
+
+    def _schedule_recurring(self, doc: Dict[str, Any], after: float):
+        occurrence = next_occurrence(doc.get("check_in_schedule") or {}, after + self.lead)
+        if occurrence is not None:
+            self.wheel.schedule(("recurring", doc["id"]), occurrence - self.lead, doc[SHARD_FIELD])
+
+    async def load(self, shards: Iterable[int], since: Dict[int, float]):
+        """Schedule reminders after each shard's cursor, up to the loaded horizon"""
+        shards = list(shards)
+        now = time.time()
+        self.loaded_until = max(self.loaded_until, now + self.horizon)
+        oldest = min(since[shard] for shard in shards)
+        start = max(oldest, now - self.max_catchup)
+        check_ins = self.db.check_in_sessions.find(
+            {
+                SHARD_FIELD: {"$in": shards},
+                "completed": False,
+                "scheduled_time": {"$gt": _utc(start + self.lead), "$lte": _utc(self.loaded_until + self.lead)},
+            },
+            {"_id": 0, "id": 1, "scheduled_time": 1, SHARD_FIELD: 1},
+        )
+        async for doc in check_ins:
+            self._schedule_check_in(doc)
+        partnerships = self.db.accountability_partners.find(
+            {SHARD_FIELD: {"$in": shards}, "active": True},
+            {"_id": 0, "id": 1, "check_in_schedule": 1, SHARD_FIELD: 1},
+        )
+        async for doc in partnerships:
+            self._schedule_recurring(doc, max(since[doc[SHARD_FIELD]], now - self.max_catchup))
+
+    async def refresh(self):
+        """Extend the horizon and pick up check-ins created on other workers"""
+        if not self.owned:
+            return
+        started = time.perf_counter()
+        now = time.time()
+        shards = list(self.owned)
+        previous_until = self.loaded_until
+        self.loaded_until = now + self.horizon
+        created_since = ObjectId.from_datetime(_utc(self.last_refresh - self.refresh_interval))
+        check_ins = self.db.check_in_sessions.find(
+            {
+                SHARD_FIELD: {"$in": shards},
+                "completed": False,
+                "$or": [
+                    {"scheduled_time": {"$gt": _utc(previous_until + self.lead),
+                                        "$lte": _utc(self.loaded_until + self.lead)}},
+                    {"_id": {"$gte": created_since},
+                     "scheduled_time": {"$lte": _utc(self.loaded_until + self.lead)}},
+                ],
+            },
+            {"_id": 0, "id": 1, "scheduled_time": 1, SHARD_FIELD: 1},
+        )
+        async for doc in check_ins:
+            self._schedule_check_in(doc)
+        partnerships = self.db.accountability_partners.find(
+            {SHARD_FIELD: {"$in": shards}, "active": True, "_id": {"$gte": created_since}},
+            {"_id": 0, "id": 1, "check_in_schedule": 1, SHARD_FIELD: 1},
+        )
+        async for doc in partnerships:
+            if ("recurring", doc["id"]) not in self.wheel:
+                self._schedule_recurring(doc, now)
+        self.last_refresh = now
+        self.last_refresh_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    # ---- write hooks ----
+
+    def stamp(self, doc: Dict[str, Any], user_id: str) -> Dict[str, Any]:
+        """Add the shard field to a document before it is inserted"""
+        doc[SHARD_FIELD] = self.shard_of(user_id)
+        return doc
+
+    def check_in_created(self, doc: Dict[str, Any]):
+        if doc[SHARD_FIELD] in self.owned and _epoch(doc["scheduled_time"]) - self.lead <= self.loaded_until:
+            self._schedule_check_in(doc)
+
+    def partnership_created(self, doc: Dict[str, Any]):
+        if doc[SHARD_FIELD] in self.owned:
+            self._schedule_recurring(doc, time.time())
+
+    # ---- firing ----
+
+    async def _fire(self, key, deadline: float, shard: int):
+        if shard not in self.owned:
+            return
+        kind, doc_id = key
+        if kind == "check_in":
+            doc = await self.db.check_in_sessions.find_one(
+                {"id": doc_id, "completed": False}, {"_id": 0, "partnership_id": 1, "scheduled_time": 1}
+            )
+            reminder = doc and {
+                "kind": kind, "check_in_id": doc_id,
+                "partnership_id": doc["partnership_id"], "scheduled_time": doc["scheduled_time"],
+            }
+        else:
+            doc = await self.db.accountability_partners.find_one(
+                {"id": doc_id, "active": True}, {"_id": 0, "id": 1, "check_in_schedule": 1, SHARD_FIELD: 1}
+            )
+            reminder = doc and {
+                "kind": kind, "partnership_id": doc_id, "scheduled_time": _utc(deadline + self.lead),
+            }
+            if doc:
+                self._schedule_recurring(doc, deadline + self.lead)
+        if reminder:
+            lateness = time.time() - deadline
+            self.lateness.append(lateness)
+            try:
+                await self.on_reminder({**reminder, "lateness_seconds": round(lateness, 3)})
+                self.fired += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Check-in reminder {key!r} failed: {e}")
+        else:
+            self.skipped += 1
+        if shard in self.cursors:
+            self.cursors[shard] = max(self.cursors[shard], deadline)
+
+    # ---- lifecycle ----
+
+    async def _lease_loop(self):
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            try:
+                await self.rebalance()
+            except Exception as e:
+                logger.error(f"Scheduler rebalance failed: {e}")
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Scheduler refresh failed: {e}")
+
+    async def start(self):
+        try:
+            await self.leases.insert_many(
+                [{"_id": shard, "owner": None, "lease_until": 0, "cursor": None} for shard in range(self.shards)],
+                ordered=False,
+            )
+        except BulkWriteError:
+            pass  # shard documents already created by another worker
+        await self.assign_shards()
+        self.last_refresh = time.time()
+        await self.rebalance()
+        self._tasks = [
+            asyncio.create_task(self.wheel.run(self._fire)),
+            asyncio.create_task(self._lease_loop()),
+            asyncio.create_task(self._refresh_loop()),
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        # Hand the shards back so another worker picks them up without waiting for the lease
+        if self.owned:
+            await self.persist_cursors(0)
+            await self.leases.update_many({"owner": self.worker_id}, {"$set": {"owner": None}})
+        await self.workers.delete_one({"_id": self.worker_id})
+
+    def stats(self) -> Dict[str, Any]:
+        lateness = sorted(self.lateness)
+
+        def percentile(p: float) -> Optional[float]:
+            if not lateness:
+                return None
+            return round(lateness[min(len(lateness) - 1, int(p * len(lateness)))], 4)
+
+        return {
+            "worker_id": self.worker_id,
+            "live_workers": self.live_workers,
+            "shards": self.shards,
+            "owned_shards": sorted(self.owned),
+            "timers": len(self.wheel),
+            "fired": self.fired,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "lateness_p50_seconds": percentile(0.5),
+            "lateness_p95_seconds": percentile(0.95),
+            "lateness_max_seconds": round(lateness[-1], 4) if lateness else None,
+            "tick_lag_seconds": round(self.wheel.last_lag, 4),
+            "tick_lag_max_seconds": round(self.wheel.max_lag, 4),
+            "last_refresh_ms": self.last_refresh_ms,
+        }
@@ -0,0 +1,187 @@
+"""
+Deadline-aware circuit breaker for slow or failing downstream calls.
+
+Used around the LLM so that insight requests never wait on a provider that is
+already timing out: each call gets a deadline, outcomes are tracked over a
+rolling window, and when the failure rate trips the breaker callers are
+short-circuited straight to their local fallback until a probe succeeds.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+# Default slow-call threshold as a fraction of the deadline; calls past the
+# deadline itself are already timeouts
+SLOW_CALL_FRACTION = 0.75
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the breaker is open"""
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        deadline: float = 8.0,
+        window: int = 20,
+        min_calls: int = 5,
+        failure_rate: float = 0.5,
+        slow_call_seconds: Optional[float] = None,
+        cooldown: float = 30.0,
+    ):
+        self.name = name
+        self.deadline = deadline
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        # Calls that succeed but take longer than this still count as failures
+        self.slow_call_seconds = deadline * SLOW_CALL_FRACTION if slow_call_seconds is None else slow_call_seconds
+        self.cooldown = cooldown
+
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._outcomes = deque(maxlen=window)  # (ok, latency)
+
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.slow_calls = 0
+        self.rejections = 0
+        self.fallbacks = 0
+        self.times_opened = 0
+
+    # ---- state machine ----
+
+    def _allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+
+    def _record(self, ok: bool, latency: float):
+        self._outcomes.append((ok, latency))
+        if self.state == HALF_OPEN:
+            self._probe_in_flight = False
+            if ok:
+                self.state = CLOSED
+                self._outcomes.clear()
+            else:
+                self._open()
+            return
+        if self.state == CLOSED and len(self._outcomes) >= self.min_calls:
+            failed = sum(1 for outcome_ok, _ in self._outcomes if not outcome_ok)
+            if failed / len(self._outcomes) >= self.failure_rate:
+                self._open()
+
+    # ---- calls ----
+
+    async def call(self, func: Callable[[], Awaitable[Any]], deadline: Optional[float] = None) -> Any:
+        """Run ``func`` under the breaker and deadline
+
+        Raises ``CircuitOpenError`` when short-circuited, ``asyncio.TimeoutError``
+        past the deadline, or whatever ``func`` raised.
+        """
+        if not self._allow():
+            self.rejections += 1
+            raise CircuitOpenError(f"{self.name} circuit is open")
+
+        self.calls += 1
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(func(), timeout=deadline or self.deadline)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self.failures += 1
+            self._record(False, time.monotonic() - started)
+            raise
+        except Exception:
+            self.failures += 1
+            self._record(False, time.monotonic() - started)
+            raise
+        except BaseException:
+            # Cancelled by the caller; do not count it against the downstream
+            if self.state == HALF_OPEN:
+                self._probe_in_flight = False
+            raise
+
+        latency = time.monotonic() - started
+        ok = latency <= self.slow_call_seconds
+        if ok:
+            self.successes += 1
+        else:
+            self.slow_calls += 1
+            self.failures += 1
+        self._record(ok, latency)
+        return result
+
+    async def call_with_fallback(
+        self,
+        func: Callable[[], Awaitable[Any]],
+        fallback: Callable[[], Any],
+        deadline: Optional[float] = None,
+    ) -> Tuple[Any, bool]:
+        """Run ``func``, serving ``fallback()`` instead on rejection, timeout or error
+
+        Returns ``(result, used_fallback)``.
+        """
+        try:
+            return await self.call(func, deadline), False
+        except Exception as e:
+            logger.warning(f"{self.name} call served from fallback: {e!r}")
+            self.fallbacks += 1
+            return fallback(), True
+
+    # ---- metrics ----
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = sorted(latency for _, latency in self._outcomes)
+        requests = self.calls + self.rejections
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 4)
+
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+            state = HALF_OPEN  # the next call will be let through as a probe
+        else:
+            state = self.state
+        return {
+            "name": self.name,
+            "state": state,
+            "deadline_seconds": self.deadline,
+            "calls": self.calls,
+            "successes": self.successes,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "slow_calls": self.slow_calls,
+            "slow_call_seconds": self.slow_call_seconds,
+            "rejections": self.rejections,
+            "fallbacks": self.fallbacks,
+            "fallback_rate": round(self.fallbacks / requests, 4) if requests else 0.0,
+            "times_opened": self.times_opened,
+            "window_failure_rate": round(
+                sum(1 for ok, _ in self._outcomes if not ok) / len(self._outcomes), 4
+            ) if self._outcomes else 0.0,
+            "latency_p50_seconds": percentile(0.5),
+            "latency_p95_seconds": percentile(0.95),
+        }
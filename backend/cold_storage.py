@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Hot/cold tiering of old sessions and coin transactions.
+
+Records older than the hot horizon are moved, per user and collection and in
+time order, into compressed archive documents in ``cold_archives`` (zstd when
+the ``zstandard`` package is installed, zlib otherwise). Each archive holds a
+contiguous run of up to ``chunk_size`` records together with its first and
+last timestamp, so a range read only decompresses the archives it overlaps.
+
+Rollups (``user_features``, ``user_progress``, achievement counters and
+leaderboards) are maintained incrementally and are never touched here;
+``FeatureStore.rebuild``, ``ProgressEngine.backfill`` and
+``AchievementEngine.seed`` read archives as well as the hot collection, so
+they see the whole history. History routes and the timeline fall through to
+the archives once a page reaches past the hot horizon.
+
+Archiving is idempotent: an archive is written under an id derived from its
+first record before the records are deleted from the hot collection, so a
+run interrupted in between rewrites the same archive next time.
+
+    python cold_storage.py run [--hot-days 180]
+    python cold_storage.py status
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import uuid
+import zlib
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import bson
+from bson import Binary
+from pymongo import DESCENDING
+from pymongo.errors import DuplicateKeyError
+
+try:
+    import zstandard
+except ImportError:  # optional; archives fall back to zlib
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+ARCHIVES_COLLECTION = "cold_archives"
+LEASES_COLLECTION = "tiering_leases"
+
+
+class TierSource:
+    def __init__(self, collection: str, time_field: str = "timestamp", id_field: str = "id"):
+        self.collection = collection
+        self.time_field = time_field
+        self.id_field = id_field
+
+    def key(self, doc: Dict[str, Any]) -> Tuple[datetime, Any]:
+        return doc[self.time_field], doc[self.id_field]
+
+
+TIER_SOURCES: Dict[str, TierSource] = {
+    source.collection: source for source in [
+        TierSource("pomodoro_sessions"),
+        TierSource("meditation_sessions"),
+        TierSource("five_minute_sessions"),
+        TierSource("activity_sessions"),
+        # Coin transactions are keyed by ObjectId user ids and have no ``id`` field
+        TierSource("coin_transactions", id_field="_id"),
+    ]
+}
+
+
+def compress(payload: bytes) -> Tuple[str, bytes]:
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=10).compress(payload)
+    return "zlib", zlib.compress(payload, 9)
+
+
+def decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd archive found but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+class ColdStorage:
+    def __init__(self, db, sources: Optional[Dict[str, TierSource]] = None, hot_days: float = 180,
+                 chunk_size: int = 500, interval: float = 86400, lease_ttl: float = 3600):
+        self.db = db
+        self.sources = sources if sources is not None else TIER_SOURCES
+        self.hot_horizon = timedelta(days=hot_days)
+        self.chunk_size = chunk_size
+        self.interval = interval
+        self.lease_ttl = lease_ttl
+        self.worker_id = uuid.uuid4().hex
+        self.last_run: Optional[Dict[str, Any]] = None
+        self.decompressed = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def archives(self):
+        return self.db[ARCHIVES_COLLECTION]
+
+    def manages(self, collection: str) -> bool:
+        return collection in self.sources
+
+    def cutoff(self) -> datetime:
+        return datetime.utcnow() - self.hot_horizon
+
+    async def ensure_indexes(self):
+        await self.archives.create_index([("collection", 1), ("user_id", 1), ("last", DESCENDING)])
+        await self.archives.create_index([("collection", 1), ("user_id", 1), ("first", 1)])
+        for source in self.sources.values():
+            await self.db[source.collection].create_index([(source.time_field, 1)])
+
+    # ===============================
+    # ARCHIVING
+    # ===============================
+
+    def _archive_document(self, source: TierSource, user_id: str, docs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        codec, data = compress(bson.encode({"records": docs}))
+        return {
+            "_id": f"{source.collection}:{user_id}:{docs[0][source.id_field]}",
+            "collection": source.collection,
+            "user_id": user_id,
+            "first": docs[0][source.time_field],
+            "last": docs[-1][source.time_field],
+            "count": len(docs),
+            "codec": codec,
+            "data": Binary(data),
+            "archived_at": datetime.utcnow(),
+        }
+
+    async def archive_user(self, source: TierSource, user_value: Any, cutoff: datetime) -> int:
+        """Move one user's records older than ``cutoff`` into archives; returns records moved"""
+        collection = self.db[source.collection]
+        query = {"user_id": user_value, source.time_field: {"$lt": cutoff}}
+        moved = 0
+        while True:
+            docs = await collection.find(query).sort(
+                [(source.time_field, 1), (source.id_field, 1)]
+            ).to_list(self.chunk_size)
+            if not docs:
+                return moved
+            archive = self._archive_document(source, str(user_value), docs)
+            await self.archives.replace_one({"_id": archive["_id"]}, archive, upsert=True)
+            await collection.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+            moved += len(docs)
+
+    async def archive_source(self, source: TierSource, cutoff: datetime) -> Dict[str, int]:
+        users = await self.db[source.collection].distinct("user_id", {source.time_field: {"$lt": cutoff}})
+        moved = 0
+        for user_value in users:
+            moved += await self.archive_user(source, user_value, cutoff)
+        return {"users": len(users), "records": moved}
+
+    async def run_once(self) -> Dict[str, Any]:
+        """Archive everything past the hot horizon across all sources"""
+        cutoff = self.cutoff()
+        started = datetime.utcnow()
+        sources = {}
+        for name, source in self.sources.items():
+            try:
+                sources[name] = await self.archive_source(source, cutoff)
+            except Exception as e:
+                logger.error(f"Tiering {name} failed: {e}")
+                sources[name] = {"error": str(e)}
+        self.last_run = {
+            "cutoff": cutoff,
+            "started_at": started,
+            "seconds": round((datetime.utcnow() - started).total_seconds(), 3),
+            "sources": sources,
+        }
+        return self.last_run
+
+    async def acquire(self) -> bool:
+        """One worker tiers at a time; the lease outlives a run so others skip it"""
+        now = datetime.utcnow()
+        try:
+            await self.db[LEASES_COLLECTION].update_one(
+                {"_id": "tiering", "$or": [{"owner": self.worker_id}, {"lease_until": {"$lt": now}}]},
+                {"$set": {"owner": self.worker_id, "lease_until": now + timedelta(seconds=self.lease_ttl)}},
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def _loop(self):
+        while True:
+            try:
+                if await self.acquire():
+                    await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Tiering run failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    # ===============================
+    # READS
+    # ===============================
+
+    def _records(self, archive: Dict[str, Any]) -> List[Dict[str, Any]]:
+        self.decompressed += 1
+        return bson.decode(decompress(archive["codec"], archive["data"]))["records"]
+
+    async def page(self, collection: str, user_id: Any, limit: int, since: Optional[datetime] = None,
+                   until: Optional[datetime] = None,
+                   before: Optional[Tuple[datetime, Any]] = None) -> List[Dict[str, Any]]:
+        """Newest ``limit`` archived records in ``[since, until]`` and before the ``(time, id)`` position"""
+        source = self.sources[collection]
+        upper = until
+        if before and (upper is None or before[0] < upper):
+            upper = before[0]
+        query: Dict[str, Any] = {"collection": collection, "user_id": str(user_id)}
+        if since:
+            query["last"] = {"$gte": since}
+        if upper:
+            query["first"] = {"$lte": upper}
+
+        records: List[Dict[str, Any]] = []
+        async for archive in self.archives.find(query, {"data": 1, "codec": 1, "last": 1}).sort("last", -1):
+            # Archives come newest-last first; a full page newer than this one ends the scan
+            if len(records) >= limit and source.key(records[limit - 1])[0] > archive["last"]:
+                break
+            for doc in self._records(archive):
+                when = doc[source.time_field]
+                if (since and when < since) or (until and when > until):
+                    continue
+                if before and source.key(doc) >= before:
+                    continue
+                records.append(doc)
+            records.sort(key=source.key, reverse=True)
+        return records[:limit]
+
+    async def fill(self, collection: str, query: Dict[str, Any], hot: List[Dict[str, Any]],
+                   limit: int) -> List[Dict[str, Any]]:
+        """Complete a newest-first history page from the archives once it reaches past the hot horizon
+
+        ``query`` is the ``{user_id, <time>: {$gte, $lte}}`` filter the hot page was read with.
+        """
+        if not self.manages(collection):
+            return hot
+        source = self.sources[collection]
+        if len(hot) >= limit and hot[-1][source.time_field] >= self.cutoff():
+            return hot
+        bounds = query.get(source.time_field, {})
+        cold = await self.page(collection, query["user_id"], limit, bounds.get("$gte"), bounds.get("$lte"))
+        if not cold:
+            return hot
+        seen = {doc[source.id_field] for doc in hot}
+        merged = hot + [doc for doc in cold if doc[source.id_field] not in seen]
+        merged.sort(key=source.key, reverse=True)
+        return merged[:limit]
+
+    async def count(self, collection: str, user_id: Any) -> int:
+        totals = await self.archives.aggregate([
+            {"$match": {"collection": collection, "user_id": str(user_id)}},
+            {"$group": {"_id": None, "count": {"$sum": "$count"}}},
+        ]).to_list(1)
+        return totals[0]["count"] if totals else 0
+
+    async def iter_records(self, collection: str, user_id: Any, skip: int = 0) -> AsyncIterator[Dict[str, Any]]:
+        """All archived records of a user, oldest first, after skipping ``skip`` of them"""
+        cursor = self.archives.find(
+            {"collection": collection, "user_id": str(user_id)}, {"data": 1, "codec": 1, "count": 1}
+        ).sort("first", 1)
+        async for archive in cursor:
+            if skip >= archive["count"]:
+                skip -= archive["count"]
+                continue
+            for doc in self._records(archive)[skip:]:
+                yield doc
+            skip = 0
+
+    async def iter_archives(self, collection: str, user_ids: Optional[List[str]] = None
+                            ) -> AsyncIterator[Tuple[str, List[Dict[str, Any]]]]:
+        """``(user_id, records)`` for every archive of a collection, by user and then oldest first
+
+        ``user_ids`` limits it to those users' archives.
+        """
+        query: Dict[str, Any] = {"collection": collection}
+        if user_ids is not None:
+            query["user_id"] = {"$in": [str(user_id) for user_id in user_ids]}
+        cursor = self.archives.find(query, {"user_id": 1, "data": 1, "codec": 1}).sort([("user_id", 1), ("first", 1)])
+        async for archive in cursor:
+            yield archive["user_id"], self._records(archive)
+
+    async def stats(self) -> Dict[str, Any]:
+        totals = await self.archives.aggregate([
+            {"$group": {"_id": "$collection", "archives": {"$sum": 1}, "records": {"$sum": "$count"}}},
+        ]).to_list(None)
+        return {
+            "hot_days": self.hot_horizon.days,
+            "codec": "zstd" if zstandard is not None else "zlib",
+            "collections": {row["_id"]: {"archives": row["archives"], "records": row["records"]} for row in totals},
+            "archives_decompressed": self.decompressed,
+            "last_run": self.last_run,
+        }
+
+
+async def _main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["run", "status"])
+    parser.add_argument("--hot-days", type=float, default=float(os.environ.get('TIER_HOT_DAYS', 180)))
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--collections", help="comma-separated collections (default: all tiered)")
+    args = parser.parse_args()
+
+    sources = TIER_SOURCES
+    if args.collections:
+        names = args.collections.split(",")
+        unknown = [name for name in names if name not in TIER_SOURCES]
+        if unknown:
+            parser.error(f"not a tiered collection: {', '.join(unknown)}")
+        sources = {name: TIER_SOURCES[name] for name in names}
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME'].strip('"')]
+    storage = ColdStorage(db, sources, hot_days=args.hot_days, chunk_size=args.chunk_size)
+    try:
+        await storage.ensure_indexes()
+        if args.command == "run":
+            run = await storage.run_once()
+            for name, result in run["sources"].items():
+                print(f"{name}: {result}")
+        stats = await storage.stats()
+    finally:
+        client.close()
+    for name, totals in stats["collections"].items():
+        print(f"{name}: {totals['records']} records in {totals['archives']} archives ({stats['codec']})")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
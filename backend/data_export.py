@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+Streaming export of a user's (or a cohort's) data as NDJSON or CSV.
+
+Records are read from Mongo cursors in small batches and encoded into
+bounded output chunks as they arrive, optionally gzip-compressed on the fly,
+so memory use does not depend on the size of the export. Records are written
+in a fixed order (user, collection, ``_id``; bucketed sessions, which have no
+``_id`` of their own, by time and id), which makes an export resumable:
+``offset`` skips that many records, jumping over whole collections by count
+before skipping inside one. Records moved to cold storage are included,
+ahead of the hot records of their collection.
+
+    python data_export.py --user USER_ID [--user ...] --output export.ndjson.gz --gzip
+    python data_export.py --cohort-file ids.txt --output export.ndjson --resume
+    python data_export.py --user USER_ID --format csv --collections sleep_data --output sleep.csv
+
+While writing to a file the CLI keeps a ``<output>.progress`` checkpoint
+with the records and bytes written as of the last complete chunk (with
+``--gzip`` each chunk is its own gzip member). ``--resume`` truncates the
+file back to that point, so a run killed mid-write resumes cleanly; the
+checkpoint is removed when the export completes.
+"""
+
+import argparse
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+import zlib
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+
+from cold_storage import TIER_SOURCES, ColdStorage
+from session_storage import SessionStorage, create_index
+
+CHUNK_SIZE = 64 * 1024
+BATCH_SIZE = 500
+CSV_HEADER_SAMPLE = 200
+
+
+class ExportSource:
+    def __init__(self, collection: str, user_fields: Tuple[str, ...] = ("user_id",)):
+        self.collection = collection
+        self.user_fields = user_fields
+
+    def query(self, ids: List[Any]) -> Dict[str, Any]:
+        """Records of a user known by any of ``ids`` (see ``DataExporter.user_ids``)"""
+        clauses = [{field: {"$in": ids}} for field in self.user_fields]
+        return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+EXPORT_SOURCES: Dict[str, ExportSource] = {
+    source.collection: source for source in [
+        ExportSource("users", ("id", "_id")),
+        ExportSource("user_progress"),
+        ExportSource("thought_records"),
+        ExportSource("behavioral_activations"),
+        ExportSource("meditation_sessions"),
+        ExportSource("mindfulness_checkins"),
+        ExportSource("pomodoro_sessions"),
+        ExportSource("implementation_intentions"),
+        ExportSource("five_minute_sessions"),
+        ExportSource("activity_sessions"),
+        ExportSource("sleep_data"),
+        ExportSource("accountability_partners", ("user_id", "partner_id")),
+        ExportSource("check_in_sessions", ("initiator_id",)),
+        ExportSource("achievements"),
+        ExportSource("behavior_patterns"),
+        ExportSource("personalized_recommendations"),
+        ExportSource("coin_transactions"),
+        ExportSource("store_purchases"),
+    ]
+}
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def _cell(value: Any) -> Any:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=_default)
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return _default(value)
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Compress a byte stream as one gzip member (resumed exports append another)"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+class ExportProgress:
+    """Records contained in the chunks yielded so far, updated just before each chunk"""
+
+    def __init__(self):
+        self.records = 0
+
+
+class DataExporter:
+    """Exports the collections in ``sources`` for a set of users
+
+    Records that ``archive`` (``ColdStorage``) moved out of a collection are
+    exported ahead of its hot records, and session collections that
+    ``storage`` (``SessionStorage``) keeps in buckets are read from them.
+    """
+
+    def __init__(self, db, sources: Optional[Dict[str, ExportSource]] = None, archive=None, storage=None):
+        self.db = db
+        self.sources = sources or EXPORT_SOURCES
+        self.archive = archive
+        self.storage = storage
+
+    async def ensure_indexes(self):
+        # Lets each (user, collection) slice be read and skipped in _id order without a sort
+        for source in self.sources.values():
+            for field in source.user_fields:
+                if field != "_id":
+                    await create_index(self.db[source.collection], [(field, 1), ("_id", 1)])
+
+    def resolve(self, collections: Optional[Iterable[str]]) -> List[ExportSource]:
+        """Sources to export; unknown names raise ``ValueError``"""
+        if not collections:
+            return list(self.sources.values())
+        names = list(collections)
+        unknown = [name for name in names if name not in self.sources]
+        if unknown:
+            raise ValueError(f"Unknown collections: {', '.join(unknown)}")
+        return [self.sources[name] for name in names]
+
+    def _stored(self, collection: str) -> bool:
+        return bool(self.storage and self.storage.manages(collection))
+
+    async def _count(self, collection: str, query: Dict[str, Any]) -> int:
+        if self._stored(collection):
+            return await self.storage.count(collection, query)
+        return await self.db[collection].count_documents(query)
+
+    def _read(self, collection: str, query: Dict[str, Any], skip: int = 0, limit: int = 0):
+        """Hot records of one collection in export order"""
+        if self._stored(collection):
+            order = [("timestamp", 1), ("id", 1)] if self.storage.uses_buckets(collection) else [("_id", 1)]
+            return self.storage.sessions(collection, query, order, skip, limit)
+        return self.db[collection].find(query).sort("_id", 1).skip(skip).limit(limit).batch_size(BATCH_SIZE)
+
+    async def user_ids(self, user_id: str) -> List[Any]:
+        """Every id a user's records may be stored under
+
+        The module collections key users by ``users.id`` and the store ones
+        by ``users._id``, and either may be what the caller passed.
+        """
+        ids: List[Any] = [user_id]
+        lookup: List[Dict[str, Any]] = [{"id": user_id}]
+        if ObjectId.is_valid(user_id):
+            lookup.append({"_id": ObjectId(user_id)})
+        user = await self.db.users.find_one({"$or": lookup}, {"_id": 1, "id": 1})
+        if user:
+            ids += [value for value in (user.get("id"), user["_id"]) if value is not None and value != user_id]
+        elif ObjectId.is_valid(user_id):
+            ids.append(ObjectId(user_id))
+        return ids
+
+    async def records(self, user_ids: Iterable[str], sources: List[ExportSource],
+                      offset: int = 0) -> AsyncIterator[Tuple[str, str, Dict[str, Any]]]:
+        """``(collection, user_id, document)`` in export order, starting after ``offset`` records"""
+        skip = offset
+        for user_id in user_ids:
+            ids = await self.user_ids(user_id)
+            for source in sources:
+                if self.archive and self.archive.manages(source.collection):
+                    # Archives are filed under the string form of whichever id the records used
+                    for archived_id in dict.fromkeys(str(value) for value in ids):
+                        archived = await self.archive.count(source.collection, archived_id)
+                        if archived <= skip:
+                            skip -= archived
+                            continue
+                        async for doc in self.archive.iter_records(source.collection, archived_id, skip):
+                            yield source.collection, user_id, doc
+                        skip = 0
+                query = source.query(ids)
+                if skip:
+                    total = await self._count(source.collection, query)
+                    if total <= skip:
+                        skip -= total
+                        continue
+                docs = self._read(source.collection, query, skip)
+                skip = 0
+                async for doc in docs:
+                    yield source.collection, user_id, doc
+
+    async def ndjson(self, user_ids: Iterable[str], sources: List[ExportSource], offset: int = 0,
+                     progress: Optional[ExportProgress] = None) -> AsyncIterator[bytes]:
+        progress = progress or ExportProgress()
+        buffer = io.BytesIO()
+        pending = 0
+        async for collection, user_id, doc in self.records(user_ids, sources, offset):
+            line = json.dumps({"collection": collection, "user_id": user_id, "record": doc}, default=_default)
+            buffer.write(line.encode())
+            buffer.write(b"\n")
+            pending += 1
+            if buffer.tell() >= CHUNK_SIZE:
+                progress.records += pending
+                pending = 0
+                yield buffer.getvalue()
+                buffer = io.BytesIO()
+        if buffer.tell():
+            progress.records += pending
+            yield buffer.getvalue()
+
+    async def csv_columns(self, user_ids: List[str], source: ExportSource) -> List[str]:
+        """Header from a bounded sample; fields seen later go to the ``_extra`` column"""
+        columns: Dict[str, None] = {}
+        for user_id in user_ids:
+            sampled = 0
+            query = source.query(await self.user_ids(user_id))
+            async for doc in self._read(source.collection, query, limit=CSV_HEADER_SAMPLE):
+                columns.update(dict.fromkeys(doc))
+                sampled += 1
+            if sampled:
+                break
+        return list(columns) + ["_extra"]
+
+    async def csv(self, user_ids: Iterable[str], source: ExportSource, offset: int = 0,
+                  progress: Optional[ExportProgress] = None) -> AsyncIterator[bytes]:
+        """One collection as CSV; the header is only written when starting from the beginning"""
+        progress = progress or ExportProgress()
+        user_ids = list(user_ids)
+        columns = await self.csv_columns(user_ids, source)
+        known = set(columns)
+        text = io.StringIO()
+        writer = csv.writer(text)
+        if offset == 0:
+            writer.writerow(columns)
+        pending = 0
+        async for _, _, doc in self.records(user_ids, [source], offset):
+            extra = {key: value for key, value in doc.items() if key not in known}
+            writer.writerow(
+                [_cell(doc.get(column)) for column in columns[:-1]]
+                + [json.dumps(extra, default=_default) if extra else ""]
+            )
+            pending += 1
+            if text.tell() >= CHUNK_SIZE:
+                progress.records += pending
+                pending = 0
+                yield text.getvalue().encode()
+                text = io.StringIO()
+                writer = csv.writer(text)
+        if text.tell():
+            progress.records += pending
+            yield text.getvalue().encode()
+
+    def stream(self, user_ids: Iterable[str], fmt: str = "ndjson", collections: Optional[Iterable[str]] = None,
+               offset: int = 0, compress: bool = False,
+               progress: Optional[ExportProgress] = None) -> AsyncIterator[bytes]:
+        """Validate the request up front and return the byte stream
+
+        Raises ``ValueError`` for an unknown format or collection, or CSV over
+        more than one collection (a CSV file has a single header). Uncompressed
+        chunks always end on a record boundary; ``progress`` counts them.
+        """
+        sources = self.resolve(collections)
+        if offset < 0:
+            raise ValueError("offset must not be negative")
+        if fmt == "ndjson":
+            chunks = self.ndjson(user_ids, sources, offset, progress)
+        elif fmt == "csv":
+            if len(sources) != 1:
+                raise ValueError("CSV exports need exactly one collection")
+            chunks = self.csv(user_ids, sources[0], offset, progress)
+        else:
+            raise ValueError(f"Unknown export format: {fmt}")
+        return gzip_chunks(chunks) if compress else chunks
+
+
+def _existing_records(path: Path, fmt: str, compressed: bool) -> int:
+    """Records in an export file without a checkpoint (one that completed), for ``--resume``"""
+    opener = gzip.open if compressed else open
+    with opener(path, "rt", newline="") as existing:
+        if fmt == "csv":
+            # Quoted cells may contain newlines, so count parsed rows
+            return max(sum(1 for _ in csv.reader(existing)) - 1, 0)
+        return sum(1 for _ in existing)
+
+
+def _checkpoint_path(output: Path) -> Path:
+    return output.with_name(output.name + ".progress")
+
+
+def _read_checkpoint(output: Path) -> Optional[Dict[str, int]]:
+    try:
+        return json.loads(_checkpoint_path(output).read_text())
+    except FileNotFoundError:
+        return None
+
+
+def _write_checkpoint(output: Path, records: int, size: int):
+    # Replaced atomically so a crash never leaves a half-written checkpoint
+    path = _checkpoint_path(output)
+    staging = path.with_name(path.name + ".tmp")
+    staging.write_text(json.dumps({"records": records, "bytes": size}))
+    os.replace(staging, path)
+
+
+async def _main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user", action="append", default=[], help="user id (repeatable)")
+    parser.add_argument("--cohort-file", type=Path, help="file with one user id per line")
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    parser.add_argument("--collections", help="comma-separated collections (default: all)")
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--offset", type=int, default=0, help="records to skip")
+    parser.add_argument("--resume", action="store_true", help="append to --output after the records it holds")
+    parser.add_argument("--output", type=Path, help="output file (default: stdout)")
+    args = parser.parse_args()
+
+    user_ids = list(args.user)
+    if args.cohort_file:
+        user_ids += [line.strip() for line in args.cohort_file.read_text().splitlines() if line.strip()]
+    if not user_ids:
+        parser.error("give at least one --user or a --cohort-file")
+
+    offset = args.offset
+    size = 0
+    if args.resume:
+        if not args.output:
+            parser.error("--resume needs --output")
+        checkpoint = _read_checkpoint(args.output) if args.output.exists() else None
+        if checkpoint:
+            # Drop whatever was written after the last complete chunk
+            offset, size = checkpoint["records"], checkpoint["bytes"]
+            with open(args.output, "r+b") as existing:
+                existing.truncate(size)
+        elif args.output.exists():
+            offset = _existing_records(args.output, args.format, args.gzip)
+            size = args.output.stat().st_size
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME'].strip('"')]
+    storage = SessionStorage(db, os.environ.get('SESSION_STORAGE_MODE', 'documents'))
+    await storage.ensure_layout()
+    # Archived records are part of the export; bucketed collections are never archived, as in server.py
+    archive = ColdStorage(db, {name: source for name, source in TIER_SOURCES.items()
+                               if not storage.uses_buckets(name)})
+    exporter = DataExporter(db, archive=archive, storage=storage)
+    collections = args.collections.split(",") if args.collections else None
+    progress = ExportProgress()
+    try:
+        chunks = exporter.stream(user_ids, args.format, collections, offset, progress=progress)
+    except ValueError as e:
+        parser.error(str(e))
+
+    output = open(args.output, "ab" if offset or size else "wb") if args.output else sys.stdout.buffer
+    written = 0
+    try:
+        if args.output:
+            _write_checkpoint(args.output, offset, output.tell())
+        async for chunk in chunks:
+            if args.gzip:
+                # One gzip member per chunk, so the file can be cut back to any checkpoint
+                chunk = gzip.compress(chunk, 6)
+            output.write(chunk)
+            written += len(chunk)
+            if args.output:
+                output.flush()
+                _write_checkpoint(args.output, offset + progress.records, output.tell())
+    finally:
+        if args.output:
+            output.close()
+        client.close()
+    if args.output:
+        _checkpoint_path(args.output).unlink()
+    print(f"Exported {written} bytes for {len(user_ids)} users starting at record {offset}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
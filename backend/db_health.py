@@ -0,0 +1,147 @@
+"""
+Connection pool settings and the ``/health`` / ``/ready`` probes.
+
+``pool_options`` turns the ``MONGO_*`` pool variables into Motor client
+options; unset ones keep the driver defaults (100 connections, 2 connecting
+at once, no idle limit, no wait-queue timeout, 30s server selection).
+
+``DbHealth`` answers the orchestrator. ``health()`` is liveness: it never
+touches Mongo, so a slow database does not get workers restarted. ``ready()``
+is readiness and fails (503) while the app is starting or shutting down,
+when a ``ping`` round trip fails or exceeds its budget, when the busiest
+server's pool has ``max_saturation`` of its connections checked out, or
+when more than ``max_waiters`` checkouts are queued for one. pymongo 4 has
+no wait-queue size limit of its own, so ``max_waiters`` is how a deployment
+bounds the queue: a worker past it stops getting traffic until it drains.
+
+Pings are shared between concurrent probes and reused for ``ping_cache``
+seconds, so frequent probes from several sources cost one round trip.
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+# Environment variable -> MongoClient option
+POOL_SETTINGS = {
+    "MONGO_MAX_POOL_SIZE": "maxPoolSize",
+    "MONGO_MIN_POOL_SIZE": "minPoolSize",
+    "MONGO_MAX_CONNECTING": "maxConnecting",
+    "MONGO_MAX_IDLE_TIME_MS": "maxIdleTimeMS",
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": "waitQueueTimeoutMS",
+    "MONGO_CONNECT_TIMEOUT_MS": "connectTimeoutMS",
+    "MONGO_SOCKET_TIMEOUT_MS": "socketTimeoutMS",
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": "serverSelectionTimeoutMS",
+}
+
+
+def pool_options(environ: Mapping[str, str]) -> Dict[str, int]:
+    """Client options for the pool variables that are set; raises ``ValueError`` naming a bad one"""
+    options = {}
+    for variable, option in POOL_SETTINGS.items():
+        raw = environ.get(variable)
+        if raw is None or raw == "":
+            continue
+        try:
+            value = int(raw)
+        except ValueError:
+            raise ValueError(f"{variable} must be an integer, got {raw!r}")
+        if value < 0:
+            raise ValueError(f"{variable} must not be negative, got {value}")
+        options[option] = value
+    if options.get("minPoolSize", 0) > options.get("maxPoolSize", 100) > 0:
+        raise ValueError("MONGO_MIN_POOL_SIZE must not exceed MONGO_MAX_POOL_SIZE")
+    return options
+
+
+class DbHealth:
+    def __init__(self, db, pool=None, max_pool_size: Optional[int] = None, max_saturation: float = 0.95,
+                 max_waiters: Optional[int] = None, ping_timeout: float = 1.0, max_ping_ms: float = 500,
+                 ping_cache: float = 1.0):
+        self.db = db
+        # MongoPoolMetrics, or None when there is no pool (the in-memory engine)
+        self.pool = pool
+        self.max_pool_size = max_pool_size
+        self.max_saturation = max_saturation
+        self.max_waiters = max_pool_size if max_waiters is None else max_waiters
+        self.ping_timeout = ping_timeout
+        self.max_ping_ms = max_ping_ms
+        self.ping_cache = ping_cache
+        self.state = "starting"
+        self.started_at = time.time()
+        # (monotonic time, latency in ms or None, error or None)
+        self._last_ping: Optional[Tuple[float, Optional[float], Optional[str]]] = None
+        self._ping: Optional[asyncio.Task] = None
+        self.probes_failed = 0
+
+    async def start(self):
+        self.state = "serving"
+
+    async def stop(self):
+        self.state = "stopping"
+        if self._ping:
+            self._ping.cancel()
+
+    async def _round_trip(self) -> Tuple[float, Optional[float], Optional[str]]:
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self.db.command("ping"), self.ping_timeout)
+            return time.monotonic(), round((time.perf_counter() - started) * 1000, 2), None
+        except asyncio.TimeoutError:
+            return time.monotonic(), None, f"no reply within {self.ping_timeout * 1000:.0f}ms"
+        except Exception as e:
+            return time.monotonic(), None, f"{type(e).__name__}: {e}"
+
+    async def ping(self) -> Tuple[Optional[float], Optional[str]]:
+        """Latency of a ping round trip in ms, or the error; cached for ``ping_cache`` seconds"""
+        if self._last_ping and time.monotonic() - self._last_ping[0] < self.ping_cache:
+            return self._last_ping[1], self._last_ping[2]
+        if self._ping is None or self._ping.done():
+            self._ping = asyncio.create_task(self._round_trip())
+        self._last_ping = await asyncio.shield(self._ping)
+        return self._last_ping[1], self._last_ping[2]
+
+    def pool_stats(self) -> Dict[str, Any]:
+        if self.pool is None:
+            return {"max_pool_size": None, "saturation": 0.0, "waiting": 0, "servers": {}}
+        servers = self.pool.snapshot()
+        for server in servers.values():
+            server["saturation"] = round(server["in_use"] / self.max_pool_size, 3) if self.max_pool_size else 0.0
+        return {
+            "max_pool_size": self.max_pool_size,
+            "saturation": max((server["saturation"] for server in servers.values()), default=0.0),
+            "waiting": max((server["waiting"] for server in servers.values()), default=0),
+            "servers": servers,
+        }
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            "status": "ok",
+            "state": self.state,
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "pool": self.pool_stats(),
+        }
+
+    async def ready(self) -> Tuple[bool, Dict[str, Any]]:
+        """Whether to route traffic here, and why not"""
+        reasons = []
+        if self.state != "serving":
+            reasons.append(f"app is {self.state}")
+        pool = self.pool_stats()
+        if pool["saturation"] >= self.max_saturation:
+            reasons.append(f"pool saturation {pool['saturation']:.0%} >= {self.max_saturation:.0%}")
+        if self.max_waiters is not None and pool["waiting"] > self.max_waiters:
+            reasons.append(f"{pool['waiting']:.0f} checkouts waiting > {self.max_waiters}")
+        latency, error = await self.ping()
+        if error:
+            reasons.append(f"ping failed: {error}")
+        elif latency > self.max_ping_ms:
+            reasons.append(f"ping {latency:.0f}ms > {self.max_ping_ms:.0f}ms")
+        if reasons:
+            self.probes_failed += 1
+        return not reasons, {
+            "status": "ready" if not reasons else "not_ready",
+            "reasons": reasons,
+            "ping_ms": latency,
+            "pool": pool,
+        }
@@ -0,0 +1,172 @@
+"""
+Mongo command monitoring: slow-query log and per-request DB call accounting.
+
+``CommandMonitor`` is a pymongo command listener. For every command it notes
+the duration, the collection and the command name and charges them to the
+request that issued it; the request is found through a context variable that
+``DbAccountingMiddleware`` sets, which Motor carries into the executor
+threads that run the commands. Commands slower than the threshold are logged
+with their redacted shape (keys and operators kept, every value replaced by
+``?``), and requests that make too many calls are logged with their most
+repeated commands, which is what an N+1 loop looks like.
+
+With ``headers=True`` every response carries ``X-DB-Calls`` and
+``X-DB-Time-Ms``.
+"""
+
+import logging
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+from metrics import command_collection
+
+logger = logging.getLogger(__name__)
+
+# Driver bookkeeping that says nothing about the query
+IGNORED_KEYS = {
+    "lsid", "$db", "$clusterTime", "$readPreference", "txnNumber", "autocommit", "startTransaction",
+    "$readConcern", "readConcern", "writeConcern", "apiVersion", "apiStrict", "apiDeprecationErrors",
+}
+MAX_SHAPE_DEPTH = 6
+
+
+def redact(value: Any, depth: int = 0) -> Any:
+    """The shape of a command: keys and operators kept, values replaced by ``?``"""
+    if depth > MAX_SHAPE_DEPTH:
+        return "..."
+    if isinstance(value, dict):
+        return {key: redact(item, depth + 1) for key, item in value.items() if key not in IGNORED_KEYS}
+    if isinstance(value, (list, tuple)):
+        # One element stands for all of them; $in lists and insert batches would otherwise dominate
+        return [redact(value[0], depth + 1)] if value else []
+    return "?"
+
+
+def command_shape(command_name: str, command: Dict[str, Any]) -> Dict[str, Any]:
+    shape = redact(command)
+    # The collection name is kept, it is not a value from the request
+    if isinstance(command.get(command_name), str):
+        shape[command_name] = command[command_name]
+    return shape
+
+
+class RequestDbStats:
+    """DB calls charged to one request; updated from Motor's executor threads"""
+
+    __slots__ = ("method", "path", "calls", "seconds", "commands", "_lock")
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.calls = 0
+        self.seconds = 0.0
+        self.commands: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, collection: str, command_name: str, seconds: float):
+        with self._lock:
+            self.calls += 1
+            self.seconds += seconds
+            self.commands[(collection, command_name)] += 1
+
+    def most_repeated(self, n: int = 3) -> List[str]:
+        return [f"{collection}.{command} x{count}" for (collection, command), count in self.commands.most_common(n)]
+
+
+current_request: ContextVar[Optional[RequestDbStats]] = ContextVar("current_db_request", default=None)
+
+
+class CommandMonitor(monitoring.CommandListener):
+    def __init__(self, slow_ms: float = 100, max_slow_queries: int = 200):
+        self.slow_seconds = slow_ms / 1000
+        self.slow_queries: deque = deque(maxlen=max_slow_queries)
+        self.commands = 0
+        self.slow = 0
+        # (connection, request id) -> (command name, command, request); reply events carry neither
+        self._pending: Dict[Tuple[Any, int], Tuple[str, Dict[str, Any], Optional[RequestDbStats]]] = {}
+
+    def started(self, event):
+        self._pending[(event.connection_id, event.request_id)] = (
+            event.command_name, event.command, current_request.get()
+        )
+
+    def _finished(self, event, error: Optional[str] = None):
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        command_name, command, request = pending
+        seconds = event.duration_micros / 1e6
+        collection = command_collection(command_name, command)
+        self.commands += 1
+        if request is not None:
+            request.record(collection, command_name, seconds)
+        if seconds >= self.slow_seconds:
+            self.slow += 1
+            entry = {
+                "at": time.time(),
+                "collection": collection,
+                "command": command_name,
+                "ms": round(seconds * 1000, 2),
+                "shape": command_shape(command_name, command),
+                "request": f"{request.method} {request.path}" if request else None,
+                "error": error,
+            }
+            self.slow_queries.append(entry)
+            logger.warning(
+                f"Slow Mongo {command_name} on {collection}: {entry['ms']}ms "
+                f"{entry['shape']} ({entry['request'] or 'no request'})"
+            )
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event, error=str(event.failure.get("errmsg", event.failure)) if event.failure else "failed")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "commands": self.commands,
+            "slow_commands": self.slow,
+            "slow_threshold_ms": self.slow_seconds * 1000,
+            "recent_slow": list(self.slow_queries)[::-1],
+        }
+
+
+class DbAccountingMiddleware:
+    """Attributes Mongo commands to the request, reports them in headers and flags chatty routes"""
+
+    def __init__(self, app, headers: bool = False, warn_calls: int = 25):
+        self.app = app
+        self.headers = headers
+        self.warn_calls = warn_calls
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestDbStats(scope["method"], scope["path"])
+        token = current_request.set(stats)
+
+        async def send_with_headers(message):
+            if self.headers and message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-db-calls", str(stats.calls).encode()),
+                    (b"x-db-time-ms", f"{stats.seconds * 1000:.2f}".encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            current_request.reset(token)
+            if stats.calls > self.warn_calls:
+                route = getattr(scope.get("route"), "path", scope["path"])
+                logger.warning(
+                    f"{scope['method']} {route} made {stats.calls} DB calls "
+                    f"({stats.seconds * 1000:.1f}ms): {', '.join(stats.most_repeated())}"
+                )
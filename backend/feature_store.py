@@ -0,0 +1,491 @@
+"""
+Per-user feature store for AI insights.
+
+Keeps one compact ``user_features`` document per user that is updated
+incrementally on every relevant write, so building an insights prompt costs a
+single indexed read instead of re-querying the module collections.
+"""
+
+import math
+import re
+from datetime import datetime, date
+from typing import Any, Dict, List, Optional
+
+from pymongo import UpdateOne
+
+FEATURES_COLLECTION = "user_features"
+
+# EWMA weights for the productivity score: the fast average follows the last
+# few sessions, the slow one the longer-term baseline. Their difference is the
+# focus trend.
+FOCUS_ALPHA_FAST = 0.3
+FOCUS_ALPHA_SLOW = 0.05
+
+# Nights kept for the recent sleep quality average
+RECENT_NIGHTS = 7
+
+MAX_DISTRACTION_KEY_LENGTH = 40
+DEFAULT_PROMPT_BUDGET = 600  # characters
+
+_UNSAFE_KEY_CHARS = re.compile(r"[^a-z0-9_]+")
+
+
+def day_number(value: Any) -> int:
+    """Convert a datetime, date or ISO string to a proleptic day ordinal"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        value = value.date()
+    return value.toordinal()
+
+
+def field_ref(path: str) -> str:
+    return f"${path}"
+
+
+def inc_expr(path: str, amount: Any) -> Dict[str, Any]:
+    """Pipeline-update equivalent of ``$inc``"""
+    return {"$add": [{"$ifNull": [field_ref(path), 0]}, amount]}
+
+
+def _ewma(path: str, value: float, alpha: float) -> Dict[str, Any]:
+    """Exponentially weighted moving average, seeded with the first value"""
+    return {
+        "$add": [
+            {"$multiply": [{"$ifNull": [field_ref(path), value]}, 1 - alpha]},
+            alpha * value,
+        ]
+    }
+
+
+def streak_stages(day: int, streak_path: str, last_day_path: str, longest_path: str) -> List[Dict[str, Any]]:
+    """Pipeline stages that advance a day streak stored at the given paths
+
+    Writes on the same day keep the streak, a write on the following day
+    extends it, a gap resets it to 1 and late (back-dated) writes are ignored.
+    """
+    last_day = field_ref(last_day_path)
+    streak = {"$ifNull": [field_ref(streak_path), 0]}
+    return [
+        {"$set": {
+            streak_path: {"$switch": {
+                "branches": [
+                    {"case": {"$eq": [last_day, day]}, "then": streak},
+                    {"case": {"$eq": [last_day, day - 1]}, "then": {"$add": [streak, 1]}},
+                    {"case": {"$gt": [last_day, day]}, "then": streak},
+                ],
+                "default": 1,
+            }},
+            last_day_path: {"$max": [last_day, day]},
+        }},
+        {"$set": {
+            longest_path: {"$max": [{"$ifNull": [field_ref(longest_path), 0]}, field_ref(streak_path)]},
+        }},
+    ]
+
+
+def distraction_key(distraction: Dict[str, Any]) -> str:
+    """Normalise a distraction entry into a safe Mongo field name"""
+    raw = distraction.get("type") or distraction.get("source") or distraction.get("name") or "other"
+    key = _UNSAFE_KEY_CHARS.sub("_", str(raw).lower()).strip("_")
+    return key[:MAX_DISTRACTION_KEY_LENGTH] or "other"
+
+
+# ===============================
+# INCREMENTAL UPDATES
+# ===============================
+
+def streak_from_days(days: List[int]) -> Dict[str, int]:
+    """Compute the streak document from a sorted list of distinct activity days"""
+    streak = longest = 0
+    previous = None
+    for day in days:
+        streak = streak + 1 if previous == day - 1 else 1
+        longest = max(longest, streak)
+        previous = day
+    if previous is None:
+        return {}
+    return {"last_day": previous, "streak": streak, "longest": longest}
+
+
+def effective_streak(progress: Dict[str, Any], today: Optional[date] = None) -> int:
+    """The stored streak, or 0 if the user has missed a whole day since"""
+    last_day = progress.get("last_activity_day")
+    if last_day is None:
+        return progress.get("current_streak", 0)
+    if last_day < (today or datetime.utcnow().date()).toordinal() - 1:
+        return 0
+    return progress.get("current_streak", 0)
+
+
+def pomodoro_update(session: Dict[str, Any]) -> List[Dict[str, Any]]:
+    score = float(session.get("productivity_score") or 0)
+    ratings = session.get("focus_quality_ratings") or []
+    counts: Dict[str, int] = {}
+    for distraction in session.get("distractions") or []:
+        if isinstance(distraction, dict):
+            key = distraction_key(distraction)
+            counts[key] = counts.get(key, 0) + 1
+
+    fields = {
+        "focus.sessions": inc_expr("focus.sessions", 1),
+        "focus.score_sum": inc_expr("focus.score_sum", score),
+        "focus.score_fast": _ewma("focus.score_fast", score, FOCUS_ALPHA_FAST),
+        "focus.score_slow": _ewma("focus.score_slow", score, FOCUS_ALPHA_SLOW),
+        "focus.minutes": inc_expr("focus.minutes", session.get("work_duration") or 0),
+        "focus.rating_sum": inc_expr("focus.rating_sum", sum(ratings)),
+        "focus.rating_count": inc_expr("focus.rating_count", len(ratings)),
+        "updated_at": datetime.utcnow(),
+    }
+    for key, count in counts.items():
+        fields[f"distractions.{key}"] = inc_expr(f"distractions.{key}", count)
+    return [{"$set": fields}]
+
+
+def sleep_update(sleep: Dict[str, Any]) -> List[Dict[str, Any]]:
+    quality = float(sleep.get("sleep_quality") or 0)
+    fields = {
+        "sleep.nights": inc_expr("sleep.nights", 1),
+        "sleep.quality_sum": inc_expr("sleep.quality_sum", quality),
+        "sleep.duration_sum": inc_expr("sleep.duration_sum", float(sleep.get("sleep_duration") or 0)),
+        "sleep.bedtime_delay_sum": inc_expr(
+            "sleep.bedtime_delay_sum", sleep.get("bedtime_procrastination_minutes") or 0
+        ),
+        "updated_at": datetime.utcnow(),
+    }
+    # Running sums for the Pearson correlation between sleep quality and the
+    # next day's procrastination score, only for nights where it was rated.
+    procrastination = sleep.get("next_day_procrastination_score")
+    if procrastination is not None:
+        y = float(procrastination)
+        fields.update({
+            "sleep.pairs": inc_expr("sleep.pairs", 1),
+            "sleep.sx": inc_expr("sleep.sx", quality),
+            "sleep.sy": inc_expr("sleep.sy", y),
+            "sleep.sxx": inc_expr("sleep.sxx", quality * quality),
+            "sleep.syy": inc_expr("sleep.syy", y * y),
+            "sleep.sxy": inc_expr("sleep.sxy", quality * y),
+        })
+    return [{"$set": fields}]
+
+
+def recent_night_update(sleep: Dict[str, Any]) -> Dict[str, Any]:
+    """Add a night to the ``RECENT_NIGHTS`` most recent ones, whatever order nights are logged in
+
+    A plain update rather than a pipeline: ``$push`` sorts and trims the
+    array in place, which pipeline updates cannot do without ``$sortArray``.
+    """
+    night = {"day": day_number(sleep["sleep_date"]), "quality": float(sleep.get("sleep_quality") or 0)}
+    return {"$push": {"sleep.recent": {"$each": [night], "$sort": {"day": 1}, "$slice": -RECENT_NIGHTS}}}
+
+
+def thought_record_update(record: Dict[str, Any]) -> List[Dict[str, Any]]:
+    fields = {
+        "cbt.records": inc_expr("cbt.records", 1),
+        "cbt.effectiveness_sum": inc_expr("cbt.effectiveness_sum", record.get("effectiveness_rating") or 0),
+        "updated_at": datetime.utcnow(),
+    }
+    return [{"$set": fields}]
+
+
+def intention_usage_update(success: bool) -> List[Dict[str, Any]]:
+    return [{"$set": {
+        "intentions.opportunities": inc_expr("intentions.opportunities", 1),
+        "intentions.successes": inc_expr("intentions.successes", 1 if success else 0),
+        "updated_at": datetime.utcnow(),
+    }}]
+
+
+# ===============================
+# COMPACT VIEW AND PROMPT RENDERING
+# ===============================
+
+def _ratio(numerator: float, denominator: float, digits: int = 1) -> Optional[float]:
+    if not denominator:
+        return None
+    return round(numerator / denominator, digits)
+
+
+def _pearson(sleep: Dict[str, Any]) -> Optional[float]:
+    n = sleep.get("pairs", 0)
+    if n < 3:
+        return None
+    sx, sy = sleep["sx"], sleep["sy"]
+    var_x = n * sleep["sxx"] - sx * sx
+    var_y = n * sleep["syy"] - sy * sy
+    if var_x <= 0 or var_y <= 0:
+        return None
+    return round((n * sleep["sxy"] - sx * sy) / math.sqrt(var_x * var_y), 2)
+
+
+def compact_features(features: Optional[Dict[str, Any]], progress: Optional[Dict[str, Any]] = None,
+                     top_distractions: int = 3) -> Dict[str, Any]:
+    """Derive the small, flat feature vector used for prompts and responses
+
+    Streaks come from the user's ``user_progress`` document, which owns them.
+    """
+    features = features or {}
+    progress = progress or {}
+    focus = features.get("focus", {})
+    sleep = features.get("sleep", {})
+    cbt = features.get("cbt", {})
+    intentions = features.get("intentions", {})
+    # Documents written before the recent nights were kept fall back to the all-time average
+    recent_nights = sleep.get("recent") or (
+        [{"quality": sleep["quality_sum"] / sleep["nights"]}] if sleep.get("nights") else []
+    )
+
+    trend = None
+    if focus.get("sessions", 0) >= 2:
+        trend = round(focus["score_fast"] - focus["score_slow"], 2)
+
+    distractions = sorted(
+        features.get("distractions", {}).items(), key=lambda item: item[1], reverse=True
+    )[:top_distractions]
+
+    return {
+        "streak_days": effective_streak(progress),
+        "longest_streak_days": progress.get("longest_streak", 0),
+        "focus_sessions": focus.get("sessions", 0),
+        "focus_minutes": focus.get("minutes", 0),
+        "focus_score_avg": _ratio(focus.get("score_sum", 0), focus.get("sessions", 0)),
+        "focus_score_trend": trend,
+        "focus_rating_avg": _ratio(focus.get("rating_sum", 0), focus.get("rating_count", 0)),
+        "top_distractions": dict(distractions),
+        "sleep_nights": sleep.get("nights", 0),
+        "sleep_quality_avg": _ratio(sum(night["quality"] for night in recent_nights), len(recent_nights)) or 0,
+        "sleep_hours_avg": _ratio(sleep.get("duration_sum", 0), sleep.get("nights", 0)),
+        "bedtime_delay_avg_min": _ratio(sleep.get("bedtime_delay_sum", 0), sleep.get("nights", 0), 0),
+        "sleep_procrastination_r": _pearson(sleep),
+        "thought_records": cbt.get("records", 0),
+        "cbt_effectiveness_avg": _ratio(cbt.get("effectiveness_sum", 0), cbt.get("records", 0)),
+        "intention_success_rate": _ratio(
+            intentions.get("successes", 0), intentions.get("opportunities", 0), 2
+        ),
+        "intention_uses": intentions.get("opportunities", 0),
+    }
+
+
+def render_features(compact: Dict[str, Any], budget: int = DEFAULT_PROMPT_BUDGET) -> str:
+    """Render the compact features as terse lines, most important first
+
+    Lines that would push the prompt context past ``budget`` characters are
+    dropped, so prompt size stays bounded however much history a user has.
+    """
+    lines = [f"streak: {compact['streak_days']}d (best {compact['longest_streak_days']}d)"]
+
+    if compact["focus_sessions"]:
+        line = f"focus: {compact['focus_sessions']} sessions, {compact['focus_minutes']} min, score avg {compact['focus_score_avg']}"
+        if compact["focus_score_trend"] is not None:
+            line += f", trend {compact['focus_score_trend']:+}"
+        if compact["focus_rating_avg"] is not None:
+            line += f", rating {compact['focus_rating_avg']}/10"
+        lines.append(line)
+
+    if compact["top_distractions"]:
+        lines.append("distractions: " + ", ".join(
+            f"{name} {count}" for name, count in compact["top_distractions"].items()
+        ))
+
+    if compact["sleep_nights"]:
+        line = (
+            f"sleep: {compact['sleep_nights']} nights, quality {compact['sleep_quality_avg']}/10 "
+            f"(last {RECENT_NIGHTS}), "
+            f"{compact['sleep_hours_avg']}h, bedtime delay {compact['bedtime_delay_avg_min']:.0f}m"
+        )
+        if compact["sleep_procrastination_r"] is not None:
+            line += f", r(sleep quality, next-day procrastination)={compact['sleep_procrastination_r']}"
+        lines.append(line)
+
+    if compact["thought_records"]:
+        lines.append(
+            f"cbt: {compact['thought_records']} thought records, effectiveness {compact['cbt_effectiveness_avg']}/10"
+        )
+
+    if compact["intention_uses"]:
+        lines.append(
+            f"if-then plans: {compact['intention_success_rate']:.0%} success over {compact['intention_uses']} uses"
+        )
+
+    rendered: List[str] = []
+    size = 0
+    for line in lines:
+        if size + len(line) + 1 > budget:
+            break
+        rendered.append(line)
+        size += len(line) + 1
+    return "\n".join(rendered)
+
+
+# ===============================
+# RULE-BASED INSIGHTS
+# ===============================
+
+def heuristic_insights(compact: Dict[str, Any]) -> str:
+    """Local, rule-based insights used when the LLM is unavailable or too slow"""
+    patterns: List[str] = []
+    recommendations: List[str] = []
+
+    trend = compact.get("focus_score_trend")
+    if trend is not None and trend < -0.5:
+        patterns.append("Your recent focus sessions are scoring below your usual baseline.")
+        recommendations.append("Try shorter work blocks (15-20 minutes) until focus scores recover.")
+    elif trend is not None and trend > 0.5:
+        patterns.append("Your focus scores are trending up compared with your baseline.")
+
+    if compact.get("top_distractions"):
+        name = next(iter(compact["top_distractions"]))
+        patterns.append(f"'{name.replace('_', ' ')}' is your most frequent distraction during focus sessions.")
+        recommendations.append("Remove or silence that distraction before your next session (environmental design).")
+
+    r = compact.get("sleep_procrastination_r")
+    if r is not None and r <= -0.3:
+        patterns.append("Nights with better sleep are followed by days with less procrastination.")
+    if compact.get("sleep_nights"):
+        if (compact.get("bedtime_delay_avg_min") or 0) >= 30:
+            recommendations.append("Set a fixed wind-down alarm 30 minutes before bed to cut bedtime procrastination.")
+        elif compact.get("sleep_quality_avg", 0) < 6:
+            recommendations.append("Keep a consistent wake time this week to improve sleep quality.")
+
+    rate = compact.get("intention_success_rate")
+    if rate is not None and compact.get("intention_uses", 0) >= 3:
+        if rate < 0.5:
+            patterns.append("Your if-then plans succeed less than half the time.")
+            recommendations.append("Make the 'if' cue of your weakest plan more specific (time and place).")
+        else:
+            patterns.append(f"Your if-then plans work {rate:.0%} of the time.")
+
+    if compact.get("streak_days", 0) == 0:
+        recommendations.append("Restart momentum today with one five-minute micro-task.")
+
+    if not patterns:
+        patterns.append("Not enough recent data yet to detect strong patterns.")
+    if not recommendations:
+        recommendations.append("Keep logging sessions; schedule your hardest task in your best focus window.")
+
+    if compact.get("streak_days", 0) >= 2:
+        encouragement = f"You're on a {compact['streak_days']}-day streak - keep it going!"
+    elif compact.get("focus_sessions"):
+        encouragement = f"You've completed {compact['focus_sessions']} focus sessions so far - that's real progress."
+    else:
+        encouragement = "Every session you log makes these insights more personal."
+
+    lines = ["Patterns:"]
+    lines += [f"{i}. {text}" for i, text in enumerate(patterns[:3], 1)]
+    lines.append("Recommendations:")
+    lines += [f"- {text}" for text in recommendations[:3]]
+    lines.append(f"Encouragement: {encouragement}")
+    return "\n".join(lines)
+
+
+# ===============================
+# STORE
+# ===============================
+
+class FeatureStore:
+    """Reads and incrementally maintains ``user_features`` documents
+
+    ``rebuild`` replays a user's history, including records moved to
+    ``archive`` (``ColdStorage``) and sessions kept in buckets by ``storage``
+    (``SessionStorage``).
+    """
+
+    rebuild_batch_size = 500
+
+    def __init__(self, db, archive=None, storage=None):
+        self.db = db
+        self.archive = archive
+        self.storage = storage
+
+    @property
+    def collection(self):
+        return self.db[FEATURES_COLLECTION]
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("user_id", unique=True)
+
+    async def _apply(self, user_id: str, *updates: Any):
+        if len(updates) == 1:
+            await self.collection.update_one({"user_id": user_id}, updates[0], upsert=True)
+        else:
+            await self.collection.bulk_write(
+                [UpdateOne({"user_id": user_id}, update, upsert=True) for update in updates], ordered=True
+            )
+
+    async def record_pomodoro(self, session: Dict[str, Any]):
+        await self._apply(session["user_id"], pomodoro_update(session))
+
+    async def record_sleep(self, sleep: Dict[str, Any]):
+        await self._apply(sleep["user_id"], sleep_update(sleep), recent_night_update(sleep))
+
+    async def record_thought_record(self, record: Dict[str, Any]):
+        await self._apply(record["user_id"], thought_record_update(record))
+
+    async def record_intention_usage(self, user_id: str, success: bool):
+        await self._apply(user_id, intention_usage_update(success))
+
+    async def get(self, user_id: str) -> Dict[str, Any]:
+        """Return the user's features, rebuilding them once from history if missing"""
+        features = await self.collection.find_one({"user_id": user_id}, {"_id": 0})
+        if features is None:
+            features = await self.rebuild(user_id)
+        return features
+
+    async def _history(self, collection: str, user_id: str):
+        """Archived records first, then the hot collection"""
+        if self.archive and self.archive.manages(collection):
+            async for doc in self.archive.iter_records(collection, user_id):
+                yield doc
+        if self.storage and self.storage.manages(collection):
+            docs = self.storage.sessions(collection, {"user_id": user_id})
+        else:
+            docs = self.db[collection].find({"user_id": user_id}, {"_id": 0})
+        async for doc in docs:
+            yield doc
+
+    async def rebuild(self, user_id: str) -> Dict[str, Any]:
+        """Recompute a user's features from the module collections and their archives
+
+        History is streamed through the same update pipelines used for live
+        writes, sent as ordered bulk writes so a long history costs a handful
+        of round trips.
+        """
+        await self.collection.replace_one(
+            {"user_id": user_id},
+            {"user_id": user_id, "updated_at": datetime.utcnow()},
+            upsert=True,
+        )
+        batch: List[UpdateOne] = []
+
+        async def flush():
+            if batch:
+                await self.collection.bulk_write(batch, ordered=True)
+                batch.clear()
+
+        sources = [
+            ("pomodoro_sessions", (pomodoro_update,)),
+            ("thought_records", (thought_record_update,)),
+            ("sleep_data", (sleep_update, recent_night_update)),
+        ]
+        for collection, builders in sources:
+            async for doc in self._history(collection, user_id):
+                batch.extend(UpdateOne({"user_id": user_id}, build_update(doc)) for build_update in builders)
+                if len(batch) >= self.rebuild_batch_size:
+                    await flush()
+        await flush()
+
+        totals = await self.db.implementation_intentions.aggregate([
+            {"$match": {"user_id": user_id}},
+            {"$group": {
+                "_id": None,
+                "successes": {"$sum": "$success_count"},
+                "opportunities": {"$sum": "$total_opportunities"},
+            }},
+        ]).to_list(1)
+        if totals:
+            await self.collection.update_one({"user_id": user_id}, {"$set": {"intentions": {
+                "successes": totals[0]["successes"],
+                "opportunities": totals[0]["opportunities"],
+            }}})
+
+        return await self.collection.find_one({"user_id": user_id}, {"_id": 0})
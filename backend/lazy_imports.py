@@ -0,0 +1,80 @@
+"""
+Deferred imports for heavy dependencies.
+
+``emergentintegrations.llm.chat`` pulls in the provider SDKs (litellm,
+openai, google-genai, boto3, ...) and takes seconds to import, which every
+uvicorn worker paid before it could serve anything. A ``LazyModule`` imports
+its module in a worker thread on first use instead, so the event loop keeps
+serving while it loads; concurrent first callers wait on the same import.
+``preload()`` starts that import in the background once the app is up, so
+the first request that needs it usually finds it already loaded.
+
+An import that fails is retried by the next ``load()``.
+"""
+
+import asyncio
+import importlib
+import logging
+import sys
+import time
+from types import ModuleType
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LazyModule:
+    def __init__(self, name: str):
+        self.name = name
+        self.module: Optional[ModuleType] = sys.modules.get(name)
+        self.import_seconds: Optional[float] = None
+        self._future: Optional[asyncio.Future] = None
+        self._preload: Optional[asyncio.Task] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.module is not None
+
+    def _import(self) -> ModuleType:
+        started = time.perf_counter()
+        module = importlib.import_module(self.name)
+        self.import_seconds = time.perf_counter() - started
+        logger.info(f"Imported {self.name} in {self.import_seconds * 1000:.0f}ms")
+        return module
+
+    async def load(self) -> ModuleType:
+        if self.module is not None:
+            return self.module
+        if self._future is None:
+            self._future = asyncio.ensure_future(asyncio.to_thread(self._import))
+        future = self._future
+        try:
+            # Shielded: a caller cancelled by its deadline must not cancel the import for everyone else
+            self.module = await asyncio.shield(future)
+        except Exception:
+            if self._future is future and future.done():
+                self._future = None
+            raise
+        return self.module
+
+    def preload(self) -> Optional[asyncio.Task]:
+        """Start the import in the background; returns the task, or None when already loaded"""
+        if self.module is not None:
+            return None
+
+        async def load():
+            try:
+                await self.load()
+            except Exception as e:
+                logger.warning(f"Preloading {self.name} failed: {e}")
+
+        # Held here so the task is not garbage collected while it runs
+        self._preload = asyncio.create_task(load())
+        return self._preload
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "module": self.name,
+            "loaded": self.loaded,
+            "import_ms": round(self.import_seconds * 1000, 1) if self.import_seconds is not None else None,
+        }
@@ -0,0 +1,384 @@
+"""
+Real-time leaderboards kept in memory as ranked sorted sets.
+
+Boards are updated incrementally as points and coins are awarded instead of
+sorting ``user_progress`` per request. Each board is a skip list with span
+counts (the structure behind Redis sorted sets), giving O(log n) score
+updates, rank lookups and rank-range reads.
+
+Scores themselves live in ``leaderboard_entries``, one document per board,
+period and user, written with ``$inc``/``$set`` as awards happen, so every
+worker writes to the same place and none can overwrite another's. Each
+worker's sorted sets are a read cache of that collection: its own awards are
+applied as they are written, and entries changed by other workers are pulled
+in every ``sync_interval`` seconds through an index on ``updated_at``.
+"""
+
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ReturnDocument, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+ENTRIES_COLLECTION = "leaderboard_entries"
+REBUILD_BATCH_SIZE = 1000
+# ``updated_at`` is set by the server; re-read this far behind the last sync so
+# clock skew against this worker, or writes committed just after a read, are not missed
+SYNC_OVERLAP = timedelta(seconds=10)
+
+GLOBAL = "global"
+WEEKLY = "weekly"
+COINS = "coins"
+BOARDS = (GLOBAL, WEEKLY, COINS)
+
+
+# ===============================
+# SORTED SET
+# ===============================
+
+class _Node:
+    __slots__ = ("key", "forward", "span")
+
+    def __init__(self, key, level: int):
+        self.key = key
+        self.forward: List[Optional["_Node"]] = [None] * level
+        self.span = [0] * level
+
+
+class SortedSet:
+    """Members ordered by descending score (ties by member), with O(log n) rank"""
+
+    MAX_LEVEL = 32
+    P = 0.25
+
+    def __init__(self):
+        self.head = _Node(None, self.MAX_LEVEL)
+        self.level = 1
+        self.length = 0
+        self.scores: Dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __contains__(self, member: str) -> bool:
+        return member in self.scores
+
+    @staticmethod
+    def _key(member: str, score: float) -> Tuple[float, str]:
+        return (-score, member)
+
+    def _random_level(self) -> int:
+        level = 1
+        while level < self.MAX_LEVEL and random.random() < self.P:
+            level += 1
+        return level
+
+    def _insert(self, key):
+        update = [self.head] * self.MAX_LEVEL
+        rank = [0] * self.MAX_LEVEL
+        node = self.head
+        for i in reversed(range(self.level)):
+            rank[i] = 0 if i == self.level - 1 else rank[i + 1]
+            while node.forward[i] is not None and node.forward[i].key < key:
+                rank[i] += node.span[i]
+                node = node.forward[i]
+            update[i] = node
+
+        level = self._random_level()
+        if level > self.level:
+            for i in range(self.level, level):
+                rank[i] = 0
+                update[i] = self.head
+                self.head.span[i] = self.length
+            self.level = level
+
+        new = _Node(key, level)
+        for i in range(level):
+            new.forward[i] = update[i].forward[i]
+            update[i].forward[i] = new
+            new.span[i] = update[i].span[i] - (rank[0] - rank[i])
+            update[i].span[i] = rank[0] - rank[i] + 1
+        for i in range(level, self.level):
+            update[i].span[i] += 1
+        self.length += 1
+
+    def _delete(self, key):
+        update = [self.head] * self.MAX_LEVEL
+        node = self.head
+        for i in reversed(range(self.level)):
+            while node.forward[i] is not None and node.forward[i].key < key:
+                node = node.forward[i]
+            update[i] = node
+        target = node.forward[0]
+        for i in range(self.level):
+            if update[i].forward[i] is target:
+                update[i].span[i] += target.span[i] - 1
+                update[i].forward[i] = target.forward[i]
+            else:
+                update[i].span[i] -= 1
+        while self.level > 1 and self.head.forward[self.level - 1] is None:
+            self.level -= 1
+        self.length -= 1
+
+    def add(self, member: str, score: float):
+        """Set a member's score, inserting or repositioning it"""
+        old = self.scores.get(member)
+        if old == score:
+            return
+        if old is not None:
+            self._delete(self._key(member, old))
+        self._insert(self._key(member, score))
+        self.scores[member] = score
+
+    def incr(self, member: str, delta: float) -> float:
+        score = self.scores.get(member, 0) + delta
+        self.add(member, score)
+        return score
+
+    def remove(self, member: str):
+        score = self.scores.pop(member, None)
+        if score is not None:
+            self._delete(self._key(member, score))
+
+    def score(self, member: str) -> Optional[float]:
+        return self.scores.get(member)
+
+    def rank(self, member: str) -> Optional[int]:
+        """0-based rank, highest score first"""
+        score = self.scores.get(member)
+        if score is None:
+            return None
+        key = self._key(member, score)
+        traversed = 0
+        node = self.head
+        for i in reversed(range(self.level)):
+            while node.forward[i] is not None and node.forward[i].key <= key:
+                traversed += node.span[i]
+                node = node.forward[i]
+            if node.key == key:
+                return traversed - 1
+        return None
+
+    def range(self, start: int, stop: int) -> List[Tuple[str, float]]:
+        """Members with rank in ``[start, stop)``, highest score first"""
+        start = max(start, 0)
+        stop = min(stop, self.length)
+        if start >= stop:
+            return []
+        traversed = 0
+        node = self.head
+        for i in reversed(range(self.level)):
+            while node.forward[i] is not None and traversed + node.span[i] <= start + 1:
+                traversed += node.span[i]
+                node = node.forward[i]
+        entries = []
+        while node is not None and len(entries) < stop - start:
+            entries.append((node.key[1], -node.key[0]))
+            node = node.forward[0]
+        return entries
+
+    def items(self) -> Iterable[Tuple[str, float]]:
+        node = self.head.forward[0]
+        while node is not None:
+            yield node.key[1], -node.key[0]
+            node = node.forward[0]
+
+
+# ===============================
+# LEADERBOARDS
+# ===============================
+
+def week_start(now: Optional[datetime] = None) -> datetime:
+    now = now or datetime.utcnow()
+    monday = now.date() - timedelta(days=now.weekday())
+    return datetime.combine(monday, datetime.min.time())
+
+
+def week_key(now: Optional[datetime] = None) -> str:
+    year, week, _ = (now or datetime.utcnow()).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def _entries(entries: List[Tuple[str, float]], first_rank: int) -> List[Dict[str, Any]]:
+    return [
+        {"rank": first_rank + offset + 1, "user_id": member, "score": score}
+        for offset, (member, score) in enumerate(entries)
+    ]
+
+
+class Leaderboards:
+    """Global, weekly and coin leaderboards shared by all workers through Mongo"""
+
+    def __init__(self, db, sync_interval: float = 5.0):
+        self.db = db
+        self.sync_interval = sync_interval
+        self.boards: Dict[str, SortedSet] = {name: SortedSet() for name in BOARDS}
+        self.periods: Dict[str, str] = {GLOBAL: "all", WEEKLY: week_key(), COINS: "all"}
+        self.synced: Dict[str, Optional[datetime]] = {name: None for name in BOARDS}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def entries(self):
+        return self.db[ENTRIES_COLLECTION]
+
+    def board(self, name: str) -> SortedSet:
+        if name == WEEKLY and self.periods[WEEKLY] != week_key():
+            # New week: the weekly board starts empty
+            self.boards[WEEKLY] = SortedSet()
+            self.periods[WEEKLY] = week_key()
+            self.synced[WEEKLY] = None
+        return self.boards[name]
+
+    # ---- updates ----
+
+    async def _write(self, name: str, user_id: str, update: Dict[str, Any]):
+        board = self.board(name)
+        entry = await self.entries.find_one_and_update(
+            {"board": name, "period": self.periods[name], "user_id": user_id},
+            {**update, "$currentDate": {"updated_at": True}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        board.add(user_id, entry["score"])
+
+    async def record_points(self, user_id: str, points: int, total: Optional[int] = None):
+        """Apply a points award; ``total`` is the user's new total_points if known"""
+        await asyncio.gather(
+            self._write(GLOBAL, user_id, {"$inc": {"score": points}} if total is None else {"$set": {"score": total}}),
+            self._write(WEEKLY, user_id, {"$inc": {"score": points}}),
+        )
+
+    async def record_total(self, user_id: str, total: int):
+        """Set a user's all-time score to their total_points, e.g. after it was recomputed"""
+        await self._write(GLOBAL, user_id, {"$set": {"score": total}})
+
+    async def record_coins(self, user_id: str, lifetime_coins: int):
+        await self._write(COINS, user_id, {"$set": {"score": lifetime_coins}})
+
+    # ---- queries ----
+
+    def top(self, name: str, limit: int) -> List[Dict[str, Any]]:
+        return _entries(self.board(name).range(0, limit), 0)
+
+    def around(self, name: str, user_id: str, window: int) -> Dict[str, Any]:
+        board = self.board(name)
+        rank = board.rank(user_id)
+        if rank is None:
+            return {"rank": None, "score": None, "total": len(board), "entries": []}
+        start = max(rank - window, 0)
+        return {
+            "rank": rank + 1,
+            "score": board.score(user_id),
+            "total": len(board),
+            "entries": _entries(board.range(start, rank + window + 1), start),
+        }
+
+    def friends(self, name: str, user_id: str, friend_ids: Iterable[str]) -> List[Dict[str, Any]]:
+        board = self.board(name)
+        members = set(friend_ids) | {user_id}
+        scored = sorted(
+            ((member, board.score(member) or 0) for member in members),
+            key=lambda entry: (-entry[1], entry[0]),
+        )
+        return _entries(scored, 0)
+
+    # ---- shared state ----
+
+    async def sync(self, name: str):
+        """Apply entries written since the last sync, by this worker or any other"""
+        board = self.board(name)
+        started = datetime.utcnow()
+        query: Dict[str, Any] = {"board": name, "period": self.periods[name]}
+        if self.synced[name] is not None:
+            query["updated_at"] = {"$gte": self.synced[name] - SYNC_OVERLAP}
+        async for entry in self.entries.find(query, {"_id": 0, "user_id": 1, "score": 1}):
+            board.add(entry["user_id"], entry["score"])
+        self.synced[name] = started
+
+    async def load(self):
+        """Load every board from the shared entries, rebuilding any that have none yet"""
+        for name in BOARDS:
+            self.board(name)
+            if not await self.entries.find_one({"board": name, "period": self.periods[name]}):
+                await self.rebuild(name)
+            self.boards[name] = SortedSet()
+            self.synced[name] = None
+            await self.sync(name)
+            logger.info(f"Loaded {name} leaderboard with {len(self.boards[name])} entries")
+
+    async def rebuild(self, name: str):
+        """Recompute one board's entries from its source collection
+
+        Scores are merged with ``$max``, so workers rebuilding at the same
+        time, or awards landing during a rebuild, never lower an entry.
+        """
+        self.board(name)
+        if name == GLOBAL:
+            cursor = self.db.user_progress.find(
+                {"total_points": {"$gt": 0}}, {"_id": 0, "user_id": 1, "total_points": 1}
+            )
+            rows = ((doc["user_id"], doc["total_points"]) async for doc in cursor)
+        elif name == WEEKLY:
+            cursor = self.db.achievements.aggregate([
+                {"$match": {"unlock_date": {"$gte": week_start()}}},
+                {"$group": {"_id": "$user_id", "points": {"$sum": "$points_earned"}}},
+            ])
+            rows = ((row["_id"], row["points"]) async for row in cursor)
+        else:
+            cursor = self.db.users.find(
+                {"user_progress.lifetime_coins": {"$gt": 0}}, {"_id": 1, "id": 1, "user_progress.lifetime_coins": 1}
+            )
+            rows = ((doc.get("id") or str(doc["_id"]), doc["user_progress"]["lifetime_coins"]) async for doc in cursor)
+
+        rebuilt = 0
+        batch: List[UpdateOne] = []
+        async for user_id, score in rows:
+            batch.append(UpdateOne(
+                {"board": name, "period": self.periods[name], "user_id": user_id},
+                {"$max": {"score": score}, "$currentDate": {"updated_at": True}},
+                upsert=True,
+            ))
+            if len(batch) >= REBUILD_BATCH_SIZE:
+                await self.entries.bulk_write(batch, ordered=False)
+                rebuilt += len(batch)
+                batch = []
+        if batch:
+            await self.entries.bulk_write(batch, ordered=False)
+            rebuilt += len(batch)
+        logger.info(f"Rebuilt {name} leaderboard with {rebuilt} entries")
+
+    async def _sync_loop(self):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                for name in BOARDS:
+                    await self.sync(name)
+                # Entries of finished weeks are no longer read
+                await self.entries.delete_many({"board": WEEKLY, "period": {"$lt": self.periods[WEEKLY]}})
+            except Exception as e:
+                logger.error(f"Leaderboard sync failed: {e}")
+
+    async def start(self):
+        await self.entries.create_index([("board", 1), ("period", 1), ("user_id", 1)], unique=True)
+        await self.entries.create_index([("board", 1), ("period", 1), ("updated_at", 1)])
+        await self.load()
+        self._task = asyncio.create_task(self._sync_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            name: {
+                "entries": len(board),
+                "period": self.periods[name],
+                "synced_at": self.synced[name].isoformat() if self.synced[name] else None,
+            }
+            for name, board in self.boards.items()
+        }
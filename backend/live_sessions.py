@@ -0,0 +1,341 @@
+"""
+Live Pomodoro sessions tracked on the server while they run.
+
+A running session lives in an in-process registry and receives heartbeats,
+focus ratings and distractions as they happen. Each session has one timer in
+a ``TimerWheel``; a heartbeat just moves it, so a worker can hold tens of
+thousands of sessions without a task or Mongo query per session. Changed
+sessions are checkpointed to ``live_pomodoro_sessions`` in one bulk write per
+interval, so another worker can pick a session up after a restart. A finished
+(or expired) session is compacted into a regular ``PomodoroSession``.
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError
+
+from timer_wheel import TimerWheel
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINTS_COLLECTION = "live_pomodoro_sessions"
+MAX_EVENTS_PER_SESSION = 500
+DUPLICATE_KEY = 11000
+COMPLETED_RATE = 0.8
+
+
+class LiveSession:
+    __slots__ = (
+        "id", "user_id", "task_name", "work_duration", "break_duration", "cycles",
+        "started_at", "last_heartbeat", "focus_quality_ratings", "distractions",
+        "break_activities", "dirty", "persisted",
+    )
+
+    def __init__(self, user_id: str, task_name: str, work_duration: int, break_duration: int,
+                 cycles: int = 1, session_id: Optional[str] = None, started_at: Optional[float] = None):
+        self.id = session_id or str(uuid.uuid4())
+        self.user_id = user_id
+        self.task_name = task_name
+        self.work_duration = work_duration
+        self.break_duration = break_duration
+        self.cycles = cycles
+        self.started_at = started_at if started_at is not None else time.time()
+        self.last_heartbeat = self.started_at
+        self.focus_quality_ratings: List[int] = []
+        self.distractions: List[Dict[str, Any]] = []
+        self.break_activities: List[str] = []
+        self.dirty = True
+        self.persisted = False
+
+    @property
+    def planned_seconds(self) -> float:
+        return self.work_duration * self.cycles * 60
+
+    def completion_rate(self) -> float:
+        if self.planned_seconds <= 0:
+            return 1.0
+        return min((self.last_heartbeat - self.started_at) / self.planned_seconds, 1.0)
+
+    def productivity_score(self) -> float:
+        """Average focus rating, less half a point per distraction (at most 3)"""
+        if self.focus_quality_ratings:
+            base = sum(self.focus_quality_ratings) / len(self.focus_quality_ratings)
+        else:
+            base = 10 * self.completion_rate()
+        return round(max(base - min(len(self.distractions) * 0.5, 3), 1), 2)
+
+    def compact(self, abandoned: bool = False) -> Dict[str, Any]:
+        """The finished session as a ``PomodoroSession`` document"""
+        if self.completion_rate() >= COMPLETED_RATE:
+            status = "completed"
+        else:
+            status = "abandoned" if abandoned else "partial"
+        return {
+            "id": self.id,
+            "user_id": self.user_id,
+            "task_name": self.task_name,
+            "work_duration": self.work_duration,
+            "break_duration": self.break_duration,
+            "focus_quality_ratings": list(self.focus_quality_ratings),
+            "distractions": list(self.distractions),
+            "break_activities": list(self.break_activities),
+            "completion_status": status,
+            "productivity_score": self.productivity_score(),
+            "timestamp": datetime.utcfromtimestamp(self.started_at),
+        }
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "user_id": self.user_id,
+            "task_name": self.task_name,
+            "work_duration": self.work_duration,
+            "break_duration": self.break_duration,
+            "cycles": self.cycles,
+            "started_at": datetime.utcfromtimestamp(self.started_at),
+            "last_heartbeat": datetime.utcfromtimestamp(self.last_heartbeat),
+            "elapsed_seconds": round(self.last_heartbeat - self.started_at),
+            "completion_rate": round(self.completion_rate(), 3),
+            "focus_quality_ratings": self.focus_quality_ratings,
+            "distractions": len(self.distractions),
+        }
+
+    def to_checkpoint(self) -> Dict[str, Any]:
+        return {
+            "_id": self.id,
+            "user_id": self.user_id,
+            "task_name": self.task_name,
+            "work_duration": self.work_duration,
+            "break_duration": self.break_duration,
+            "cycles": self.cycles,
+            "started_at": self.started_at,
+            "last_heartbeat": self.last_heartbeat,
+            "focus_quality_ratings": self.focus_quality_ratings,
+            "distractions": self.distractions,
+            "break_activities": self.break_activities,
+        }
+
+    @classmethod
+    def from_checkpoint(cls, doc: Dict[str, Any]) -> "LiveSession":
+        session = cls(
+            doc["user_id"], doc["task_name"], doc["work_duration"], doc["break_duration"],
+            doc.get("cycles", 1), session_id=doc["_id"], started_at=doc["started_at"],
+        )
+        session.last_heartbeat = doc["last_heartbeat"]
+        session.focus_quality_ratings = doc.get("focus_quality_ratings", [])
+        session.distractions = doc.get("distractions", [])
+        session.break_activities = doc.get("break_activities", [])
+        session.dirty = False
+        session.persisted = True
+        return session
+
+
+class LiveSessionRegistry:
+    """Running Pomodoro sessions owned by this worker, expired when heartbeats stop
+
+    Checkpoints carry the owning worker id. A heartbeat that reaches a worker
+    without the session adopts it from its checkpoint, and every write and the
+    final delete are conditional on ownership, so a session moved between
+    workers is only ever logged once.
+    """
+
+    def __init__(self, db, on_complete: Callable[[Dict[str, Any]], Awaitable[Any]],
+                 heartbeat_timeout: float = 90.0, checkpoint_interval: float = 15.0, tick: float = 1.0):
+        self.db = db
+        self.on_complete = on_complete
+        self.heartbeat_timeout = heartbeat_timeout
+        self.checkpoint_interval = checkpoint_interval
+        self.worker_id = str(uuid.uuid4())
+        self.sessions: Dict[str, LiveSession] = {}
+        self.wheel = TimerWheel(tick=tick)
+        self._tasks: List[asyncio.Task] = []
+
+        self.started = 0
+        self.finished = 0
+        self.expired = 0
+        self.adopted = 0
+        self.heartbeats = 0
+        self.checkpoints = 0
+        self.last_checkpoint_ms = 0.0
+
+    @property
+    def checkpoints_collection(self):
+        return self.db[CHECKPOINTS_COLLECTION]
+
+    async def ensure_indexes(self):
+        await self.checkpoints_collection.create_index("last_heartbeat")
+
+    # ---- session lifecycle ----
+
+    def _touch(self, session: LiveSession):
+        session.dirty = True
+        self.wheel.schedule(session.id, session.last_heartbeat + self.heartbeat_timeout)
+
+    def _drop(self, session_id: str):
+        self.sessions.pop(session_id, None)
+        self.wheel.cancel(session_id)
+
+    def start_session(self, user_id: str, task_name: str, work_duration: int,
+                      break_duration: int, cycles: int = 1) -> LiveSession:
+        session = LiveSession(user_id, task_name, work_duration, break_duration, cycles)
+        self.sessions[session.id] = session
+        self._touch(session)
+        self.started += 1
+        return session
+
+    async def get(self, session_id: str) -> LiveSession:
+        """A running session, adopted from its checkpoint if another worker had it"""
+        session = self.sessions.get(session_id)
+        if session is not None:
+            return session
+        doc = await self.checkpoints_collection.find_one_and_update(
+            {"_id": session_id}, {"$set": {"owner": self.worker_id}}
+        )
+        if doc is None:
+            raise KeyError(session_id)
+        session = LiveSession.from_checkpoint(doc)
+        self.sessions[session.id] = session
+        self._touch(session)
+        self.adopted += 1
+        return session
+
+    async def heartbeat(self, session_id: str, focus_rating: Optional[int] = None) -> LiveSession:
+        session = await self.get(session_id)
+        session.last_heartbeat = time.time()
+        if focus_rating is not None and len(session.focus_quality_ratings) < MAX_EVENTS_PER_SESSION:
+            session.focus_quality_ratings.append(focus_rating)
+        self._touch(session)
+        self.heartbeats += 1
+        return session
+
+    async def distraction(self, session_id: str, distraction: Dict[str, Any]) -> LiveSession:
+        session = await self.get(session_id)
+        if len(session.distractions) < MAX_EVENTS_PER_SESSION:
+            session.distractions.append({**distraction, "timestamp": datetime.utcnow()})
+        session.last_heartbeat = time.time()
+        self._touch(session)
+        return session
+
+    async def finish(self, session_id: str, break_activities: Optional[List[str]] = None) -> Dict[str, Any]:
+        """End a session and log it as a ``PomodoroSession``"""
+        session = await self.get(session_id)
+        session.last_heartbeat = time.time()
+        if break_activities:
+            session.break_activities.extend(break_activities)
+        self.finished += 1
+        return await self._complete(session, abandoned=False)
+
+    async def _complete(self, session: LiveSession, abandoned: bool) -> Dict[str, Any]:
+        self._drop(session.id)
+        document = session.compact(abandoned=abandoned)
+        if session.persisted:
+            claimed = await self.checkpoints_collection.find_one_and_delete(
+                {"_id": session.id, "owner": self.worker_id}, projection={"_id": 1}
+            )
+            if claimed is None:
+                # Another worker adopted the session and will log it
+                return document
+        await self.on_complete(document)
+        return document
+
+    async def _expire(self, session_id: str, deadline: float, payload: Any):
+        session = self.sessions.get(session_id)
+        if session is not None:
+            self.expired += 1
+            await self._complete(session, abandoned=True)
+
+    # ---- checkpoints ----
+
+    async def checkpoint(self):
+        """Write every changed session in one unordered bulk write"""
+        dirty = [session for session in self.sessions.values() if session.dirty]
+        if not dirty:
+            return
+        operations = []
+        for session in dirty:
+            session.dirty = False
+            operations.append(ReplaceOne(
+                {"_id": session.id, "owner": self.worker_id},
+                {**session.to_checkpoint(), "owner": self.worker_id},
+                upsert=True,
+            ))
+        started = time.perf_counter()
+        failed = set()
+        try:
+            await self.checkpoints_collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                session = dirty[error["index"]]
+                failed.add(session.id)
+                if error.get("code") == DUPLICATE_KEY:
+                    # The checkpoint now belongs to another worker
+                    self._drop(session.id)
+                else:
+                    session.dirty = True
+        written = [session for session in dirty if session.id not in failed]
+        for session in written:
+            session.persisted = True
+        # Sessions finished while the write was in flight must not leave a checkpoint behind
+        finished = [session.id for session in written if session.id not in self.sessions]
+        if finished:
+            await self.checkpoints_collection.delete_many({"_id": {"$in": finished}, "owner": self.worker_id})
+        self.last_checkpoint_ms = round((time.perf_counter() - started) * 1000, 2)
+        self.checkpoints += 1
+
+    async def reap_orphans(self):
+        """Expire checkpoints nobody has heartbeated for, e.g. those of a dead worker"""
+        cutoff = time.time() - self.heartbeat_timeout
+        while True:
+            doc = await self.checkpoints_collection.find_one_and_update(
+                {"last_heartbeat": {"$lt": cutoff}, "owner": {"$ne": self.worker_id}},
+                {"$set": {"owner": self.worker_id}},
+            )
+            if doc is None:
+                break
+            session = LiveSession.from_checkpoint(doc)
+            self.adopted += 1
+            self.expired += 1
+            await self._complete(session, abandoned=True)
+
+    async def _checkpoint_loop(self):
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            try:
+                await self.checkpoint()
+                await self.reap_orphans()
+            except Exception as e:
+                logger.error(f"Live session checkpoint failed: {e}")
+
+    async def start(self):
+        await self.reap_orphans()
+        self._tasks = [
+            asyncio.create_task(self.wheel.run(self._expire)),
+            asyncio.create_task(self._checkpoint_loop()),
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        # Running sessions stay checkpointed; the next heartbeat adopts them elsewhere
+        await self.checkpoint()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "worker_id": self.worker_id,
+            "active_sessions": len(self.sessions),
+            "timers": len(self.wheel),
+            "started": self.started,
+            "finished": self.finished,
+            "expired": self.expired,
+            "adopted": self.adopted,
+            "heartbeats": self.heartbeats,
+            "checkpoints": self.checkpoints,
+            "last_checkpoint_ms": self.last_checkpoint_ms,
+        }
@@ -0,0 +1,530 @@
+#!/usr/bin/env python3
+"""
+Load testing against a local copy of the app.
+
+``run`` starts the app with uvicorn in a child process (``serve``), backed by
+a local mongod or by the in-process storage engine (``memory_engine``) and with the
+Emergent LLM replaced by a stub that sleeps ``--llm-latency-ms``. It seeds
+virtual users, posts a little history for each, then drives each scenario
+with ``--concurrency`` async clients for ``--duration`` seconds and reports
+RPS and p50/p95/p99 latency per route:
+
+* ``dashboard``: dashboard, progress, history reads and some AI insights
+* ``logging``: mostly session writes across the modules, a few reads
+* ``store-burst``: wallet, items, award-coins and purchases, with every
+  client firing together once a second
+
+    python loadtest.py run [--scenario dashboard|logging|store-burst|all] [--backend memory|mongo]
+                           [--users 50] [--concurrency 32] [--duration 20] [--json results.json]
+    python loadtest.py run --url http://localhost:8001 --mongo-url mongodb://localhost:27017 --db-name taskflow
+
+With ``--url`` an already running server is targeted; users are then seeded
+straight into ``--mongo-url``/``--db-name``, so point it at a throwaway
+database.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import types
+import uuid
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from bson import ObjectId
+
+DEFAULT_DB = "taskflow_loadtest"
+STARTING_COINS = 1_000_000
+STORE_ITEMS = (("1", 200), ("2", 400), ("3", 120), ("4", 320))
+
+
+class VirtualUser:
+    """A seeded user; the store routes address users by ``_id``, the rest by ``id``"""
+
+    def __init__(self, id: str, oid: str):
+        self.id = id
+        self.oid = oid
+
+
+def make_users(count: int) -> List[VirtualUser]:
+    return [VirtualUser(str(uuid.uuid4()), str(ObjectId())) for _ in range(count)]
+
+
+async def seed_users(db, users: List[VirtualUser]):
+    now = datetime.utcnow()
+    await db.users.insert_many([
+        {
+            "_id": ObjectId(user.oid),
+            "id": user.id,
+            "email": f"load-{user.id[:8]}@example.com",
+            "username": f"load-{user.id[:8]}",
+            "created_at": now,
+            "profile": {},
+            "preferences": {},
+            "subscription_tier": "free",
+            "user_progress": {"total_coins": STARTING_COINS, "lifetime_coins": STARTING_COINS},
+        }
+        for user in users
+    ])
+
+
+# Request bodies, shaped like the app's own models
+
+def pomodoro_session(rng: random.Random, user: VirtualUser) -> Dict[str, Any]:
+    return {
+        "user_id": user.id,
+        "task_name": rng.choice(["Write report", "Review PRs", "Study", "Inbox zero"]),
+        "work_duration": 25,
+        "break_duration": 5,
+        "focus_quality_ratings": [rng.randint(4, 10) for _ in range(4)],
+        "distractions": [{"type": "phone", "duration": rng.randint(1, 5)}] if rng.random() < 0.4 else [],
+        "break_activities": ["stretch"],
+        "completion_status": rng.choice(["completed", "completed", "interrupted"]),
+        "productivity_score": round(rng.uniform(4, 10), 1),
+    }
+
+
+def meditation_session(rng: random.Random, user: VirtualUser) -> Dict[str, Any]:
+    planned = rng.choice([5, 10, 15])
+    return {
+        "user_id": user.id,
+        "meditation_type": rng.choice(["breathing", "body_scan", "loving_kindness"]),
+        "duration_planned": planned,
+        "duration_actual": planned - rng.randint(0, 3),
+        "completion_rate": round(rng.uniform(0.6, 1), 2),
+        "pre_session_state": {"stress": rng.randint(3, 9)},
+        "post_session_state": {"stress": rng.randint(1, 6)},
+        "focus_quality": rng.randint(3, 10),
+        "insights": [],
+    }
+
+
+def five_minute_session(rng: random.Random, user: VirtualUser) -> Dict[str, Any]:
+    return {
+        "user_id": user.id,
+        "task_name": "Start the draft",
+        "micro_action_taken": "Open the document",
+        "continued_beyond_five": rng.random() < 0.7,
+        "total_duration": rng.randint(5, 60),
+        "momentum_created": rng.random() < 0.6,
+        "energy_before": rng.randint(2, 7),
+        "energy_after": rng.randint(4, 9),
+    }
+
+
+def activity_session(rng: random.Random, user: VirtualUser) -> Dict[str, Any]:
+    return {
+        "user_id": user.id,
+        "activity_type": rng.choice(["walk", "run", "yoga"]),
+        "duration": rng.randint(10, 60),
+        "intensity": rng.randint(3, 8),
+        "mood_before": rng.randint(3, 7),
+        "mood_after": rng.randint(5, 9),
+        "energy_before": rng.randint(3, 7),
+        "energy_after": rng.randint(5, 9),
+        "procrastination_level_before": rng.randint(4, 9),
+        "procrastination_level_after": rng.randint(2, 6),
+    }
+
+
+def sleep_record(rng: random.Random, user: VirtualUser) -> Dict[str, Any]:
+    night = date.today() - timedelta(days=rng.randint(0, 60))
+    bedtime = datetime.combine(night, datetime.min.time()) + timedelta(hours=rng.uniform(21.5, 25))
+    duration = rng.uniform(5.5, 9)
+    return {
+        "user_id": user.id,
+        "sleep_date": night.isoformat(),
+        "bedtime": bedtime.isoformat(),
+        "wake_time": (bedtime + timedelta(hours=duration)).isoformat(),
+        "sleep_duration": round(duration, 2),
+        "sleep_quality": rng.randint(3, 10),
+        "bedtime_procrastination_minutes": rng.randint(0, 90),
+        "sleep_environment_score": rng.randint(4, 10),
+        "caffeine_intake": [],
+    }
+
+
+def thought_record(rng: random.Random, user: VirtualUser) -> Dict[str, Any]:
+    return {
+        "user_id": user.id,
+        "trigger_situation": "Big deadline tomorrow",
+        "automatic_thoughts": ["I'll never finish"],
+        "emotions": ["anxiety"],
+        "emotion_intensity": {"anxiety": rng.randint(4, 9)},
+        "physical_sensations": [],
+        "behaviors": ["avoidance"],
+        "evidence_for": [],
+        "evidence_against": ["Finished similar work before"],
+        "balanced_thoughts": ["One section at a time"],
+        "outcome_emotions": {"anxiety": rng.randint(1, 5)},
+        "coping_strategies_used": ["task breakdown"],
+        "effectiveness_rating": rng.randint(4, 9),
+    }
+
+
+def award(rng: random.Random, user: VirtualUser) -> Dict[str, Any]:
+    return {"user_id": user.oid, "task_type": rng.choice(["normal", "big"]), "module": "pomodoro"}
+
+
+def purchase(rng: random.Random, user: VirtualUser) -> Dict[str, Any]:
+    item_id, price = rng.choice(STORE_ITEMS)
+    return {"user_id": user.oid, "item_id": item_id, "price_coins": price}
+
+
+class Operation:
+    """One kind of request in a scenario, reported under its route template"""
+
+    def __init__(self, weight: float, method: str, route: str,
+                 body: Optional[Callable[[random.Random, VirtualUser], Dict[str, Any]]] = None,
+                 store: bool = False):
+        self.weight = weight
+        self.method = method
+        self.route = route
+        self.body = body
+        # Store routes take the user's ObjectId
+        self.store = store
+
+    @property
+    def name(self) -> str:
+        return f"{self.method} {self.route}"
+
+    def url(self, user: VirtualUser) -> str:
+        return self.route.replace("{user_id}", user.oid if self.store else user.id)
+
+
+class Scenario:
+    def __init__(self, name: str, operations: List[Operation], burst: Optional[Tuple[int, float]] = None):
+        self.name = name
+        self.operations = operations
+        self.weights = [operation.weight for operation in operations]
+        # (requests per client, seconds between bursts); None for a steady closed loop
+        self.burst = burst
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    scenario.name: scenario for scenario in [
+        Scenario("dashboard", [
+            Operation(40, "GET", "/api/dashboard/{user_id}"),
+            Operation(15, "GET", "/api/gamification/progress/{user_id}"),
+            Operation(10, "GET", "/api/pomodoro/sessions/{user_id}"),
+            Operation(8, "GET", "/api/sleep/data/{user_id}"),
+            Operation(7, "GET", "/api/mindfulness/sessions/{user_id}"),
+            Operation(7, "GET", "/api/timeline/{user_id}"),
+            Operation(5, "GET", "/api/gamification/achievements/{user_id}"),
+            Operation(5, "GET", "/api/analytics/insights/{user_id}"),
+            Operation(3, "POST", "/api/pomodoro/sessions", pomodoro_session),
+        ]),
+        Scenario("logging", [
+            Operation(30, "POST", "/api/pomodoro/sessions", pomodoro_session),
+            Operation(12, "POST", "/api/mindfulness/sessions", meditation_session),
+            Operation(12, "POST", "/api/five-minute/sessions", five_minute_session),
+            Operation(10, "POST", "/api/activity/sessions", activity_session),
+            Operation(8, "POST", "/api/sleep/data", sleep_record),
+            Operation(8, "POST", "/api/cbt/thought-records", thought_record),
+            Operation(10, "POST", "/api/store/award-coins", award, store=True),
+            Operation(10, "GET", "/api/dashboard/{user_id}"),
+        ]),
+        Scenario("store-burst", [
+            Operation(30, "GET", "/api/store/wallet/{user_id}", store=True),
+            Operation(20, "GET", "/api/store/items"),
+            Operation(20, "POST", "/api/store/award-coins", award, store=True),
+            Operation(20, "POST", "/api/store/purchase", purchase, store=True),
+            Operation(10, "GET", "/api/store/transactions/{user_id}", store=True),
+        ], burst=(5, 1.0)),
+    ]
+}
+
+HISTORY = [
+    Operation(1, "POST", "/api/pomodoro/sessions", pomodoro_session),
+    Operation(1, "POST", "/api/mindfulness/sessions", meditation_session),
+    Operation(1, "POST", "/api/sleep/data", sleep_record),
+    Operation(1, "POST", "/api/cbt/thought-records", thought_record),
+]
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+
+class Results:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.statuses: Dict[str, Dict[int, int]] = {}
+
+    def record(self, name: str, seconds: float, status: Optional[int]):
+        self.latencies.setdefault(name, []).append(seconds)
+        statuses = self.statuses.setdefault(name, {})
+        statuses[status or 0] = statuses.get(status or 0, 0) + 1
+        if status is None or status >= 400:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        routes = {}
+        everything: List[float] = []
+        for name, latencies in sorted(self.latencies.items()):
+            ordered = sorted(latencies)
+            everything.extend(ordered)
+            routes[name] = {
+                "requests": len(ordered),
+                "errors": self.errors.get(name, 0),
+                "rps": round(len(ordered) / elapsed, 1),
+                "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+                "p95_ms": round(percentile(ordered, 95) * 1000, 2),
+                "p99_ms": round(percentile(ordered, 99) * 1000, 2),
+                "max_ms": round(ordered[-1] * 1000, 2),
+                "statuses": {str(status): count for status, count in sorted(self.statuses[name].items())},
+            }
+        everything.sort()
+        return {
+            "seconds": round(elapsed, 2),
+            "requests": len(everything),
+            "errors": sum(self.errors.values()),
+            "rps": round(len(everything) / elapsed, 1),
+            "p50_ms": round(percentile(everything, 50) * 1000, 2),
+            "p95_ms": round(percentile(everything, 95) * 1000, 2),
+            "p99_ms": round(percentile(everything, 99) * 1000, 2),
+            "routes": routes,
+        }
+
+
+async def _request(client: httpx.AsyncClient, operation: Operation, rng: random.Random, user: VirtualUser,
+                   results: Optional[Results] = None):
+    body = operation.body(rng, user) if operation.body else None
+    started = time.perf_counter()
+    try:
+        response = await client.request(operation.method, operation.url(user), json=body)
+        status = response.status_code
+    except httpx.HTTPError:
+        status = None
+    if results is not None:
+        results.record(operation.name, time.perf_counter() - started, status)
+
+
+async def _client_loop(client: httpx.AsyncClient, scenario: Scenario, users: List[VirtualUser], rng: random.Random,
+                       started: float, deadline: float, results: Results):
+    if scenario.burst is None:
+        while time.perf_counter() < deadline:
+            operation = rng.choices(scenario.operations, scenario.weights)[0]
+            await _request(client, operation, rng, rng.choice(users), results)
+        return
+    size, interval = scenario.burst
+    tick = started
+    while tick < deadline:
+        # Every client wakes on the same tick, so each burst arrives all at once
+        await asyncio.sleep(max(0.0, tick - time.perf_counter()))
+        for operation in rng.choices(scenario.operations, scenario.weights, k=size):
+            await _request(client, operation, rng, rng.choice(users), results)
+        tick += interval
+
+
+async def run_scenario(base_url: str, scenario: Scenario, users: List[VirtualUser], concurrency: int,
+                       duration: float, seed: int = 0) -> Dict[str, Any]:
+    results = Results()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*[
+            _client_loop(client, scenario, users, random.Random(seed * 1000 + i), started, deadline, results)
+            for i in range(concurrency)
+        ])
+        # A burst scenario finishes its last burst early; rates are over the whole window
+        elapsed = max(duration, time.perf_counter() - started)
+    return results.summary(elapsed)
+
+
+async def post_history(base_url: str, users: List[VirtualUser], per_user: int, concurrency: int):
+    """Unmeasured writes so the read routes have something to return"""
+    rng = random.Random(0)
+    jobs = [(operation, user) for user in users for operation in HISTORY for _ in range(per_user)]
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        async def post(operation: Operation, user: VirtualUser):
+            async with semaphore:
+                await _request(client, operation, rng, user)
+        await asyncio.gather(*[post(operation, user) for operation, user in jobs])
+
+
+def report(name: str, summary: Dict[str, Any]):
+    print(f"\n{name}: {summary['requests']} requests in {summary['seconds']}s, {summary['rps']} rps, "
+          f"{summary['errors']} errors, p50/p95/p99 {summary['p50_ms']}/{summary['p95_ms']}/{summary['p99_ms']}ms")
+    width = max(len(route) for route in summary["routes"]) if summary["routes"] else 10
+    print(f"  {'route':<{width}} {'reqs':>7} {'rps':>8} {'p50ms':>8} {'p95ms':>8} {'p99ms':>8} {'errors':>7}")
+    for route, stats in summary["routes"].items():
+        print(f"  {route:<{width}} {stats['requests']:>7} {stats['rps']:>8} {stats['p50_ms']:>8} "
+              f"{stats['p95_ms']:>8} {stats['p99_ms']:>8} {stats['errors']:>7}")
+
+
+# -- the server under test ---------------------------------------------------
+
+def install_stub_llm(latency: float):
+    """Replace ``emergentintegrations`` with a chat client that waits ``latency`` seconds and answers"""
+    chat = types.ModuleType("emergentintegrations.llm.chat")
+
+    class UserMessage:
+        def __init__(self, text: str):
+            self.text = text
+
+    class LlmChat:
+        def __init__(self, **kwargs):
+            pass
+
+        def with_model(self, provider: str, model: str):
+            return self
+
+        async def send_message(self, message: UserMessage) -> str:
+            await asyncio.sleep(latency)
+            return "1) Focus sessions cluster in the morning. 2) Try a five-minute start. 3) Streak is growing."
+
+    chat.LlmChat, chat.UserMessage = LlmChat, UserMessage
+    sys.modules["emergentintegrations"] = types.ModuleType("emergentintegrations")
+    sys.modules["emergentintegrations.llm"] = types.ModuleType("emergentintegrations.llm")
+    sys.modules["emergentintegrations.llm.chat"] = chat
+
+
+def serve(args):
+    """Run the app under uvicorn for ``run``; seeds the users listed in ``--users-file`` at startup"""
+    import uvicorn
+
+    os.environ["MONGO_URL"] = args.mongo_url
+    os.environ["DB_NAME"] = args.db_name
+    os.environ["STORAGE_BACKEND"] = args.backend
+    if not args.real_llm:
+        os.environ.setdefault("EMERGENT_LLM_KEY", "loadtest")
+        install_stub_llm(args.llm_latency_ms / 1000)
+
+    sys.path.insert(0, str(Path(__file__).parent))
+    import server
+
+    if args.users_file:
+        users = [VirtualUser(**user) for user in json.loads(Path(args.users_file).read_text())]
+
+        app_lifespan = server.app.router.lifespan_context
+
+        @asynccontextmanager
+        async def seeded(app):
+            async with app_lifespan(app) as state:
+                await seed_users(server.db, users)
+                yield state
+
+        server.app.router.lifespan_context = seeded
+    uvicorn.run(server.app, host="127.0.0.1", port=args.port, log_level="warning", access_log=False)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _wait_ready(base_url: str, process: Optional[subprocess.Popen], timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url, timeout=2) as client:
+        while time.monotonic() < deadline:
+            if process and process.poll() is not None:
+                raise RuntimeError(f"server exited with {process.returncode} (rerun with --verbose)")
+            try:
+                if (await client.get("/api/store/items")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"server at {base_url} not ready after {timeout}s")
+
+
+async def run(args):
+    users = make_users(args.users)
+    process = None
+    users_file = None
+    if args.url:
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        base_url = args.url.rstrip("/")
+        client = AsyncIOMotorClient(args.mongo_url)
+        try:
+            await seed_users(client[args.db_name], users)
+        finally:
+            client.close()
+    else:
+        port = _free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        handle, name = tempfile.mkstemp(prefix="loadtest-users-", suffix=".json")
+        os.close(handle)
+        users_file = Path(name)
+        users_file.write_text(json.dumps([vars(user) for user in users]))
+        command = [
+            sys.executable, __file__, "serve", "--port", str(port), "--backend", args.backend,
+            "--mongo-url", args.mongo_url, "--db-name", args.db_name, "--users-file", str(users_file),
+            "--llm-latency-ms", str(args.llm_latency_ms),
+        ]
+        if args.real_llm:
+            command.append("--real-llm")
+        output = None if args.verbose else subprocess.DEVNULL
+        process = subprocess.Popen(command, stdout=output, stderr=output)
+    try:
+        await _wait_ready(base_url, process)
+        if args.history:
+            await post_history(base_url, users, args.history, args.concurrency)
+        names = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+        summaries = {}
+        for name in names:
+            summaries[name] = await run_scenario(base_url, SCENARIOS[name], users, args.concurrency, args.duration)
+            report(name, summaries[name])
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+        if users_file:
+            users_file.unlink(missing_ok=True)
+    if args.json:
+        Path(args.json).write_text(json.dumps({
+            "backend": "external" if args.url else args.backend,
+            "users": args.users,
+            "concurrency": args.concurrency,
+            "llm_latency_ms": None if args.real_llm else args.llm_latency_ms,
+            "scenarios": summaries,
+        }, indent=2))
+
+
+def _main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["run", "serve"])
+    parser.add_argument("--scenario", choices=[*SCENARIOS, "all"], default="all")
+    parser.add_argument("--backend", choices=["memory", "mongo"], default="memory")
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--db-name", default=DEFAULT_DB)
+    parser.add_argument("--url", help="target a running server instead of starting one")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--history", type=int, default=3, help="records per user and module posted before measuring")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20, help="seconds per scenario")
+    parser.add_argument("--llm-latency-ms", type=float, default=300, help="stub LLM response time")
+    parser.add_argument("--real-llm", action="store_true", help="call the Emergent LLM instead of the stub")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the server's output")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--users-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args)
+    else:
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    _main()
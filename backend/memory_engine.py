@@ -0,0 +1,1536 @@
+"""
+An in-process stand-in for Motor, selected with ``STORAGE_BACKEND=memory``.
+
+Every module takes the database handle as its storage interface, so this
+engine implements the part of Motor's database/collection/cursor API the
+app uses, with Mongo's semantics rather than Python's where they differ:
+
+* queries: dotted paths through sub-documents and arrays, ``$eq $ne $gt
+  $gte $lt $lte $in $nin $exists $type $size $all $elemMatch $regex $not
+  $and $or $nor``, comparisons in BSON type order
+* cursors: ``sort`` (including ``$natural``), ``skip``, ``limit``,
+  ``to_list`` and ``async for``; projections in both modes
+* writes: ``$set $unset $inc $mul $min $max $push ($each/$slice) $addToSet
+  $pull $setOnInsert``, upserts seeded from the filter's equalities,
+  ``find_one_and_*``, ``bulk_write`` with ordered/unordered error reporting
+* unique indexes (sparse and partial) raising ``DuplicateKeyError`` /
+  ``BulkWriteError`` with code 11000; the first key of every index is also
+  used to narrow equality and ``$in`` lookups so reads are not full scans
+* ``aggregate`` with ``$match $project $addFields $set $group $sort $limit
+  $skip $count $unwind $replaceRoot`` and the expression operators the
+  app's pipelines use
+
+Documents are stored the way a BSON round trip leaves them (``_id`` first,
+datetimes naive UTC truncated to milliseconds, tuples as lists, ``str`` and
+``int`` subclasses as plain values) and values the driver cannot encode,
+such as ``datetime.date``, are rejected with ``InvalidDocument``. Each
+operation runs without awaiting, so it is atomic with respect to other
+coroutines, as a single-document write is on the server. Anything not
+covered (views, time series, change streams, transactions) raises
+``NotImplementedError``.
+"""
+
+import math
+import re
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from bson.binary import Binary
+from bson.decimal128 import Decimal128
+from bson.errors import InvalidDocument
+from bson.int64 import Int64
+from bson.regex import Regex
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, ReturnDocument, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError, OperationFailure, WriteError
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+DUPLICATE_KEY = 11000
+MISSING = object()
+
+
+# -- values ------------------------------------------------------------------
+
+def encode(value: Any) -> Any:
+    """A value as it would come back from Mongo; raises ``InvalidDocument`` like the driver"""
+    if isinstance(value, dict):
+        out = {}
+        for key, item in value.items():
+            if not isinstance(key, str):
+                raise InvalidDocument(f"documents must have only string keys, key was {key!r}")
+            out[key] = encode(item)
+        return out
+    if isinstance(value, (list, tuple)):
+        return [encode(item) for item in value]
+    if value is None or isinstance(value, (bool, ObjectId, Decimal128, Regex, Int64, re.Pattern)):
+        return value
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.replace(microsecond=value.microsecond // 1000 * 1000)
+    if isinstance(value, str):
+        return value if type(value) is str else value + ""
+    if isinstance(value, int):
+        return value if type(value) is int else int(value)
+    if isinstance(value, float):
+        return value
+    if isinstance(value, (bytes, Binary)):
+        return value
+    raise InvalidDocument(f"cannot encode object: {value!r}, of type: {type(value)}")
+
+
+def copy(value: Any) -> Any:
+    """Deep copy of an already encoded value; leaves are immutable"""
+    if isinstance(value, dict):
+        return {key: copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy(item) for item in value]
+    return value
+
+
+def _rank(value: Any) -> int:
+    """BSON comparison order of the value's type"""
+    if value is None or value is MISSING:
+        return 1
+    if isinstance(value, bool):
+        return 8
+    if isinstance(value, (int, float, Decimal128)):
+        return 2
+    if isinstance(value, str):
+        return 3
+    if isinstance(value, dict):
+        return 4
+    if isinstance(value, list):
+        return 5
+    if isinstance(value, (bytes, Binary)):
+        return 6
+    if isinstance(value, ObjectId):
+        return 7
+    if isinstance(value, datetime):
+        return 9
+    if isinstance(value, (Regex, re.Pattern)):
+        return 11
+    return 12
+
+
+def sort_key(value: Any) -> Tuple:
+    rank = _rank(value)
+    if rank == 1:
+        return (1,)
+    if rank == 2:
+        return (2, float(value.to_decimal()) if isinstance(value, Decimal128) else value)
+    if rank == 4:
+        return (4, tuple((key, sort_key(item)) for key, item in value.items()))
+    if rank == 5:
+        return (5, tuple(sort_key(item) for item in value))
+    if rank in (11, 12):
+        return (rank, str(value))
+    return (rank, value)
+
+
+def compare(a: Any, b: Any) -> int:
+    ka, kb = sort_key(a), sort_key(b)
+    return (ka > kb) - (ka < kb)
+
+
+def equal(a: Any, b: Any) -> bool:
+    return _rank(a) == _rank(b) and compare(a, b) == 0
+
+
+def hashable(value: Any) -> Any:
+    if isinstance(value, dict):
+        return ("d", tuple((key, hashable(item)) for key, item in value.items()))
+    if isinstance(value, list):
+        return ("l", tuple(hashable(item) for item in value))
+    if isinstance(value, bool):
+        return ("b", value)
+    if isinstance(value, (int, float)):
+        return ("n", float(value))
+    return value
+
+
+def values_at(doc: Any, path: List[str]) -> List[Any]:
+    """Every value a dotted path reaches, expanding arrays on the way; empty when missing"""
+    if not path:
+        return [doc]
+    head, rest = path[0], path[1:]
+    if isinstance(doc, dict):
+        return values_at(doc[head], rest) if head in doc else []
+    if isinstance(doc, list):
+        found = []
+        if head.isdigit() and int(head) < len(doc):
+            found.extend(values_at(doc[int(head)], rest))
+        for item in doc:
+            if isinstance(item, dict):
+                found.extend(values_at(item, path))
+        return found
+    return []
+
+
+def get_path(doc: Dict[str, Any], path: str, default: Any = MISSING) -> Any:
+    current: Any = doc
+    for part in path.split("."):
+        if isinstance(current, dict) and part in current:
+            current = current[part]
+        elif isinstance(current, list) and part.isdigit() and int(part) < len(current):
+            current = current[int(part)]
+        else:
+            return default
+    return current
+
+
+def _container(doc: Dict[str, Any], path: str, create: bool) -> Tuple[Any, str]:
+    parts = path.split(".")
+    current: Any = doc
+    for part in parts[:-1]:
+        if "$" in part:
+            raise NotImplementedError(f"positional update paths are not supported: {path}")
+        if isinstance(current, list) and part.isdigit():
+            index = int(part)
+            while create and len(current) <= index:
+                current.append(None)
+            current = current[index] if index < len(current) else None
+        elif isinstance(current, dict):
+            if part not in current or current[part] is None:
+                if not create:
+                    return None, parts[-1]
+                current[part] = {}
+            current = current[part]
+        else:
+            current = None
+        if not isinstance(current, (dict, list)):
+            if create:
+                raise WriteError(f"Cannot create field '{parts[-1]}' in element {{{part}: {current!r}}}", 28)
+            return None, parts[-1]
+    return current, parts[-1]
+
+
+def set_path(doc: Dict[str, Any], path: str, value: Any):
+    container, last = _container(doc, path, create=True)
+    if isinstance(container, list):
+        index = int(last)
+        while len(container) <= index:
+            container.append(None)
+        container[index] = value
+    else:
+        container[last] = value
+
+
+def unset_path(doc: Dict[str, Any], path: str):
+    container, last = _container(doc, path, create=False)
+    if isinstance(container, dict):
+        container.pop(last, None)
+    elif isinstance(container, list) and last.isdigit() and int(last) < len(container):
+        container[int(last)] = None
+
+
+# -- queries -----------------------------------------------------------------
+
+TYPE_NAMES = {
+    "double": (float,), "string": (str,), "object": (dict,), "array": (list,), "objectId": (ObjectId,),
+    "bool": (bool,), "date": (datetime,), "null": (type(None),), "int": (int,), "long": (int, Int64),
+    "decimal": (Decimal128,), "regex": (Regex, re.Pattern), "binData": (bytes, Binary),
+}
+TYPE_NUMBERS = {1: "double", 2: "string", 3: "object", 4: "array", 5: "binData", 7: "objectId", 8: "bool",
+                9: "date", 10: "null", 11: "regex", 16: "int", 18: "long", 19: "decimal"}
+
+
+def _is_type(value: Any, name: Any) -> bool:
+    if isinstance(name, int):
+        name = TYPE_NUMBERS.get(name)
+    if name == "number":
+        return isinstance(value, (int, float, Decimal128)) and not isinstance(value, bool)
+    types = TYPE_NAMES.get(name)
+    if types is None:
+        raise NotImplementedError(f"$type {name!r} is not supported")
+    if bool in types:
+        return isinstance(value, bool)
+    return isinstance(value, types) and not isinstance(value, bool)
+
+
+def _regex(pattern: Any, options: str = "") -> re.Pattern:
+    if isinstance(pattern, re.Pattern):
+        return pattern
+    if isinstance(pattern, Regex):
+        return pattern.try_compile()
+    flags = 0
+    for option, flag in (("i", re.I), ("m", re.M), ("s", re.S), ("x", re.X)):
+        if option in options:
+            flags |= flag
+    return re.compile(pattern, flags)
+
+
+def _candidates(values: List[Any]) -> List[Any]:
+    """Values compared by a query: each value and, for arrays, each element too"""
+    out = []
+    for value in values:
+        out.append(value)
+        if isinstance(value, list):
+            out.extend(value)
+    return out
+
+
+def _operator_match(values: List[Any], operator: str, arg: Any, spec: Dict[str, Any]) -> bool:
+    if operator == "$eq":
+        if arg is None and not values:
+            return True
+        return any(equal(value, arg) for value in _candidates(values))
+    if operator == "$ne":
+        return not _operator_match(values, "$eq", arg, spec)
+    if operator in ("$gt", "$gte", "$lt", "$lte"):
+        for value in _candidates(values):
+            if _rank(value) != _rank(arg):
+                continue
+            result = compare(value, arg)
+            if (operator == "$gt" and result > 0 or operator == "$gte" and result >= 0
+                    or operator == "$lt" and result < 0 or operator == "$lte" and result <= 0):
+                return True
+        return False
+    if operator == "$in":
+        for item in arg:
+            if isinstance(item, (re.Pattern, Regex)):
+                if any(isinstance(value, str) and _regex(item).search(value) for value in _candidates(values)):
+                    return True
+            elif _operator_match(values, "$eq", item, spec):
+                return True
+        return False
+    if operator == "$nin":
+        return not _operator_match(values, "$in", arg, spec)
+    if operator == "$exists":
+        return bool(values) == bool(arg)
+    if operator == "$type":
+        names = arg if isinstance(arg, list) else [arg]
+        return any(_is_type(value, name) for value in _candidates(values) for name in names)
+    if operator == "$size":
+        return any(isinstance(value, list) and len(value) == arg for value in values)
+    if operator == "$all":
+        return all(_operator_match(values, "$eq", item, spec) for item in arg)
+    if operator == "$elemMatch":
+        for value in values:
+            for item in value if isinstance(value, list) else []:
+                if isinstance(item, dict) and not _is_operator_spec(arg):
+                    if matches(item, arg):
+                        return True
+                elif _value_match([item], arg):
+                    return True
+        return False
+    if operator == "$regex":
+        pattern = _regex(arg, spec.get("$options", ""))
+        return any(isinstance(value, str) and pattern.search(value) for value in _candidates(values))
+    if operator == "$options":
+        return True
+    if operator == "$not":
+        return not _value_match(values, arg)
+    if operator == "$mod":
+        divisor, remainder = arg
+        return any(isinstance(value, (int, float)) and not isinstance(value, bool) and value % divisor == remainder
+                   for value in _candidates(values))
+    raise NotImplementedError(f"query operator {operator} is not supported")
+
+
+def _is_operator_spec(spec: Any) -> bool:
+    return isinstance(spec, dict) and bool(spec) and all(key.startswith("$") for key in spec)
+
+
+def _value_match(values: List[Any], spec: Any) -> bool:
+    if isinstance(spec, (re.Pattern, Regex)):
+        return _operator_match(values, "$regex", spec, {})
+    if _is_operator_spec(spec):
+        return all(_operator_match(values, operator, arg, spec) for operator, arg in spec.items())
+    return _operator_match(values, "$eq", spec, {})
+
+
+def matches(doc: Dict[str, Any], query: Optional[Dict[str, Any]]) -> bool:
+    for key, spec in (query or {}).items():
+        if key == "$and":
+            if not all(matches(doc, sub) for sub in spec):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, sub) for sub in spec):
+                return False
+        elif key == "$nor":
+            if any(matches(doc, sub) for sub in spec):
+                return False
+        elif key == "$expr":
+            if not truthy(evaluate(spec, doc)):
+                return False
+        elif key in ("$comment",):
+            continue
+        elif key.startswith("$"):
+            raise NotImplementedError(f"query operator {key} is not supported")
+        elif not _value_match(values_at(doc, key.split(".")), spec):
+            return False
+    return True
+
+
+def project(doc: Dict[str, Any], projection: Optional[Any]) -> Dict[str, Any]:
+    if not projection:
+        return copy(doc)
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    include_id = bool(projection.get("_id", 1))
+    fields = {key: value for key, value in projection.items() if key != "_id"}
+    if any(isinstance(value, dict) for value in fields.values()):
+        raise NotImplementedError("projection operators are not supported")
+    if fields and all(value for value in fields.values()):
+        out: Dict[str, Any] = {}
+        if include_id and "_id" in doc:
+            out["_id"] = copy(doc["_id"])
+        for path in fields:
+            _project_into(out, doc, path.split("."))
+        return out
+    out = copy(doc)
+    for path in fields:
+        unset_path(out, path)
+    if not include_id:
+        out.pop("_id", None)
+    return out
+
+
+def _project_into(out: Dict[str, Any], doc: Any, parts: List[str]):
+    if not isinstance(doc, dict) or parts[0] not in doc:
+        return
+    value = doc[parts[0]]
+    if len(parts) == 1:
+        out[parts[0]] = copy(value)
+    elif isinstance(value, dict):
+        _project_into(out.setdefault(parts[0], {}), value, parts[1:])
+    elif isinstance(value, list):
+        items = out.setdefault(parts[0], [])
+        for item in value:
+            if isinstance(item, dict):
+                projected: Dict[str, Any] = {}
+                _project_into(projected, item, parts[1:])
+                items.append(projected)
+
+
+def normalize_sort(key_or_list: Any, direction: Any = None) -> List[Tuple[str, int]]:
+    if key_or_list is None:
+        return []
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction if direction is not None else 1)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return [(key, value) for key, value in key_or_list]
+
+
+def sort_documents(docs: List[Dict[str, Any]], spec: List[Tuple[str, int]]) -> List[Dict[str, Any]]:
+    for field, direction in reversed(spec):
+        if field == "$natural":
+            if direction < 0:
+                docs = docs[::-1]
+            continue
+        reverse = direction < 0
+
+        def key(doc, field=field, reverse=reverse):
+            found = values_at(doc, field.split("."))
+            if not found:
+                return sort_key(None)
+            if isinstance(found[0], list) and len(found) == 1:
+                found = found[0] or [None]
+            # Arrays sort by their smallest element ascending and their largest descending
+            return max(map(sort_key, found)) if reverse else min(map(sort_key, found))
+
+        docs = sorted(docs, key=key, reverse=reverse)
+    return docs
+
+
+# -- updates -----------------------------------------------------------------
+
+def _number(value: Any, operator: str, path: str):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise WriteError(f"Cannot apply {operator} to a value of non-numeric type at '{path}'", 14)
+
+
+def apply_update(doc: Dict[str, Any], update: Any, inserting: bool = False) -> Dict[str, Any]:
+    if isinstance(update, list):
+        for stage in update:
+            if next(iter(stage)) not in ("$set", "$addFields", "$unset", "$project", "$replaceRoot", "$replaceWith"):
+                raise NotImplementedError(f"update pipeline stage {next(iter(stage))} is not supported")
+        updated = encode(run_pipeline([copy(doc)], update)[0])
+        if "_id" in doc:
+            updated = {"_id": doc["_id"], **{key: value for key, value in updated.items() if key != "_id"}}
+        return updated
+    if not any(key.startswith("$") for key in update):
+        replaced = encode(update)
+        if "_id" in doc:
+            if "_id" in replaced and not equal(replaced["_id"], doc["_id"]):
+                raise WriteError("Performing an update on the path '_id' would modify the immutable field '_id'", 66)
+            replaced = {"_id": doc["_id"], **{key: value for key, value in replaced.items() if key != "_id"}}
+        return replaced
+    doc = copy(doc)
+    for operator, fields in update.items():
+        fields = encode(fields)
+        for path, arg in fields.items():
+            current = get_path(doc, path)
+            if operator == "$set":
+                set_path(doc, path, arg)
+            elif operator == "$setOnInsert":
+                if inserting:
+                    set_path(doc, path, arg)
+            elif operator == "$unset":
+                unset_path(doc, path)
+            elif operator in ("$inc", "$mul"):
+                _number(arg, operator, path)
+                if current is MISSING:
+                    set_path(doc, path, arg if operator == "$inc" else 0 * arg)
+                else:
+                    _number(current, operator, path)
+                    set_path(doc, path, current + arg if operator == "$inc" else current * arg)
+            elif operator in ("$min", "$max"):
+                if current is MISSING or (compare(arg, current) < 0 if operator == "$min" else compare(arg, current) > 0):
+                    set_path(doc, path, arg)
+            elif operator in ("$push", "$addToSet"):
+                if current is MISSING:
+                    current = []
+                elif not isinstance(current, list):
+                    raise WriteError(f"The field '{path}' must be an array", 2)
+                else:
+                    current = list(current)
+                items = arg["$each"] if isinstance(arg, dict) and "$each" in arg else [arg]
+                for item in items:
+                    if operator == "$push" or not any(equal(item, existing) for existing in current):
+                        current.append(item)
+                if isinstance(arg, dict) and "$sort" in arg:
+                    spec = arg["$sort"]
+                    if isinstance(spec, dict):
+                        current = sort_documents(current, list(spec.items()))
+                    else:
+                        current = sorted(current, key=sort_key, reverse=spec < 0)
+                if isinstance(arg, dict) and "$slice" in arg:
+                    limit = arg["$slice"]
+                    current = current[limit:] if limit < 0 else current[:limit]
+                set_path(doc, path, current)
+            elif operator == "$pull":
+                if isinstance(current, list):
+                    if isinstance(arg, dict) and not _is_operator_spec(arg):
+                        kept = [item for item in current if not (isinstance(item, dict) and matches(item, arg))]
+                    else:
+                        kept = [item for item in current if not _value_match([item], arg)]
+                    set_path(doc, path, kept)
+            elif operator == "$rename":
+                if current is not MISSING:
+                    unset_path(doc, path)
+                    set_path(doc, arg, current)
+            elif operator == "$currentDate":
+                set_path(doc, path, encode(datetime.utcnow()))
+            else:
+                raise NotImplementedError(f"update operator {operator} is not supported")
+    return doc
+
+
+def upsert_seed(query: Dict[str, Any]) -> Dict[str, Any]:
+    """The document an upsert starts from: the filter's equality conditions"""
+    seed: Dict[str, Any] = {}
+    for key, spec in (query or {}).items():
+        if key == "$and":
+            for sub in spec:
+                for path, value in upsert_seed(sub).items():
+                    seed[path] = value
+        elif key.startswith("$"):
+            continue
+        elif isinstance(spec, dict) and _is_operator_spec(spec):
+            if "$eq" in spec:
+                set_path(seed, key, encode(spec["$eq"]))
+        else:
+            set_path(seed, key, encode(spec))
+    return seed
+
+
+# -- aggregation expressions -------------------------------------------------
+
+def truthy(value: Any) -> bool:
+    return value not in (None, False, 0, MISSING) and not (isinstance(value, float) and value == 0.0)
+
+
+def _date_parts(value: datetime) -> Dict[str, int]:
+    iso = value.isocalendar()
+    return {
+        "year": value.year, "month": value.month, "day": value.day, "hour": value.hour, "minute": value.minute,
+        "second": value.second, "millisecond": value.microsecond // 1000, "isoWeek": iso[1],
+        "isoWeekYear": iso[0], "isoDayOfWeek": iso[2], "dayOfWeek": value.isoweekday() % 7 + 1,
+        "dayOfYear": value.timetuple().tm_yday,
+    }
+
+
+def _convert(value: Any, to: str) -> Any:
+    if to == "date":
+        if isinstance(value, datetime):
+            return value
+        if isinstance(value, str):
+            return encode(datetime.fromisoformat(value.replace("Z", "+00:00")))
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return datetime(1970, 1, 1) + timedelta(milliseconds=value)
+        if isinstance(value, ObjectId):
+            return value.generation_time.replace(tzinfo=None)
+    elif to == "string":
+        if isinstance(value, datetime):
+            return value.isoformat(timespec="milliseconds") + "Z"
+        return value if isinstance(value, str) else str(value).lower() if isinstance(value, bool) else str(value)
+    elif to in ("double", "decimal"):
+        return float(value)
+    elif to in ("int", "long"):
+        return int(float(value)) if isinstance(value, str) else int(value)
+    elif to == "bool":
+        return truthy(value)
+    elif to == "objectId":
+        return ObjectId(value)
+    raise ValueError(f"cannot convert {value!r} to {to}")
+
+
+STRFTIME = {"%Y": "%Y", "%m": "%m", "%d": "%d", "%H": "%H", "%M": "%M", "%S": "%S", "%j": "%j"}
+
+
+def evaluate(expression: Any, doc: Dict[str, Any], variables: Optional[Dict[str, Any]] = None) -> Any:
+    if isinstance(expression, str):
+        if expression.startswith("$$"):
+            name, _, rest = expression[2:].partition(".")
+            value = (variables or {}).get(name, MISSING) if name != "ROOT" else doc
+            return get_path(value, rest) if rest and isinstance(value, dict) else value
+        if expression.startswith("$"):
+            found = values_at(doc, expression[1:].split("."))
+            if not found:
+                return MISSING
+            return found[0] if len(found) == 1 and not _through_array(doc, expression[1:]) else found
+        return expression
+    if isinstance(expression, list):
+        return [evaluate(item, doc, variables) for item in expression]
+    if not isinstance(expression, dict):
+        return expression
+    if len(expression) == 1 and next(iter(expression)).startswith("$"):
+        operator, arg = next(iter(expression.items()))
+        return _operator(operator, arg, doc, variables)
+    return {key: _present(evaluate(value, doc, variables)) for key, value in expression.items()}
+
+
+def _through_array(doc: Dict[str, Any], path: str) -> bool:
+    current: Any = doc
+    for part in path.split(".")[:-1]:
+        if isinstance(current, list):
+            return True
+        if not isinstance(current, dict):
+            return False
+        current = current.get(part)
+    return isinstance(current, list) and "." in path
+
+
+def _present(value: Any) -> Any:
+    return None if value is MISSING else value
+
+
+def _operator(operator: str, arg: Any, doc: Dict[str, Any], variables: Optional[Dict[str, Any]]) -> Any:
+    def ev(item):
+        return evaluate(item, doc, variables)
+
+    def args():
+        return [_present(ev(item)) for item in (arg if isinstance(arg, list) else [arg])]
+
+    if operator == "$literal":
+        return arg
+    if operator in ("$add", "$multiply", "$subtract", "$divide", "$mod"):
+        values = args()
+        if any(value is None for value in values):
+            return None
+        if operator == "$add":
+            dates = [value for value in values if isinstance(value, datetime)]
+            total = sum(value for value in values if not isinstance(value, datetime))
+            return dates[0] + timedelta(milliseconds=total) if dates else total
+        if operator == "$multiply":
+            return math.prod(values)
+        a, b = values
+        if operator == "$subtract":
+            if isinstance(a, datetime) and isinstance(b, datetime):
+                return int((a - b) / timedelta(milliseconds=1))
+            if isinstance(a, datetime):
+                return a - timedelta(milliseconds=b)
+            return a - b
+        return a / b if operator == "$divide" else a % b
+    if operator in ("$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$cmp"):
+        a, b = args()
+        result = compare(a, b)
+        return {"$eq": result == 0, "$ne": result != 0, "$gt": result > 0, "$gte": result >= 0,
+                "$lt": result < 0, "$lte": result <= 0, "$cmp": result}[operator]
+    if operator == "$and":
+        return all(truthy(value) for value in args())
+    if operator == "$or":
+        return any(truthy(value) for value in args())
+    if operator == "$not":
+        return not truthy(args()[0])
+    if operator == "$ifNull":
+        values = [ev(item) for item in arg]
+        for value in values[:-1]:
+            if value is not MISSING and value is not None:
+                return value
+        return _present(values[-1])
+    if operator == "$cond":
+        if isinstance(arg, dict):
+            arg = [arg["if"], arg["then"], arg["else"]]
+        return ev(arg[1]) if truthy(ev(arg[0])) else ev(arg[2])
+    if operator == "$switch":
+        for branch in arg["branches"]:
+            if truthy(ev(branch["case"])):
+                return ev(branch["then"])
+        if "default" in arg:
+            return ev(arg["default"])
+        raise OperationFailure("$switch could not find a matching branch for an input, and no default was specified")
+    if operator == "$type":
+        value = ev(arg[0] if isinstance(arg, list) else arg)
+        if value is MISSING:
+            return "missing"
+        for name in ("bool", "date", "objectId", "string", "object", "array", "null", "double", "int", "decimal"):
+            if _is_type(value, name):
+                return name
+        return "unknown"
+    if operator == "$substrBytes" or operator == "$substr":
+        value, start, length = args()
+        value = "" if value is None else str(value)
+        return value.encode()[start:start + length if length >= 0 else None].decode(errors="ignore")
+    if operator in ("$toLower", "$toUpper"):
+        value = args()[0]
+        value = "" if value is None else str(value)
+        return value.lower() if operator == "$toLower" else value.upper()
+    if operator == "$concat":
+        values = args()
+        return None if any(value is None for value in values) else "".join(values)
+    if operator == "$size":
+        value = args()[0]
+        if not isinstance(value, list):
+            raise OperationFailure("The argument to $size must be an array")
+        return len(value)
+    if operator in ("$round", "$trunc"):
+        values = args()
+        value, places = values[0], values[1] if len(values) > 1 else 0
+        if value is None:
+            return None
+        if operator == "$trunc":
+            factor = 10 ** places
+            return math.trunc(value * factor) / factor if places else math.trunc(value)
+        rounded = float(round(Decimal(repr(value)), places)) if isinstance(value, float) else round(value, places)
+        return int(rounded) if isinstance(value, int) and places >= 0 else rounded
+    if operator in ("$abs", "$floor", "$ceil"):
+        value = args()[0]
+        if value is None:
+            return None
+        return {"$abs": abs, "$floor": math.floor, "$ceil": math.ceil}[operator](value)
+    if operator in ("$sum", "$avg", "$min", "$max") and isinstance(arg, list) or operator in ("$first", "$last"):
+        values = args()
+        if len(values) == 1 and isinstance(values[0], list):
+            values = values[0]
+        if operator in ("$first", "$last"):
+            return (values[0] if operator == "$first" else values[-1]) if values else None
+        return _accumulate(operator, [value for value in values if value is not None])
+    if operator in ("$sum", "$avg", "$min", "$max"):
+        value = _present(ev(arg))
+        values = value if isinstance(value, list) else [value]
+        return _accumulate(operator, [value for value in values if value is not None])
+    if operator in ("$year", "$month", "$dayOfMonth", "$hour", "$minute", "$second", "$millisecond",
+                    "$isoWeek", "$isoWeekYear", "$isoDayOfWeek", "$dayOfWeek", "$dayOfYear"):
+        value = ev(arg["date"] if isinstance(arg, dict) else arg)
+        if value is None or value is MISSING:
+            return None
+        name = {"$dayOfMonth": "day"}.get(operator, operator[1:])
+        return _date_parts(value)[name]
+    if operator == "$dateToString":
+        value = ev(arg["date"])
+        if value is None or value is MISSING:
+            return _present(ev(arg["onNull"])) if "onNull" in arg else None
+        pattern = arg.get("format", "%Y-%m-%dT%H:%M:%S.%LZ")
+        pattern = pattern.replace("%L", f"{value.microsecond // 1000:03d}")
+        pattern = pattern.replace("%V", f"{value.isocalendar()[1]:02d}").replace("%G", str(value.isocalendar()[0]))
+        return value.strftime(pattern)
+    if operator == "$dateFromParts":
+        parts = {key: _present(ev(value)) for key, value in arg.items()}
+        if "isoWeekYear" in parts:
+            base = datetime.fromisocalendar(parts["isoWeekYear"], parts.get("isoWeek", 1), parts.get("isoDayOfWeek", 1))
+        else:
+            year, month = parts["year"], parts.get("month", 1)
+            year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+            base = datetime(year, month, 1) + timedelta(days=parts.get("day", 1) - 1)
+        return base + timedelta(hours=parts.get("hour", 0), minutes=parts.get("minute", 0),
+                                seconds=parts.get("second", 0), milliseconds=parts.get("millisecond", 0))
+    if operator in ("$toDate", "$toString", "$toInt", "$toDouble", "$toLong", "$toBool", "$toObjectId"):
+        to = {"$toDate": "date", "$toString": "string", "$toInt": "int", "$toDouble": "double",
+              "$toLong": "long", "$toBool": "bool", "$toObjectId": "objectId"}[operator]
+        value = args()[0]
+        if value is None:
+            return None
+        try:
+            return _convert(value, to)
+        except (ValueError, TypeError) as e:
+            raise OperationFailure(f"Failed to convert {value!r} to {to}: {e}")
+    if operator == "$convert":
+        value = _present(ev(arg["input"]))
+        if value is None:
+            return _present(ev(arg["onNull"])) if "onNull" in arg else None
+        try:
+            return _convert(value, arg["to"])
+        except (ValueError, TypeError, OverflowError) as e:
+            if "onError" in arg:
+                return _present(ev(arg["onError"]))
+            raise OperationFailure(f"Failed to convert {value!r} to {arg['to']}: {e}")
+    if operator == "$mergeObjects":
+        merged: Dict[str, Any] = {}
+        for value in args():
+            values = value if isinstance(value, list) else [value]
+            for item in values:
+                if isinstance(item, dict):
+                    merged.update(item)
+        return merged
+    if operator == "$arrayToObject":
+        value = args()[0]
+        items = value[0] if len(value) == 1 and isinstance(value[0], list) and value[0] and isinstance(value[0][0], (list, dict)) else value
+        out = {}
+        for item in items or []:
+            if isinstance(item, dict):
+                out[item["k"]] = item["v"]
+            else:
+                out[item[0]] = item[1]
+        return out
+    if operator == "$objectToArray":
+        value = args()[0]
+        return [{"k": key, "v": item} for key, item in (value or {}).items()]
+    if operator == "$zip":
+        inputs = [_present(ev(item)) for item in arg["inputs"]]
+        if any(value is None for value in inputs):
+            return None
+        if arg.get("useLongestLength"):
+            length = max(map(len, inputs), default=0)
+            defaults = arg.get("defaults") or [None] * len(inputs)
+            return [[items[i] if i < len(items) else defaults[j] for j, items in enumerate(inputs)]
+                    for i in range(length)]
+        return [list(row) for row in zip(*inputs)]
+    if operator == "$filter":
+        items = _present(ev(arg["input"]))
+        name = arg.get("as", "this")
+        if items is None:
+            return None
+        return [item for item in items if truthy(evaluate(arg["cond"], doc, {**(variables or {}), name: item}))]
+    if operator == "$map":
+        items = _present(ev(arg["input"]))
+        name = arg.get("as", "this")
+        if items is None:
+            return None
+        return [_present(evaluate(arg["in"], doc, {**(variables or {}), name: item})) for item in items]
+    if operator == "$in":
+        value, items = args()
+        return any(equal(value, item) for item in items or [])
+    if operator == "$arrayElemAt":
+        items, index = args()
+        if items is None:
+            return None
+        return items[index] if -len(items) <= index < len(items) else MISSING
+    raise NotImplementedError(f"aggregation operator {operator} is not supported")
+
+
+def _accumulate(operator: str, values: List[Any]) -> Any:
+    numbers = [value for value in values if isinstance(value, (int, float)) and not isinstance(value, bool)]
+    if operator == "$sum":
+        return sum(numbers)
+    if operator == "$avg":
+        return sum(numbers) / len(numbers) if numbers else None
+    if not values:
+        return None
+    pick = min if operator == "$min" else max
+    return pick(values, key=sort_key)
+
+
+class _Group:
+    """Running state of one ``$group`` output document"""
+
+    def __init__(self, key: Any, spec: Dict[str, Any]):
+        self.key = key
+        self.spec = spec
+        self.values: Dict[str, List[Any]] = {field: [] for field in spec}
+
+    def add(self, doc: Dict[str, Any]):
+        for field, accumulator in self.spec.items():
+            operator, arg = next(iter(accumulator.items()))
+            self.values[field].append(evaluate(arg, doc))
+
+    def result(self) -> Dict[str, Any]:
+        out = {"_id": self.key}
+        for field, accumulator in self.spec.items():
+            operator = next(iter(accumulator))
+            values = self.values[field]
+            present = [value for value in values if value is not MISSING and value is not None]
+            if operator == "$sum":
+                out[field] = sum(value for value in present if isinstance(value, (int, float)) and not isinstance(value, bool))
+            elif operator == "$count":
+                out[field] = len(values)
+            elif operator == "$avg":
+                numbers = [value for value in present if isinstance(value, (int, float)) and not isinstance(value, bool)]
+                out[field] = sum(numbers) / len(numbers) if numbers else None
+            elif operator in ("$min", "$max"):
+                out[field] = _accumulate(operator, present)
+            elif operator == "$first":
+                out[field] = _present(values[0]) if values else None
+            elif operator == "$last":
+                out[field] = _present(values[-1]) if values else None
+            elif operator == "$push":
+                out[field] = [_present(value) for value in values if value is not MISSING]
+            elif operator == "$addToSet":
+                unique: List[Any] = []
+                for value in values:
+                    if value is not MISSING and not any(equal(value, existing) for existing in unique):
+                        unique.append(value)
+                out[field] = unique
+            else:
+                raise NotImplementedError(f"$group accumulator {operator} is not supported")
+        return out
+
+
+def run_pipeline(docs: List[Dict[str, Any]], pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    for stage in pipeline:
+        name, spec = next(iter(stage.items()))
+        if name == "$match":
+            docs = [doc for doc in docs if matches(doc, spec)]
+        elif name == "$sort":
+            docs = sort_documents(docs, list(spec.items()))
+        elif name == "$limit":
+            docs = docs[:spec]
+        elif name == "$skip":
+            docs = docs[spec:]
+        elif name == "$count":
+            docs = [{spec: len(docs)}] if docs else []
+        elif name in ("$addFields", "$set"):
+            out = []
+            for doc in docs:
+                # Every expression sees the stage's input, not the fields set before it
+                values = [(path, evaluate(expression, doc)) for path, expression in spec.items()]
+                doc = copy(doc)
+                for path, value in values:
+                    if value is MISSING:
+                        unset_path(doc, path)
+                    else:
+                        set_path(doc, path, value)
+                out.append(doc)
+            docs = out
+        elif name == "$project":
+            docs = [_project_stage(doc, spec) for doc in docs]
+        elif name == "$unset":
+            fields = [spec] if isinstance(spec, str) else spec
+            docs = [project(doc, {field: 0 for field in fields}) for doc in docs]
+        elif name == "$replaceRoot" or name == "$replaceWith":
+            expression = spec["newRoot"] if name == "$replaceRoot" else spec
+            docs = [evaluate(expression, doc) for doc in docs]
+        elif name == "$unwind":
+            path = spec if isinstance(spec, str) else spec["path"]
+            keep_empty = isinstance(spec, dict) and spec.get("preserveNullAndEmptyArrays", False)
+            field = path[1:]
+            out = []
+            for doc in docs:
+                value = get_path(doc, field)
+                if isinstance(value, list) and value:
+                    for item in value:
+                        unwound = copy(doc)
+                        set_path(unwound, field, item)
+                        out.append(unwound)
+                elif isinstance(value, list) or value is MISSING or value is None:
+                    if keep_empty:
+                        out.append(copy(doc))
+                else:
+                    out.append(copy(doc))
+            docs = out
+        elif name == "$group":
+            accumulators = {field: value for field, value in spec.items() if field != "_id"}
+            groups: Dict[Any, _Group] = {}
+            for doc in docs:
+                key = _present(evaluate(spec["_id"], doc))
+                marker = hashable(key)
+                if marker not in groups:
+                    groups[marker] = _Group(key, accumulators)
+                groups[marker].add(doc)
+            docs = [group.result() for group in groups.values()]
+        else:
+            raise NotImplementedError(f"aggregation stage {name} is not supported")
+    return docs
+
+
+def _project_stage(doc: Dict[str, Any], spec: Dict[str, Any]) -> Dict[str, Any]:
+    plain = all(value in (0, 1, True, False) for value in spec.values())
+    if plain:
+        return project(doc, spec)
+    out: Dict[str, Any] = {}
+    if spec.get("_id", 1) not in (0, False) and "_id" in doc and "_id" not in spec:
+        out["_id"] = doc["_id"]
+    for path, value in spec.items():
+        if value in (0, False):
+            continue
+        if value in (1, True) and not isinstance(value, dict):
+            found = get_path(doc, path)
+            if found is not MISSING:
+                set_path(out, path, copy(found))
+            continue
+        result = evaluate(value, doc)
+        if result is not MISSING:
+            set_path(out, path, result)
+    return out
+
+
+# -- the Motor-shaped API ----------------------------------------------------
+
+class MemoryCursor:
+    def __init__(self, documents: Optional[List[Dict[str, Any]]] = None, loader=None,
+                 projection: Optional[Any] = None):
+        self._documents = documents
+        self._loader = loader
+        self._projection = projection
+        self._sort: List[Tuple[str, int]] = []
+        self._skip = 0
+        self._limit = 0
+        self._results: Optional[List[Dict[str, Any]]] = None
+
+    def sort(self, key_or_list: Any, direction: Any = None) -> "MemoryCursor":
+        self._sort = normalize_sort(key_or_list, direction)
+        return self
+
+    def skip(self, skip: int) -> "MemoryCursor":
+        self._skip = skip
+        return self
+
+    def limit(self, limit: int) -> "MemoryCursor":
+        self._limit = limit
+        return self
+
+    def batch_size(self, size: int) -> "MemoryCursor":
+        return self
+
+    def _evaluate(self) -> List[Dict[str, Any]]:
+        if self._results is None:
+            docs = self._documents if self._documents is not None else self._loader()
+            if self._sort:
+                docs = sort_documents(docs, self._sort)
+            docs = docs[self._skip:]
+            if self._limit:
+                docs = docs[:abs(self._limit)]
+            self._results = [project(doc, self._projection) for doc in docs]
+        return self._results
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict[str, Any]]:
+        results = self._evaluate()
+        taken = results if length is None else results[:length]
+        self._results = results[len(taken):]
+        return taken
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Dict[str, Any]:
+        results = self._evaluate()
+        if not results:
+            raise StopAsyncIteration
+        return results.pop(0)
+
+    async def close(self):
+        self._results = []
+
+
+class _Index:
+    def __init__(self, name: str, keys: List[Tuple[str, Any]], unique: bool = False, sparse: bool = False,
+                 partial: Optional[Dict[str, Any]] = None, **options):
+        self.name = name
+        self.keys = keys
+        self.unique = unique
+        self.sparse = sparse
+        self.partial = partial
+        self.options = options
+        # unique key -> _id
+        self.entries: Dict[Any, Any] = {}
+
+    def key(self, doc: Dict[str, Any]) -> Any:
+        """The unique key of a document, or MISSING when the index does not cover it"""
+        if self.partial is not None and not matches(doc, self.partial):
+            return MISSING
+        values = [get_path(doc, field) for field, _ in self.keys]
+        if self.sparse and all(value is MISSING for value in values):
+            return MISSING
+        return tuple(hashable(None if value is MISSING else value) for value in values)
+
+    def info(self) -> Dict[str, Any]:
+        info: Dict[str, Any] = {"v": 2, "key": list(self.keys)}
+        if self.unique:
+            info["unique"] = True
+        if self.sparse:
+            info["sparse"] = True
+        if self.partial is not None:
+            info["partialFilterExpression"] = self.partial
+        info.update(self.options)
+        return info
+
+
+def index_name(keys: List[Tuple[str, Any]]) -> str:
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+
+class MemoryCollection:
+    def __init__(self, database: "MemoryDatabase", name: str):
+        self.database = database
+        self.name = name
+        # _id marker -> document, in insertion (natural) order
+        self.documents: Dict[Any, Dict[str, Any]] = {}
+        self.indexes: Dict[str, _Index] = {}
+        # Equality lookups: field -> value marker -> _id markers, for the first key of every index
+        self.lookups: Dict[str, Dict[Any, set]] = {}
+        self.options: Dict[str, Any] = {}
+
+    @property
+    def full_name(self) -> str:
+        return f"{self.database.name}.{self.name}"
+
+    def __getitem__(self, name: str) -> "MemoryCollection":
+        return self.database[f"{self.name}.{name}"]
+
+    def __getattr__(self, name: str) -> "MemoryCollection":
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    # -- storage and indexes
+
+    def _lookup_keys(self, doc: Dict[str, Any], field: str) -> List[Any]:
+        found = values_at(doc, field.split("."))
+        markers = {hashable(value) for value in _candidates(found)} if found else {hashable(None)}
+        return list(markers)
+
+    def _index_add(self, marker: Any, doc: Dict[str, Any]):
+        for field, lookup in self.lookups.items():
+            for key in self._lookup_keys(doc, field):
+                lookup.setdefault(key, set()).add(marker)
+        for index in self.indexes.values():
+            if index.unique:
+                key = index.key(doc)
+                if key is not MISSING:
+                    index.entries[key] = marker
+
+    def _index_remove(self, marker: Any, doc: Dict[str, Any]):
+        for field, lookup in self.lookups.items():
+            for key in self._lookup_keys(doc, field):
+                ids = lookup.get(key)
+                if ids:
+                    ids.discard(marker)
+                    if not ids:
+                        del lookup[key]
+        for index in self.indexes.values():
+            if index.unique:
+                key = index.key(doc)
+                if key is not MISSING and index.entries.get(key) == marker:
+                    del index.entries[key]
+
+    def _check_unique(self, doc: Dict[str, Any], marker: Any, replacing: bool = False):
+        if not replacing and marker in self.documents:
+            raise DuplicateKeyError(
+                f"E11000 duplicate key error collection: {self.full_name} index: _id_ dup key: {{ _id: {doc['_id']!r} }}",
+                DUPLICATE_KEY, {"keyValue": {"_id": doc["_id"]}},
+            )
+        for index in self.indexes.values():
+            if not index.unique:
+                continue
+            key = index.key(doc)
+            if key is MISSING:
+                continue
+            owner = index.entries.get(key)
+            if owner is not None and owner != marker:
+                values = {field: get_path(doc, field, None) for field, _ in index.keys}
+                raise DuplicateKeyError(
+                    f"E11000 duplicate key error collection: {self.full_name} index: {index.name} dup key: {values}",
+                    DUPLICATE_KEY, {"keyValue": values},
+                )
+
+    def _store(self, doc: Dict[str, Any]) -> Any:
+        marker = hashable(doc["_id"])
+        self._check_unique(doc, marker)
+        self.documents[marker] = doc
+        self._index_add(marker, doc)
+        return marker
+
+    def _replace(self, marker: Any, old: Dict[str, Any], new: Dict[str, Any]):
+        self._index_remove(marker, old)
+        try:
+            self._check_unique(new, marker, replacing=True)
+        except DuplicateKeyError:
+            self._index_add(marker, old)
+            raise
+        self.documents[marker] = new
+        self._index_add(marker, new)
+
+    def _delete(self, marker: Any):
+        doc = self.documents.pop(marker)
+        self._index_remove(marker, doc)
+
+    def _scan(self, query: Optional[Dict[str, Any]]) -> List[Tuple[Any, Dict[str, Any]]]:
+        """Matching (marker, stored document) pairs in natural order, narrowed by an index when possible"""
+        query = query or {}
+        candidates: Optional[set] = None
+        # The lookup already decides equality on its field, so a filter on that field alone needs no matching
+        covered = None
+        if "_id" in query and not _is_operator_spec(query["_id"]):
+            candidates = {hashable(encode(query["_id"]))}
+            covered = "_id"
+        else:
+            for field, spec in query.items():
+                lookup = self.lookups.get(field)
+                if lookup is None:
+                    continue
+                if _is_operator_spec(spec):
+                    if set(spec) == {"$in"}:
+                        wanted = [encode(value) for value in spec["$in"]]
+                    elif set(spec) == {"$eq"}:
+                        wanted = [encode(spec["$eq"])]
+                    else:
+                        continue
+                elif isinstance(spec, (dict, list, re.Pattern, Regex)) or spec is None:
+                    continue
+                else:
+                    wanted = [encode(spec)]
+                if any(isinstance(value, (dict, list, re.Pattern, Regex)) for value in wanted):
+                    continue
+                candidates = set()
+                for value in wanted:
+                    candidates |= lookup.get(hashable(value), set())
+                covered = field
+                break
+        if candidates is None:
+            items = list(self.documents.items())
+        else:
+            items = [(marker, doc) for marker, doc in self.documents.items() if marker in candidates] \
+                if len(candidates) > len(self.documents) // 4 else \
+                sorted(((marker, self.documents[marker]) for marker in candidates if marker in self.documents),
+                       key=lambda item: self._order(item[0]))
+        if covered is not None and len(query) == 1:
+            return items
+        return [(marker, doc) for marker, doc in items if matches(doc, query)]
+
+    def _order(self, marker: Any) -> int:
+        # Natural order for index-narrowed results; rebuilt only when the collection changed
+        if getattr(self, "_positions_size", -1) != len(self.documents) or marker not in self._positions:
+            self._positions = {key: i for i, key in enumerate(self.documents)}
+            self._positions_size = len(self.documents)
+        return self._positions.get(marker, 0)
+
+    # -- indexes
+
+    async def create_index(self, keys: Any, **kwargs) -> str:
+        keys = normalize_sort(keys, 1) if isinstance(keys, str) else [(field, direction) for field, direction in keys]
+        name = kwargs.pop("name", None) or index_name(keys)
+        kwargs.pop("background", None)
+        partial = kwargs.pop("partialFilterExpression", None)
+        index = _Index(name, keys, kwargs.pop("unique", False), kwargs.pop("sparse", False), partial, **kwargs)
+        if name in self.indexes:
+            return name
+        if index.unique:
+            for marker, doc in self.documents.items():
+                key = index.key(doc)
+                if key is MISSING:
+                    continue
+                if key in index.entries:
+                    raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.full_name} index: {name}",
+                                            DUPLICATE_KEY)
+                index.entries[key] = marker
+        self.indexes[name] = index
+        field = keys[0][0]
+        if field != "_id" and field not in self.lookups:
+            lookup: Dict[Any, set] = {}
+            for marker, doc in self.documents.items():
+                for key in self._lookup_keys(doc, field):
+                    lookup.setdefault(key, set()).add(marker)
+            self.lookups[field] = lookup
+        return name
+
+    async def create_indexes(self, indexes: Iterable[Any]) -> List[str]:
+        names = []
+        for model in indexes:
+            document = dict(model.document)
+            keys = list(document.pop("key").items())
+            names.append(await self.create_index(keys, **document))
+        return names
+
+    async def index_information(self) -> Dict[str, Any]:
+        info = {"_id_": {"v": 2, "key": [("_id", 1)]}}
+        info.update({name: index.info() for name, index in self.indexes.items()})
+        return info
+
+    async def drop_index(self, name: str):
+        if name not in self.indexes:
+            raise OperationFailure(f"index not found with name [{name}]", 27)
+        del self.indexes[name]
+
+    # -- reads
+
+    def find(self, filter: Optional[Dict[str, Any]] = None, projection: Optional[Any] = None, *,
+             sort: Any = None, skip: int = 0, limit: int = 0, **kwargs) -> MemoryCursor:
+        cursor = MemoryCursor(loader=lambda: [doc for _, doc in self._scan(filter)], projection=projection)
+        if sort:
+            cursor.sort(sort)
+        return cursor.skip(skip).limit(limit)
+
+    async def find_one(self, filter: Optional[Any] = None, projection: Optional[Any] = None, *,
+                       sort: Any = None, **kwargs) -> Optional[Dict[str, Any]]:
+        if filter is not None and not isinstance(filter, dict):
+            filter = {"_id": filter}
+        docs = await self.find(filter, projection, sort=sort).limit(1).to_list(1)
+        return docs[0] if docs else None
+
+    async def count_documents(self, filter: Dict[str, Any], skip: int = 0, limit: int = 0, **kwargs) -> int:
+        total = max(0, len(self._scan(filter)) - skip)
+        return min(total, limit) if limit else total
+
+    async def estimated_document_count(self, **kwargs) -> int:
+        return len(self.documents)
+
+    async def distinct(self, key: str, filter: Optional[Dict[str, Any]] = None, **kwargs) -> List[Any]:
+        unique: List[Any] = []
+        seen = set()
+        for _, doc in self._scan(filter):
+            found = values_at(doc, key.split("."))
+            for value in found:
+                for item in value if isinstance(value, list) else [value]:
+                    marker = hashable(item)
+                    if marker not in seen:
+                        seen.add(marker)
+                        unique.append(copy(item))
+        return unique
+
+    def aggregate(self, pipeline: List[Dict[str, Any]], **kwargs) -> MemoryCursor:
+        return MemoryCursor(loader=lambda: run_pipeline([doc for doc in self.documents.values()], pipeline))
+
+    def watch(self, *args, **kwargs):
+        raise NotImplementedError("change streams need a replica set; use STORAGE_BACKEND=mongo")
+
+    # -- writes
+
+    def _insert(self, document: Dict[str, Any]) -> Any:
+        if "_id" not in document:
+            document["_id"] = ObjectId()
+        stored = encode({"_id": document["_id"], **document})
+        self._store(stored)
+        return document["_id"]
+
+    async def insert_one(self, document: Dict[str, Any], **kwargs) -> InsertOneResult:
+        return InsertOneResult(self._insert(document), True)
+
+    async def insert_many(self, documents: Iterable[Dict[str, Any]], ordered: bool = True,
+                          **kwargs) -> InsertManyResult:
+        result = await self.bulk_write([InsertOne(document) for document in documents], ordered=ordered)
+        return InsertManyResult([operation for operation in result.bulk_api_result["insertedIds"]], True)
+
+    def _update(self, filter: Dict[str, Any], update: Any, upsert: bool, multi: bool,
+                replacement: bool = False) -> Dict[str, Any]:
+        """Raw result of an update: ``n``, ``nModified`` and the upserted id, if any"""
+        if replacement and any(key.startswith("$") for key in update):
+            raise ValueError("replacement can not include $ operators")
+        if not replacement and not isinstance(update, list) and not all(key.startswith("$") for key in update):
+            raise ValueError("update only works with $ operators")
+        matched = self._scan(filter)
+        if not multi:
+            matched = matched[:1]
+        modified = 0
+        for marker, doc in matched:
+            new = apply_update(doc, update)
+            if new != doc:
+                self._replace(marker, doc, new)
+                modified += 1
+        raw: Dict[str, Any] = {"n": len(matched), "nModified": modified}
+        if not matched and upsert:
+            seed = upsert_seed(filter)
+            doc = apply_update(seed, update, inserting=True)
+            if "_id" not in doc:
+                doc = {"_id": seed.get("_id", ObjectId()), **doc}
+            else:
+                doc = {"_id": doc["_id"], **{key: value for key, value in doc.items() if key != "_id"}}
+            self._store(doc)
+            raw.update({"n": 1, "upserted": doc["_id"]})
+        return raw
+
+    async def update_one(self, filter: Dict[str, Any], update: Any, upsert: bool = False, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert, multi=False), True)
+
+    async def update_many(self, filter: Dict[str, Any], update: Any, upsert: bool = False, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert, multi=True), True)
+
+    async def replace_one(self, filter: Dict[str, Any], replacement: Dict[str, Any], upsert: bool = False,
+                          **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, replacement, upsert, multi=False, replacement=True), True)
+
+    def _remove(self, filter: Dict[str, Any], multi: bool) -> int:
+        matched = self._scan(filter)
+        if not multi:
+            matched = matched[:1]
+        for marker, _ in matched:
+            self._delete(marker)
+        return len(matched)
+
+    async def delete_one(self, filter: Dict[str, Any], **kwargs) -> DeleteResult:
+        return DeleteResult({"n": self._remove(filter, multi=False)}, True)
+
+    async def delete_many(self, filter: Dict[str, Any], **kwargs) -> DeleteResult:
+        return DeleteResult({"n": self._remove(filter, multi=True)}, True)
+
+    async def find_one_and_update(self, filter: Dict[str, Any], update: Any, projection: Optional[Any] = None,
+                                  sort: Any = None, upsert: bool = False,
+                                  return_document: bool = ReturnDocument.BEFORE, **kwargs) -> Optional[Dict[str, Any]]:
+        return self._find_and_modify(filter, update, projection, sort, upsert, return_document)
+
+    async def find_one_and_replace(self, filter: Dict[str, Any], replacement: Dict[str, Any],
+                                   projection: Optional[Any] = None, sort: Any = None, upsert: bool = False,
+                                   return_document: bool = ReturnDocument.BEFORE, **kwargs) -> Optional[Dict[str, Any]]:
+        return self._find_and_modify(filter, replacement, projection, sort, upsert, return_document, replacement=True)
+
+    async def find_one_and_delete(self, filter: Dict[str, Any], projection: Optional[Any] = None, sort: Any = None,
+                                  **kwargs) -> Optional[Dict[str, Any]]:
+        matched = sort_documents([doc for _, doc in self._scan(filter)], normalize_sort(sort)) if sort else \
+            [doc for _, doc in self._scan(filter)]
+        if not matched:
+            return None
+        self._delete(hashable(matched[0]["_id"]))
+        return project(matched[0], projection)
+
+    def _find_and_modify(self, filter, update, projection, sort, upsert, return_document, replacement=False):
+        matched = [doc for _, doc in self._scan(filter)]
+        if sort:
+            matched = sort_documents(matched, normalize_sort(sort))
+        if matched:
+            before = matched[0]
+            marker = hashable(before["_id"])
+            self._update({"_id": before["_id"]}, update, False, multi=False, replacement=replacement)
+            after = self.documents.get(marker, before)
+            return project(after if return_document else before, projection)
+        if not upsert:
+            return None
+        raw = self._update(filter, update, True, multi=False, replacement=replacement)
+        if not return_document:
+            return None
+        return project(self.documents[hashable(raw["upserted"])], projection)
+
+    async def bulk_write(self, requests: List[Any], ordered: bool = True, **kwargs) -> BulkWriteResult:
+        result: Dict[str, Any] = {
+            "writeErrors": [], "writeConcernErrors": [], "nInserted": 0, "nUpserted": 0, "nMatched": 0,
+            "nModified": 0, "nRemoved": 0, "upserted": [], "insertedIds": [],
+        }
+        for index, request in enumerate(requests):
+            try:
+                if isinstance(request, InsertOne):
+                    result["insertedIds"].append(self._insert(request._doc))
+                    result["nInserted"] += 1
+                elif isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+                    raw = self._update(request._filter, request._doc, request._upsert,
+                                       multi=isinstance(request, UpdateMany), replacement=isinstance(request, ReplaceOne))
+                    if "upserted" in raw:
+                        result["nUpserted"] += 1
+                        result["upserted"].append({"index": index, "_id": raw["upserted"]})
+                    else:
+                        result["nMatched"] += raw["n"]
+                        result["nModified"] += raw["nModified"]
+                elif isinstance(request, (DeleteOne, DeleteMany)):
+                    result["nRemoved"] += self._remove(request._filter, multi=isinstance(request, DeleteMany))
+                else:
+                    raise TypeError(f"{request!r} is not a valid request")
+            except (DuplicateKeyError, WriteError) as e:
+                result["writeErrors"].append({
+                    "index": index, "code": e.code, "errmsg": str(e), "op": getattr(request, "_doc", None),
+                })
+                if ordered:
+                    break
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    # -- the collection itself
+
+    async def drop(self, **kwargs):
+        self.database.collections.pop(self.name, None)
+
+    async def rename(self, new_name: str, dropTarget: bool = False, **kwargs):
+        collections = self.database.collections
+        if new_name in collections and collections[new_name].documents and not dropTarget:
+            raise OperationFailure("target namespace exists", 48)
+        collections.pop(self.name, None)
+        self.name = new_name
+        collections[new_name] = self
+
+    def with_options(self, **kwargs) -> "MemoryCollection":
+        return self
+
+
+class MemoryDatabase:
+    def __init__(self, client: "MemoryClient", name: str):
+        self.client = client
+        self.name = name
+        self.collections: Dict[str, MemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        collection = self.collections.get(name)
+        if collection is None:
+            collection = self.collections[name] = MemoryCollection(self, name)
+        return collection
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_collection(self, name: str, **kwargs) -> MemoryCollection:
+        return self[name]
+
+    async def create_collection(self, name: str, **options) -> MemoryCollection:
+        if name in self.collections:
+            raise CollectionInvalid(f"collection {name} already exists")
+        if "viewOn" in options or "timeseries" in options:
+            raise NotImplementedError("views and time-series collections are not supported by the memory engine")
+        collection = self[name]
+        collection.options = options
+        return collection
+
+    async def drop_collection(self, name: str, **kwargs):
+        self.collections.pop(name, None)
+
+    async def list_collections(self, filter: Optional[Dict[str, Any]] = None, **kwargs) -> MemoryCursor:
+        docs = [{"name": name, "type": "collection", "options": collection.options}
+                for name, collection in self.collections.items()]
+        return MemoryCursor([doc for doc in docs if matches(doc, filter)])
+
+    async def list_collection_names(self, filter: Optional[Dict[str, Any]] = None, **kwargs) -> List[str]:
+        return [doc["name"] for doc in await (await self.list_collections(filter)).to_list(None)]
+
+    async def command(self, command: Any, **kwargs) -> Dict[str, Any]:
+        if isinstance(command, str):
+            command = {command: 1}
+        name = next(iter(command))
+        if name in ("ping", "buildInfo", "serverStatus"):
+            return {"ok": 1.0, "version": "memory"}
+        if name == "collStats":
+            collection = self[command[name]]
+            size = sum(len(repr(doc)) for doc in collection.documents.values())
+            return {"ok": 1.0, "ns": collection.full_name, "count": len(collection.documents), "size": size,
+                    "storageSize": size, "totalIndexSize": 0, "nindexes": len(collection.indexes) + 1}
+        raise NotImplementedError(f"command {name} is not supported by the memory engine")
+
+
+class MemoryClient:
+    """Drop-in for ``AsyncIOMotorClient``; databases live as long as the client"""
+
+    def __init__(self, *args, **kwargs):
+        self.databases: Dict[str, MemoryDatabase] = {}
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        database = self.databases.get(name)
+        if database is None:
+            database = self.databases[name] = MemoryDatabase(self, name)
+        return database
+
+    def __getattr__(self, name: str) -> MemoryDatabase:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_database(self, name: str, **kwargs) -> MemoryDatabase:
+        return self[name]
+
+    async def list_database_names(self) -> List[str]:
+        return list(self.databases)
+
+    async def drop_database(self, name: str):
+        self.databases.pop(name if isinstance(name, str) else name.name, None)
+
+    def close(self):
+        pass
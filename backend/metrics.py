@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""
+Prometheus metrics without a client library.
+
+A small registry of counters, gauges and histograms rendered in the text
+exposition format, plus the instrumentation that feeds it:
+
+* ``MetricsMiddleware``: a plain ASGI middleware timing every HTTP request by
+  method and route template (``/api/pomodoro/sessions/{user_id}``, never the
+  raw path) and tracking in-flight requests
+* ``MongoCommandMetrics``: a pymongo command listener timing each command by
+  collection and command name
+* ``MongoPoolMetrics``: a pymongo pool listener counting open and checked-out
+  connections and checkout failures
+
+Observing a histogram is a bisect and two additions under a lock (pymongo
+listeners run on Motor's executor threads). ``bench`` measures the
+middleware's per-request cost against the bare app:
+
+    python metrics.py bench [--requests 20000]
+"""
+
+import argparse
+import asyncio
+import bisect
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import monitoring
+
+# Seconds; covers a sub-millisecond Mongo read up to a slow LLM call
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[Any, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[Any, ...], float] = {}
+
+    def inc(self, *labels: Any, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: Any) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_labels(self.label_names, labels)} {_number(value)}" for labels, value in values
+        ]
+
+
+class Gauge(Metric):
+    """A settable gauge, or one read from ``collect`` at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (),
+                 collect: Optional[Callable[[], Dict[Tuple[Any, ...], float]]] = None):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[Any, ...], float] = {}
+        self._collect = collect
+
+    def set(self, value: float, *labels: Any):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels: Any, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels: Any, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def value(self, *labels: Any) -> float:
+        return self._values.get(labels, 0)
+
+    def values(self) -> Dict[Tuple[Any, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        if self._collect:
+            values.update(self._collect())
+        return self.header() + [
+            f"{self.name}{_labels(self.label_names, labels)} {_number(value)}" for labels, value in values.items()
+        ]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts (last one is +Inf), sum]
+        self._series: Dict[Tuple[Any, ...], List[Any]] = {}
+
+    def observe(self, value: float, *labels: Any):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, *labels: Any) -> int:
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        lines = self.header()
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def _register(self, metric: Metric) -> Any:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Iterable[str] = (), collect=None) -> Gauge:
+        return self._register(Gauge(name, help, labels, collect))
+
+    def histogram(self, name: str, help: str, labels: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def get(self, name: str) -> Metric:
+        return self._metrics[name]
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# ===============================
+# HTTP
+# ===============================
+
+class MetricsMiddleware:
+    """Per-route request latency, status counts and in-flight gauge
+
+    Plain ASGI rather than ``BaseHTTPMiddleware``, so it adds no task or
+    stream wrapping; the route template is read from the scope after routing.
+    """
+
+    def __init__(self, app, registry: MetricsRegistry, skip_paths: Iterable[str] = ("/metrics",)):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+        self.latency = registry.histogram(
+            "http_request_duration_seconds", "HTTP request latency by route template", ("method", "route")
+        )
+        self.responses = registry.counter(
+            "http_responses_total", "HTTP responses by route template and status", ("method", "route", "status")
+        )
+        self.in_flight = registry.gauge("http_requests_in_flight", "HTTP requests being handled")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self.in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.in_flight.dec()
+            route = scope.get("route")
+            # Unmatched paths share one series so random URLs cannot grow the label set
+            template = getattr(route, "path", None) or "unmatched"
+            self.latency.observe(elapsed, scope["method"], template)
+            self.responses.inc(scope["method"], template, status)
+
+
+# ===============================
+# MONGO
+# ===============================
+
+def command_collection(command_name: str, command: Dict[str, Any]) -> str:
+    """The collection a command targets, or ``-`` for database and admin commands"""
+    if command_name == "getMore":
+        return str(command.get("collection", "-"))
+    target = command.get(command_name)
+    return target if isinstance(target, str) else "-"
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Command latency per collection and command name"""
+
+    def __init__(self, registry: MetricsRegistry):
+        self.latency = registry.histogram(
+            "mongo_command_duration_seconds", "Mongo command latency", ("collection", "command")
+        )
+        self.failures = registry.counter(
+            "mongo_command_failures_total", "Failed Mongo commands", ("collection", "command")
+        )
+        # (connection, request id) -> collection; the reply events do not carry the command
+        self._pending: Dict[Tuple[Any, int], str] = {}
+
+    def started(self, event):
+        self._pending[(event.connection_id, event.request_id)] = command_collection(event.command_name, event.command)
+
+    def succeeded(self, event):
+        collection = self._pending.pop((event.connection_id, event.request_id), "-")
+        self.latency.observe(event.duration_micros / 1e6, collection, event.command_name)
+
+    def failed(self, event):
+        collection = self._pending.pop((event.connection_id, event.request_id), "-")
+        self.latency.observe(event.duration_micros / 1e6, collection, event.command_name)
+        self.failures.inc(collection, event.command_name)
+
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Open, checked-out and awaited connections per server, plus checkout failures"""
+
+    def __init__(self, registry: MetricsRegistry):
+        self.open = registry.gauge("mongo_pool_connections", "Open pooled connections", ("address",))
+        self.in_use = registry.gauge("mongo_pool_connections_in_use", "Checked-out connections", ("address",))
+        self.waiting = registry.gauge(
+            "mongo_pool_checkouts_waiting", "Checkouts started but not yet given a connection", ("address",)
+        )
+        self.checkout_failures = registry.counter(
+            "mongo_pool_checkout_failures_total", "Failed connection checkouts", ("address", "reason")
+        )
+
+    @staticmethod
+    def _address(event) -> str:
+        host, port = event.address
+        return f"{host}:{port}"
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        self.open.set(0, self._address(event))
+        self.in_use.set(0, self._address(event))
+        self.waiting.set(0, self._address(event))
+
+    def connection_created(self, event):
+        self.open.inc(self._address(event))
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self.open.dec(self._address(event))
+
+    def connection_check_out_started(self, event):
+        self.waiting.inc(self._address(event))
+
+    def connection_check_out_failed(self, event):
+        self.waiting.dec(self._address(event))
+        self.checkout_failures.inc(self._address(event), event.reason)
+
+    def connection_checked_out(self, event):
+        self.waiting.dec(self._address(event))
+        self.in_use.inc(self._address(event))
+
+    def connection_checked_in(self, event):
+        self.in_use.dec(self._address(event))
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Per server address: open, in-use and waiting connections"""
+        servers: Dict[str, Dict[str, float]] = {}
+        for name, gauge in (("open", self.open), ("in_use", self.in_use), ("waiting", self.waiting)):
+            for (address,), value in gauge.values().items():
+                servers.setdefault(address, {"open": 0, "in_use": 0, "waiting": 0})[name] = value
+        return servers
+
+
+# ===============================
+# BENCHMARK
+# ===============================
+
+async def _drive(app, requests: int, path: str) -> float:
+    """Seconds per request through ``app`` over in-process ASGI, no sockets"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [], "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    for _ in range(min(requests, 1000)):
+        await app(dict(scope), receive, send)
+    started = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - started) / requests
+
+
+async def benchmark(requests: int = 20000) -> Dict[str, float]:
+    from fastapi import FastAPI
+
+    def build(instrumented: bool):
+        app = FastAPI()
+
+        @app.get("/items/{item_id}")
+        async def item(item_id: str):
+            return {"id": item_id}
+
+        if instrumented:
+            app.add_middleware(MetricsMiddleware, registry=MetricsRegistry())
+        return app
+
+    bare = await _drive(build(False), requests, "/items/42")
+    instrumented = await _drive(build(True), requests, "/items/42")
+
+    histogram = Histogram("bench", "bench", ("route",))
+    started = time.perf_counter()
+    for i in range(requests):
+        histogram.observe(i % 100 / 1000, "/items/{item_id}")
+    observe = (time.perf_counter() - started) / requests
+    return {
+        "bare_us": round(bare * 1e6, 2),
+        "instrumented_us": round(instrumented * 1e6, 2),
+        "overhead_us": round((instrumented - bare) * 1e6, 2),
+        "overhead_percent": round((instrumented - bare) / bare * 100, 1),
+        "observe_us": round(observe * 1e6, 3),
+    }
+
+
+def _main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["bench"])
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+    result = asyncio.run(benchmark(args.requests))
+    print(
+        f"per request: {result['bare_us']}us bare, {result['instrumented_us']}us with metrics "
+        f"(+{result['overhead_us']}us, {result['overhead_percent']}%); histogram observe {result['observe_us']}us"
+    )
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the pure-Python hot spots in server.py.
+
+Covers building and serializing the request models, ``clean_mongo_doc`` on
+nested documents, dashboard payload assembly and the JSON encoding of a
+``response_model=List[...]`` history page, using the app's own models,
+helpers and response fields. The ``route.*`` benchmarks send whole GET
+requests through the ASGI app in-process, middleware included, over the
+in-memory storage engine, so they measure the app's own CPU per request
+without Mongo or sockets (server.py is imported with ``STORAGE_BACKEND=memory``
+and the stub LLM from loadtest.py). Each benchmark is timed in repeated
+batches and the best batch is reported, which is the number least disturbed
+by the rest of the machine.
+
+    python microbench.py run [--filter clean] [--save benchmarks/baseline.json]
+    python microbench.py compare [--baseline benchmarks/baseline.json] [--threshold 0.25]
+
+``compare`` runs the suite and exits non-zero when a benchmark is slower than
+the baseline by more than the threshold. Baselines are per machine: refresh
+the checked-in one with ``run --save`` on the machine that compares against
+it, before and after a change to server.py.
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+import warnings
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from bson import ObjectId
+
+from loadtest import VirtualUser, install_stub_llm, seed_users
+
+BASELINE = Path(__file__).parent / "benchmarks" / "baseline.json"
+
+
+def import_server():
+    """server.py on the in-memory storage engine with the stub LLM"""
+    os.environ["STORAGE_BACKEND"] = "memory"
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("DB_NAME", "taskflow_microbench")
+    os.environ.setdefault("EMERGENT_LLM_KEY", "microbench")
+    install_stub_llm(0)
+    import server
+    return server
+
+
+def thought_payload(user_id: str) -> Dict[str, Any]:
+    return {
+        "user_id": user_id,
+        "trigger_situation": "Quarterly report due tomorrow and nothing written",
+        "automatic_thoughts": ["I'll never finish this", "Everyone will see I'm behind"],
+        "emotions": ["anxiety", "shame", "frustration"],
+        "emotion_intensity": {"anxiety": 8, "shame": 6, "frustration": 5},
+        "physical_sensations": ["tight chest", "racing heart"],
+        "behaviors": ["procrastination", "checking email"],
+        "evidence_for": ["The report is long"],
+        "evidence_against": ["Finished the last three on time", "Outline already exists"],
+        "balanced_thoughts": ["One section tonight is enough progress"],
+        "outcome_emotions": {"anxiety": 4, "shame": 2, "frustration": 2},
+        "coping_strategies_used": ["task breakdown", "deep breathing"],
+        "effectiveness_rating": 7,
+    }
+
+
+def pomodoro_payload(user_id: str) -> Dict[str, Any]:
+    return {
+        "user_id": user_id,
+        "task_name": "Write the methods section",
+        "work_duration": 25,
+        "break_duration": 5,
+        "focus_quality_ratings": [8, 7, 9, 6],
+        "distractions": [{"type": "phone", "duration": 2}, {"type": "slack", "duration": 1}],
+        "break_activities": ["stretch", "water"],
+        "completion_status": "completed",
+        "productivity_score": 8.5,
+    }
+
+
+def sleep_payload(user_id: str) -> Dict[str, Any]:
+    return {
+        "user_id": user_id,
+        "sleep_date": "2024-03-14",
+        "bedtime": "2024-03-14T23:40:00",
+        "wake_time": "2024-03-15T07:10:00",
+        "sleep_duration": 7.5,
+        "sleep_quality": 7,
+        "bedtime_procrastination_minutes": 35,
+        "sleep_environment_score": 8,
+        "caffeine_intake": [{"time": "14:00", "amount": "1 cup", "type": "coffee"}],
+    }
+
+
+def stored(doc: Dict[str, Any], when: datetime) -> Dict[str, Any]:
+    """A document as Motor returns it: ``_id`` and real datetimes"""
+    return {"_id": ObjectId(), **doc, "id": str(ObjectId()), "timestamp": when}
+
+
+async def request(app, path: str) -> int:
+    """One GET through ``app`` over in-process ASGI; returns the status"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [], "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80),
+    }
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+def build_suite(server) -> Dict[str, Callable[[], Any]]:
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    user_id = "2b1f0f1e-5c55-4c1b-9f7e-0d6c1f3a9e10"
+    now = datetime(2024, 3, 15, 12, 0)
+    thought = thought_payload(user_id)
+    pomodoro = pomodoro_payload(user_id)
+    sleep = sleep_payload(user_id)
+    thought_model = server.ThoughtRecord(**thought)
+    pomodoro_model = server.PomodoroSession(**pomodoro)
+    sleep_model = server.SleepData(**sleep)
+
+    pomodoro_docs = [stored(pomodoro, now - timedelta(hours=i)) for i in range(100)]
+    sleep_docs = [
+        {**stored(sleep, now), "sleep_date": datetime.combine(date(2024, 3, 14) - timedelta(days=i), datetime.min.time())}
+        for i in range(7)
+    ]
+    dashboard_sections = {
+        "user_progress": {
+            "_id": ObjectId(), "id": str(ObjectId()), "user_id": user_id, "total_points": 1840, "level": 7,
+            "current_streak": 5, "longest_streak": 21, "modules_unlocked": ["cbt", "pomodoro", "sleep"],
+            "skill_levels": {"focus": 4, "mindfulness": 2}, "last_activity": now,
+        },
+        "recent_pomodoros": pomodoro_docs[:5],
+        "recent_thought_records": [stored(thought, now - timedelta(days=i)) for i in range(3)],
+        "active_intentions": [
+            {"_id": ObjectId(), "id": str(ObjectId()), "user_id": user_id, "if_condition": "After lunch",
+             "then_action": "Open the draft", "effectiveness_score": 0.8 - i / 10, "times_used": i,
+             "created_at": now, "related": [{"_id": ObjectId(), "note": "linked"}]}
+            for i in range(5)
+        ],
+        "recent_sleep": sleep_docs,
+        "recent_achievements": [
+            {"_id": ObjectId(), "id": str(ObjectId()), "user_id": user_id, "achievement_type": "streak",
+             "title": f"{i + 3} day streak", "points_awarded": 50, "unlock_date": now}
+            for i in range(3)
+        ],
+    }
+    nested = {
+        "_id": ObjectId(),
+        "user_id": user_id,
+        "sections": [
+            {"_id": ObjectId(), "items": [{"_id": ObjectId(), "ref": ObjectId(), "values": list(range(5)),
+                                          "meta": {"source": "app", "tags": ["a", "b"]}} for _ in range(10)]}
+            for _ in range(5)
+        ],
+    }
+
+    history_route = next(
+        route for route in server.app.routes
+        if getattr(route, "path", None) == "/api/pomodoro/sessions/{user_id}" and "GET" in route.methods
+    )
+    response_field = history_route.response_field
+
+    def dashboard_payload():
+        payload = {key: server.clean_mongo_doc(value) for key, value in dashboard_sections.items()}
+        payload["timestamp"] = now
+        return JSONResponse(jsonable_encoder(payload)).body
+
+    def list_response():
+        # What FastAPI does with a response_model=List[PomodoroSession] return value
+        value, errors = response_field.validate(pomodoro_docs, {}, loc=("response",))
+        content = response_field.serialize(value, mode="json", by_alias=True)
+        return JSONResponse(content).body
+
+    user = VirtualUser(user_id, str(ObjectId()))
+    loop = asyncio.new_event_loop()
+
+    async def seed():
+        await server.progress_engine.ensure_indexes()
+        for collection, field in server.HISTORY_INDEXES:
+            await server.db[collection].create_index([("user_id", 1), (field, -1)])
+        await seed_users(server.db, [user])
+        await server.db.user_progress.insert_one(dashboard_sections["user_progress"])
+        await server.db.pomodoro_sessions.insert_many(pomodoro_docs)
+        await server.db.sleep_data.insert_many(sleep_docs)
+        await server.db.thought_records.insert_many(dashboard_sections["recent_thought_records"])
+        await server.db.implementation_intentions.insert_many(dashboard_sections["active_intentions"])
+        await server.db.achievements.insert_many(dashboard_sections["recent_achievements"])
+
+    loop.run_until_complete(seed())
+    routes = {
+        "route.dashboard": f"/api/dashboard/{user_id}",
+        "route.pomodoro_history": f"/api/pomodoro/sessions/{user_id}",
+        "route.sleep_history": f"/api/sleep/data/{user_id}",
+        "route.progress": f"/api/gamification/progress/{user_id}",
+        "route.store_wallet": f"/api/store/wallet/{user.oid}",
+    }
+    for path in routes.values():
+        status = loop.run_until_complete(request(server.app, path))
+        if status != 200:
+            raise RuntimeError(f"GET {path} answered {status}; the route benchmark would time an error path")
+
+    return {
+        **{name: lambda path=path: loop.run_until_complete(request(server.app, path)) for name, path in routes.items()},
+        "thought_record.build": lambda: server.ThoughtRecord(**thought),
+        "pomodoro_session.build": lambda: server.PomodoroSession(**pomodoro),
+        "sleep_data.build": lambda: server.SleepData(**sleep),
+        "thought_record.dict": thought_model.dict,
+        "pomodoro_session.dict": pomodoro_model.dict,
+        "sleep_data.dict": sleep_model.dict,
+        "thought_record.encode": lambda: jsonable_encoder(thought_model),
+        "pomodoro_session.encode": lambda: jsonable_encoder(pomodoro_model),
+        "sleep_data.encode": lambda: jsonable_encoder(sleep_model),
+        "clean_mongo_doc.nested": lambda: server.clean_mongo_doc(nested),
+        "clean_mongo_doc.pomodoro_page": lambda: server.clean_mongo_doc(pomodoro_docs),
+        "dashboard.payload": dashboard_payload,
+        "pomodoro_history.response_100": list_response,
+    }
+
+
+def measure(fn: Callable[[], Any], min_time: float = 0.5, repeat: int = 7) -> Dict[str, float]:
+    """Time per call: the best and the median of ``repeat`` batches of about ``min_time / repeat``
+
+    The collector is off while timing, as in ``timeit``.
+    """
+    gc.collect()
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        return _measure(fn, min_time, repeat)
+    finally:
+        if collecting:
+            gc.enable()
+
+
+def _measure(fn: Callable[[], Any], min_time: float, repeat: int) -> Dict[str, float]:
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time / repeat / 4:
+            break
+        loops *= 4
+    loops = max(1, int(loops * (min_time / repeat) / elapsed))
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        timings.append((time.perf_counter() - started) / loops)
+    return {
+        "best_us": round(min(timings) * 1e6, 3),
+        "median_us": round(statistics.median(timings) * 1e6, 3),
+        "loops": loops,
+    }
+
+
+def run(suite: Dict[str, Callable[[], Any]], filter: str = "", min_time: float = 0.5) -> Dict[str, Any]:
+    results = {}
+    for name, fn in suite.items():
+        if filter in name:
+            results[name] = measure(fn, min_time)
+    return {
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}",
+        "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "results": results,
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """Per benchmark in both runs: the ratio of best times and whether it is past ``threshold``"""
+    rows = []
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if not before:
+            continue
+        ratio = result["best_us"] / before["best_us"]
+        rows.append({
+            "name": name,
+            "baseline_us": before["best_us"],
+            "current_us": result["best_us"],
+            "ratio": round(ratio, 3),
+            "regressed": ratio > 1 + threshold,
+            "improved": ratio < 1 - threshold,
+        })
+    return rows
+
+
+def recheck(suite: Dict[str, Callable[[], Any]], baseline: Dict[str, Any], current: Dict[str, Any],
+            threshold: float, min_time: float, attempts: int = 2):
+    """Time apparent regressions again and keep the best, so one noisy batch does not fail a comparison"""
+    for _ in range(attempts):
+        suspects = [row["name"] for row in compare(baseline, current, threshold) if row["regressed"]]
+        if not suspects:
+            return
+        for name in suspects:
+            again = measure(suite[name], min_time)
+            if again["best_us"] < current["results"][name]["best_us"]:
+                current["results"][name] = again
+
+
+def _main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["run", "compare"])
+    parser.add_argument("--filter", default="", help="only benchmarks whose name contains this")
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds spent timing each benchmark")
+    parser.add_argument("--save", help="write the results to this file")
+    parser.add_argument("--baseline", default=str(BASELINE))
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown as a fraction")
+    args = parser.parse_args()
+
+    # server.py configures INFO logging on import; keep the output to the table
+    logging.disable(logging.INFO)
+    # server.py still uses the Pydantic v1 style .dict(); that is part of what is measured
+    warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+    suite = build_suite(import_server())
+    current = run(suite, args.filter, args.min_time)
+    if args.save:
+        Path(args.save).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.save).write_text(json.dumps(current, indent=2) + "\n")
+    if args.command == "run":
+        width = max(map(len, current["results"]), default=10)
+        print(f"{'benchmark':<{width}} {'best us':>10} {'median us':>10}")
+        for name, result in current["results"].items():
+            print(f"{name:<{width}} {result['best_us']:>10} {result['median_us']:>10}")
+        return
+
+    baseline = json.loads(Path(args.baseline).read_text())
+    recheck(suite, baseline, current, args.threshold, args.min_time)
+    rows = compare(baseline, current, args.threshold)
+    width = max((len(row["name"]) for row in rows), default=10)
+    print(f"baseline: {baseline['created_at']} (Python {baseline['python']}, {baseline['machine']})")
+    print(f"{'benchmark':<{width}} {'baseline us':>12} {'current us':>11} {'ratio':>7}")
+    for row in rows:
+        flag = "  REGRESSED" if row["regressed"] else "  improved" if row["improved"] else ""
+        print(f"{row['name']:<{width}} {row['baseline_us']:>12} {row['current_us']:>11} {row['ratio']:>7}{flag}")
+    regressed = [row["name"] for row in rows if row["regressed"]]
+    if regressed:
+        print(f"\n{len(regressed)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    _main()
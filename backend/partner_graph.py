@@ -0,0 +1,114 @@
+"""
+Accountability partnership graph with an adjacency-list cache.
+
+Partnerships are undirected edges stored once in ``accountability_partners``.
+Both endpoints are indexed together with ``active`` so the ``$or`` lookup is
+an index union rather than a collection scan, and each user's active
+adjacency list is cached in-process until a partnership touching them is
+created or deactivated (or the TTL bounds staleness from other workers).
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from progress_engine import public_progress
+
+
+class PartnerGraph:
+    def __init__(self, db, max_entries: int = 10000, ttl: float = 60.0):
+        self.db = db
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()  # user_id -> (expires, partnerships)
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def collection(self):
+        return self.db.accountability_partners
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("user_id", 1), ("active", 1)])
+        await self.collection.create_index([("partner_id", 1), ("active", 1)])
+        await self.collection.create_index("id", unique=True)
+
+    # ---- cache ----
+
+    def invalidate(self, *user_ids: str):
+        for user_id in user_ids:
+            self._cache.pop(user_id, None)
+
+    def _remember(self, user_id: str, partnerships: List[Dict[str, Any]]):
+        self._cache[user_id] = (time.monotonic() + self.ttl, partnerships)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    # ---- reads ----
+
+    async def partnerships(self, user_id: str) -> List[Dict[str, Any]]:
+        """Active partnerships where the user is on either side"""
+        cached = self._cache.get(user_id)
+        if cached and cached[0] > time.monotonic():
+            self.hits += 1
+            self._cache.move_to_end(user_id)
+            return cached[1]
+        self.misses += 1
+        partnerships = await self.collection.find(
+            {"$or": [{"user_id": user_id}, {"partner_id": user_id}], "active": True},
+            {"_id": 0}
+        ).to_list(None)
+        self._remember(user_id, partnerships)
+        return partnerships
+
+    async def get(self, partnership_id: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({"id": partnership_id}, {"_id": 0})
+
+    async def partner_ids(self, user_id: str) -> List[str]:
+        return [
+            p["partner_id"] if p["user_id"] == user_id else p["user_id"]
+            for p in await self.partnerships(user_id)
+        ]
+
+    async def partner_progress(self, user_id: str) -> List[Dict[str, Any]]:
+        """Each active partnership with the partner's progress, in one batched fetch"""
+        partnerships = await self.partnerships(user_id)
+        partner_ids = [p["partner_id"] if p["user_id"] == user_id else p["user_id"] for p in partnerships]
+        progress_docs = await self.db.user_progress.find(
+            {"user_id": {"$in": partner_ids}}, {"_id": 0}
+        ).to_list(None)
+        progress_by_user = {doc["user_id"]: doc for doc in progress_docs}
+        return [
+            {
+                "partnership_id": partnership["id"],
+                "partner_id": partner_id,
+                "relationship_type": partnership.get("relationship_type"),
+                "progress": public_progress(progress_by_user.get(partner_id)),
+            }
+            for partnership, partner_id in zip(partnerships, partner_ids)
+        ]
+
+    # ---- writes ----
+
+    async def add(self, partnership: Dict[str, Any]):
+        await self.collection.insert_one(dict(partnership))
+        self.invalidate(partnership["user_id"], partnership["partner_id"])
+
+    async def deactivate(self, partnership_id: str) -> Optional[Dict[str, Any]]:
+        partnership = await self.collection.find_one_and_update(
+            {"id": partnership_id}, {"$set": {"active": False}}, projection={"_id": 0}
+        )
+        if partnership:
+            self.invalidate(partnership["user_id"], partnership["partner_id"])
+            partnership["active"] = False
+        return partnership
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "cached_users": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,201 @@
+"""
+On-demand statistical profiling of single requests.
+
+``ProfilingMiddleware`` profiles a request when it carries the admin token
+in ``X-Profile`` or when it is picked by the sampling rate. A background
+thread then samples the event loop thread's stack every few milliseconds
+(``sys._current_frames``, so the profiled code is not instrumented at all)
+until the response has been sent. The samples are written to the profile
+directory as a speedscope file (open at https://www.speedscope.app); the
+collapsed-stack form used by ``flamegraph.pl`` is produced on download.
+
+Samples cover everything the loop thread runs while the request is in
+flight, including other requests interleaved with it. Only one request is
+profiled at a time. When neither a token nor a sampling rate is configured
+the middleware is not installed, so there is no cost at all.
+"""
+
+import asyncio
+import json
+import os
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+Frame = Tuple[str, str, int]
+
+PROFILE_NAME = re.compile(r"^[0-9]{8}T[0-9]{6}-[0-9a-f]{6}\.speedscope\.json$")
+
+
+class StackSampler:
+    """Samples one thread's Python stack from a helper thread
+
+    Each sample is weighted by the time since the previous one: a thread
+    holding the GIL delays the sampler, and counting samples would under-report it.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.002):
+        self.thread_id = thread_id
+        self.interval = interval
+        # stack -> seconds
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _stack(self) -> Optional[Tuple[Frame, ...]]:
+        frame = sys._current_frames().get(self.thread_id)
+        stack: List[Frame] = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+            frame = frame.f_back
+        return tuple(reversed(stack)) if stack else None
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            stack = self._stack()
+            if stack:
+                self.samples[stack] += now - last
+            last = now
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+
+def speedscope(name: str, samples: Counter) -> Dict[str, Any]:
+    """A sampled speedscope profile; weights are milliseconds"""
+    frames: List[Dict[str, Any]] = []
+    index: Dict[Frame, int] = {}
+    stacks, weights = [], []
+    for stack, seconds in samples.items():
+        ids = []
+        for frame in stack:
+            if frame not in index:
+                index[frame] = len(frames)
+                frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+            ids.append(index[frame])
+        stacks.append(ids)
+        weights.append(round(seconds * 1000, 3))
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": stacks,
+            "weights": weights,
+        }],
+        "exporter": "taskflow-profiler",
+    }
+
+
+def collapsed(profile: Dict[str, Any]) -> str:
+    """``flamegraph.pl`` input from a speedscope profile: one ``a;b;c weight`` line per stack"""
+    frames = profile["shared"]["frames"]
+    sampled = profile["profiles"][0]
+    lines = []
+    for stack, weight in zip(sampled["samples"], sampled["weights"]):
+        names = [f"{frames[i]['name']} ({Path(frames[i]['file']).name}:{frames[i]['line']})" for i in stack]
+        lines.append(f"{';'.join(names)} {weight}")
+    return "\n".join(lines) + "\n"
+
+
+class Profiler:
+    def __init__(self, directory: str, token: Optional[str] = None, sample_rate: float = 0.0,
+                 interval: float = 0.002, keep: int = 50):
+        self.directory = Path(directory)
+        self.token = token
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.keep = keep
+        # Held while a request is being profiled; the sampler watches a single thread
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.token) or self.sample_rate > 0
+
+    def wanted(self, headers: Dict[bytes, bytes]) -> bool:
+        header = headers.get(b"x-profile")
+        if self.token and header and secrets.compare_digest(header, self.token.encode()):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def save(self, method: str, path: str, status: int, seconds: float, sampler: StackSampler) -> str:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{os.urandom(3).hex()}.speedscope.json"
+        profile = speedscope(f"{method} {path} -> {status} in {seconds * 1000:.1f}ms", sampler.samples)
+        profile["request"] = {"method": method, "path": path, "status": status, "ms": round(seconds * 1000, 2)}
+        (self.directory / name).write_text(json.dumps(profile))
+        for old in sorted(self.directory.glob("*.speedscope.json"))[:-self.keep]:
+            old.unlink(missing_ok=True)
+        return name
+
+    def list(self) -> List[Dict[str, Any]]:
+        if not self.directory.exists():
+            return []
+        profiles = []
+        for path in sorted(self.directory.glob("*.speedscope.json"), reverse=True):
+            stat = path.stat()
+            profiles.append({"name": path.name, "bytes": stat.st_size, "created_at": stat.st_mtime})
+        return profiles
+
+    def path(self, name: str) -> Path:
+        """Raises ``KeyError`` for names that are not stored profiles (including path tricks)"""
+        path = self.directory / name
+        if not PROFILE_NAME.match(name) or not path.exists():
+            raise KeyError(name)
+        return path
+
+
+class ProfilingMiddleware:
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.profiler.wanted(dict(scope["headers"])):
+            await self.app(scope, receive, send)
+            return
+        if not self.profiler.lock.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        sampler = StackSampler(threading.get_ident(), self.profiler.interval)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            sampler.stop()
+            try:
+                # Rendering and writing the profile is file I/O; keep it off the event loop
+                await asyncio.to_thread(
+                    self.profiler.save, scope["method"], scope["path"], status, time.perf_counter() - started, sampler
+                )
+            finally:
+                self.profiler.lock.release()
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Incremental streak, level and skill engine for ``user_progress``.
+
+Every qualifying activity write advances the user's day streak and module
+skill XP with a single atomic pipeline update, and point awards recompute the
+level from a precomputed points-to-level table in the same update, so no code
+path ever needs to rescan history. ``backfill`` recomputes everyone once from
+the module collections in a single streaming pass:
+
+    python progress_engine.py backfill
+"""
+
+import argparse
+import asyncio
+import bisect
+import os
+import uuid
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from pymongo import ReturnDocument, UpdateOne
+
+from cold_storage import TIER_SOURCES, ColdStorage
+from feature_store import day_number, effective_streak, field_ref, inc_expr, streak_from_days, streak_stages
+from session_storage import SessionStorage
+from streams import merge_sorted
+
+MAX_LEVEL = 100
+# Total points needed to reach each level (index 0 is level 1): 50 * n * (n - 1)
+LEVEL_THRESHOLDS = [50 * n * (n - 1) for n in range(1, MAX_LEVEL + 1)]
+
+MAX_SKILL_LEVEL = 50
+# Activities logged in a module needed for each skill level: 0, 5, 15, 30, ...
+SKILL_THRESHOLDS = [5 * n * (n - 1) // 2 for n in range(1, MAX_SKILL_LEVEL + 1)]
+
+# (collection, module, day field) for every write that counts towards streaks
+QUALIFYING_SOURCES = [
+    ("pomodoro_sessions", "pomodoro", "timestamp"),
+    ("meditation_sessions", "mindfulness", "timestamp"),
+    ("five_minute_sessions", "five_minute_rule", "timestamp"),
+    ("activity_sessions", "physical_activity", "timestamp"),
+    ("thought_records", "cbt", "timestamp"),
+    ("sleep_data", "sleep_circadian", "sleep_date"),
+]
+
+POINTS = "__points__"
+
+PROGRESS_PROJECTION = {"_id": 0, "current_streak": 1, "longest_streak": 1, "level": 1}
+# Bookkeeping kept on user_progress for the incremental updates, not part of UserProgress
+INTERNAL_FIELDS = ("_id", "skill_xp", "last_activity_day")
+
+
+def level_for_points(points: int) -> int:
+    return bisect.bisect_right(LEVEL_THRESHOLDS, points)
+
+
+def skill_level_for_xp(xp: int) -> int:
+    return bisect.bisect_right(SKILL_THRESHOLDS, xp)
+
+
+def _table_lookup(table: List[int], value: Any) -> Dict[str, Any]:
+    """Server-side ``bisect_right`` over a fixed-size threshold table"""
+    return {"$size": {"$filter": {"input": table, "as": "t", "cond": {"$lte": ["$$t", value]}}}}
+
+
+def _as_datetime(value: Any) -> datetime:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, datetime.min.time())
+    return value
+
+
+def _defaults() -> Dict[str, Any]:
+    """Fill in the UserProgress defaults when the update upserts a new document"""
+    return {
+        "id": {"$ifNull": ["$id", str(uuid.uuid4())]},
+        "total_points": {"$ifNull": ["$total_points", 0]},
+        "level": {"$ifNull": ["$level", 1]},
+        "modules_unlocked": {"$ifNull": ["$modules_unlocked", []]},
+    }
+
+
+def activity_pipeline(module: str, when: Any) -> List[Dict[str, Any]]:
+    xp_path = f"skill_xp.{module}"
+    stages = [{"$set": {
+        **_defaults(),
+        xp_path: inc_expr(xp_path, 1),
+        "last_activity": {"$max": ["$last_activity", _as_datetime(when)]},
+    }}]
+    stages += streak_stages(day_number(when), "current_streak", "last_activity_day", "longest_streak")
+    stages.append({"$set": {
+        f"skill_levels.{module}": _table_lookup(SKILL_THRESHOLDS, field_ref(xp_path)),
+    }})
+    return stages
+
+
+def points_pipeline(points: int) -> List[Dict[str, Any]]:
+    return [
+        {"$set": {**_defaults(), "total_points": inc_expr("total_points", points)}},
+        {"$set": {"level": _table_lookup(LEVEL_THRESHOLDS, "$total_points")}},
+    ]
+
+
+def public_progress(progress: Optional[Dict[str, Any]], today: Optional[date] = None) -> Optional[Dict[str, Any]]:
+    """A user_progress document as the API returns it: bookkeeping dropped, streak as of today"""
+    if progress is None:
+        return None
+    public = {name: value for name, value in progress.items() if name not in INTERNAL_FIELDS}
+    public["current_streak"] = effective_streak(progress, today)
+    return public
+
+
+class ProgressEngine:
+    """Maintains streaks, level and skill levels on ``user_progress``
+
+    ``backfill`` aggregates bucketed sessions through ``storage``
+    (``SessionStorage``) and also counts the activity ``archive``
+    (``ColdStorage``) has moved out of the module collections.
+    """
+
+    def __init__(self, db, storage=None, archive=None):
+        self.db = db
+        self.storage = storage
+        self.archive = archive
+
+    async def ensure_indexes(self):
+        await self.db.user_progress.create_index("user_id")
+
+    async def record_activity(self, user_id: str, module: str, when: Any) -> Dict[str, Any]:
+        """Apply an activity and return the updated streak and level fields"""
+        return await self.db.user_progress.find_one_and_update(
+            {"user_id": user_id},
+            activity_pipeline(module, when),
+            projection=PROGRESS_PROJECTION,
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def add_points(self, user_id: str, points: int) -> int:
+        """Add points, recompute the level and return the new total"""
+        progress = await self.db.user_progress.find_one_and_update(
+            {"user_id": user_id},
+            points_pipeline(points),
+            projection={"_id": 0, "total_points": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return progress["total_points"]
+
+    # ---- backfill ----
+
+    async def _activity_days(self, collection: str, module: str, day_field: str,
+                             user_ids: Optional[List[str]] = None):
+        """Distinct (user, day) pairs for one collection, sorted by user then day"""
+        value = field_ref(day_field)
+        day = {"$cond": [
+            {"$eq": [{"$type": value}, "string"]},
+            {"$substrBytes": [value, 0, 10]},
+            {"$dateToString": {"format": "%Y-%m-%d", "date": value}},
+        ]}
+        query = {"user_id": {"$in": user_ids}} if user_ids is not None else {}
+        pipeline = [
+            {"$project": {"_id": 0, "user_id": 1, "day": day}},
+            {"$group": {"_id": {"user_id": "$user_id", "day": "$day"}, "count": {"$sum": 1}}},
+            {"$sort": {"_id.user_id": 1, "_id.day": 1}},
+        ]
+        if self.storage and self.storage.manages(collection):
+            # Bucketed and not yet converted sessions; a day in both comes out twice,
+            # which backfill folds together (days are a set, counts are summed)
+            cursors = self.storage.aggregate(collection, query, pipeline)
+        else:
+            cursors = [self.db[collection].aggregate([{"$match": query}, *pipeline], allowDiskUse=True)]
+        rows = merge_sorted(cursors, key=lambda row: (row["_id"]["user_id"], row["_id"]["day"]))
+        async for row in rows:
+            yield row["_id"]["user_id"], module, day_number(row["_id"]["day"]), row["count"]
+
+    async def _archived_days(self, collection: str, module: str, day_field: str,
+                             user_ids: Optional[List[str]] = None):
+        """(user, day) counts of one collection's archived records, sorted like ``_activity_days``"""
+        current, days = None, {}
+        async for user_id, records in self.archive.iter_archives(collection, user_ids):
+            if user_id != current:
+                for day in sorted(days):
+                    yield current, module, day, days[day]
+                current, days = user_id, {}
+            for record in records:
+                day = day_number(record[day_field])
+                days[day] = days.get(day, 0) + 1
+        for day in sorted(days):
+            yield current, module, day, days[day]
+
+    async def _achievement_points(self, user_ids: Optional[List[str]] = None):
+        query = {"user_id": {"$in": user_ids}} if user_ids is not None else {}
+        cursor = self.db.achievements.aggregate([
+            {"$match": query},
+            {"$group": {"_id": "$user_id", "points": {"$sum": "$points_earned"}}},
+            {"$sort": {"_id": 1}},
+        ], allowDiskUse=True)
+        async for row in cursor:
+            yield row["_id"], POINTS, None, row["points"]
+
+    @staticmethod
+    def _progress_update(user_id: str, days: set, xp: Dict[str, int], points: int) -> UpdateOne:
+        streak = streak_from_days(sorted(days))
+        fields: Dict[str, Any] = {
+            "total_points": points,
+            "level": level_for_points(points),
+            "skill_xp": xp,
+            "skill_levels": {module: skill_level_for_xp(count) for module, count in xp.items()},
+            "current_streak": streak.get("streak", 0),
+            "longest_streak": streak.get("longest", 0),
+        }
+        update: Dict[str, Any] = {
+            "$set": fields,
+            "$setOnInsert": {"id": str(uuid.uuid4()), "modules_unlocked": []},
+        }
+        if streak:
+            fields["last_activity_day"] = streak["last_day"]
+            update["$max"] = {"last_activity": datetime.combine(
+                date.fromordinal(streak["last_day"]), datetime.min.time()
+            )}
+        return UpdateOne({"user_id": user_id}, update, upsert=True)
+
+    async def backfill(self, batch_size: int = 500, user_ids: Optional[List[str]] = None) -> Dict[str, int]:
+        """Recompute streaks, levels and skills for every user from history
+
+        Each source is aggregated server-side into per-user rows sorted by
+        user_id and the streams are k-way merged, so only one user's activity
+        days are held in memory at a time. ``user_ids`` limits it to those
+        users, e.g. after a bulk import of their history.
+        """
+        sources = [self._activity_days(*source, user_ids) for source in QUALIFYING_SOURCES]
+        if self.archive:
+            # A day found both archived and hot comes out twice; days are a set and counts add up
+            sources += [self._archived_days(*source, user_ids) for source in QUALIFYING_SOURCES
+                        if self.archive.manages(source[0])]
+        sources.append(self._achievement_points(user_ids))
+
+        stats = {"users": 0, "activity_days": 0}
+        batch: List[UpdateOne] = []
+        current = None
+        days: set = set()
+        xp: Dict[str, int] = {}
+        points = 0
+
+        async def flush():
+            if batch:
+                await self.db.user_progress.bulk_write(batch, ordered=False)
+                batch.clear()
+
+        async for user_id, module, day, count in merge_sorted(sources, key=lambda row: row[0]):
+            if user_id != current:
+                if current is not None:
+                    batch.append(self._progress_update(current, days, xp, points))
+                    stats["users"] += 1
+                    if len(batch) >= batch_size:
+                        await flush()
+                current, days, xp, points = user_id, set(), {}, 0
+            if module == POINTS:
+                points = count
+            else:
+                days.add(day)
+                xp[module] = xp.get(module, 0) + count
+                stats["activity_days"] += 1
+
+        if current is not None:
+            batch.append(self._progress_update(current, days, xp, points))
+            stats["users"] += 1
+        await flush()
+        return stats
+
+
+async def _main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME'].strip('"')]
+    try:
+        storage = SessionStorage(db, os.environ.get('SESSION_STORAGE_MODE', 'documents'))
+        await storage.ensure_layout()
+        # Bucketed collections are never archived, as in server.py
+        archive = ColdStorage(db, {name: source for name, source in TIER_SOURCES.items()
+                                   if not storage.uses_buckets(name)})
+        engine = ProgressEngine(db, storage=storage, archive=archive)
+        stats = await engine.backfill(batch_size=args.batch_size)
+        print(f"Backfilled {stats['users']} users from {stats['activity_days']} activity days")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,231 @@
+"""
+WebSocket push channel backed by an in-process pub/sub hub.
+
+Each connected client subscribes to its own user channel. Events (partner
+check-ins, achievements, coin awards) are serialized once and fanned out to
+the channels of the user and their partners. Every connection has a bounded
+send queue: when a client cannot keep up, messages are dropped for it and a
+persistently slow consumer is disconnected instead of growing memory.
+
+With ``MongoBridge`` enabled, events are also relayed through a capped
+collection so clients connected to other workers receive them too.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import defaultdict, deque
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional, Set
+
+from fastapi import WebSocket, WebSocketDisconnect
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+logger = logging.getLogger(__name__)
+
+SLOW_CONSUMER_CLOSE_CODE = 1013  # "try again later"
+
+
+class RateCounter:
+    """Events per second over a sliding window of one-second buckets"""
+
+    def __init__(self, window: int = 60):
+        self.window = window
+        self._buckets = deque()  # (second, count)
+
+    def add(self, count: int = 1):
+        now = int(time.monotonic())
+        if self._buckets and self._buckets[-1][0] == now:
+            self._buckets[-1][1] += count
+        else:
+            self._buckets.append([now, count])
+        self._trim(now)
+
+    def _trim(self, now: int):
+        while self._buckets and self._buckets[0][0] <= now - self.window:
+            self._buckets.popleft()
+
+    def rate(self) -> float:
+        self._trim(int(time.monotonic()))
+        return round(sum(count for _, count in self._buckets) / self.window, 3)
+
+
+class Connection:
+    def __init__(self, websocket: WebSocket, user_id: str, queue_size: int):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.too_slow = asyncio.Event()
+
+
+class RealtimeHub:
+    def __init__(self, queue_size: int = 100, max_drops: int = 50):
+        self.queue_size = queue_size
+        self.max_drops = max_drops
+        self.channels: Dict[str, Set[Connection]] = defaultdict(set)
+        self.bridge: Optional["MongoBridge"] = None
+
+        self.connections = 0
+        self.connections_total = 0
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.slow_disconnects = 0
+        self.publish_rate = RateCounter()
+        self.delivery_rate = RateCounter()
+
+    # ---- connections ----
+
+    async def serve(self, websocket: WebSocket, user_id: str):
+        """Run a client connection until it disconnects or is dropped as too slow"""
+        await websocket.accept()
+        connection = Connection(websocket, user_id, self.queue_size)
+        self.channels[user_id].add(connection)
+        self.connections += 1
+        self.connections_total += 1
+        tasks = [
+            asyncio.create_task(self._send_loop(connection)),
+            asyncio.create_task(self._receive_loop(connection)),
+            asyncio.create_task(connection.too_slow.wait()),
+        ]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            channel = self.channels.get(user_id)
+            if channel is not None:
+                channel.discard(connection)
+                if not channel:
+                    del self.channels[user_id]
+            self.connections -= 1
+            if connection.too_slow.is_set():
+                self.slow_disconnects += 1
+                try:
+                    await websocket.close(code=SLOW_CONSUMER_CLOSE_CODE)
+                except Exception:
+                    pass
+
+    async def _send_loop(self, connection: Connection):
+        while True:
+            payload = await connection.queue.get()
+            await connection.websocket.send_text(payload)
+            self.delivered += 1
+            self.delivery_rate.add()
+
+    async def _receive_loop(self, connection: Connection):
+        try:
+            while True:
+                message = await connection.websocket.receive_text()
+                if message == "ping":
+                    self._offer(connection, json.dumps({"type": "pong"}))
+        except WebSocketDisconnect:
+            pass
+
+    def _offer(self, connection: Connection, payload: str):
+        try:
+            connection.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            connection.dropped += 1
+            self.dropped += 1
+            if connection.dropped >= self.max_drops:
+                connection.too_slow.set()
+
+    # ---- publishing ----
+
+    def publish_local(self, channels: Iterable[str], payload: str):
+        for channel in set(channels):
+            for connection in list(self.channels.get(channel, ())):
+                self._offer(connection, payload)
+
+    async def publish(self, channels: Iterable[str], event_type: str, data: Dict[str, Any]):
+        """Serialize an event once and push it to every subscriber of ``channels``"""
+        channels = list(set(channels))
+        payload = json.dumps(
+            {"type": event_type, "data": data, "sent_at": datetime.utcnow()}, default=str
+        )
+        self.published += 1
+        self.publish_rate.add()
+        self.publish_local(channels, payload)
+        if self.bridge is not None:
+            try:
+                await self.bridge.send(channels, payload)
+            except Exception as e:
+                logger.warning(f"Realtime bridge publish failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connections": self.connections,
+            "connections_total": self.connections_total,
+            "subscribed_channels": len(self.channels),
+            "messages_published": self.published,
+            "messages_delivered": self.delivered,
+            "messages_dropped": self.dropped,
+            "slow_consumer_disconnects": self.slow_disconnects,
+            "publish_rate_per_second": self.publish_rate.rate(),
+            "delivery_rate_per_second": self.delivery_rate.rate(),
+            "bridge": self.bridge.stats() if self.bridge else None,
+        }
+
+
+class MongoBridge:
+    """Relays hub events between workers through a capped collection"""
+
+    def __init__(self, db, hub: RealtimeHub, collection: str = "realtime_events", size_bytes: int = 16 * 1024 * 1024):
+        self.db = db
+        self.hub = hub
+        self.collection_name = collection
+        self.size_bytes = size_bytes
+        self.worker_id = str(uuid.uuid4())
+        self.relayed_in = 0
+        self.relayed_out = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def collection(self):
+        return self.db[self.collection_name]
+
+    async def start(self):
+        try:
+            await self.db.create_collection(self.collection_name, capped=True, size=self.size_bytes)
+        except CollectionInvalid:
+            pass  # already created by another worker
+        self.hub.bridge = self
+        self._task = asyncio.create_task(self._tail())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        self.hub.bridge = None
+
+    async def send(self, channels, payload: str):
+        await self.collection.insert_one({"origin": self.worker_id, "channels": channels, "payload": payload})
+        self.relayed_out += 1
+
+    async def _tail(self):
+        # Start after the newest existing event so history is not replayed
+        newest = await self.collection.find_one({}, sort=[("$natural", -1)])
+        last_id = newest["_id"] if newest else None
+        while True:
+            query = {"_id": {"$gt": last_id}} if last_id else {}
+            cursor = self.collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+            try:
+                async for event in cursor:
+                    last_id = event["_id"]
+                    if event["origin"] != self.worker_id:
+                        self.hub.publish_local(event["channels"], event["payload"])
+                        self.relayed_in += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Realtime bridge cursor error: {e}")
+            # Tailable cursors die on an empty collection or when they fall off the cap
+            await asyncio.sleep(1)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"worker_id": self.worker_id, "relayed_in": self.relayed_in, "relayed_out": self.relayed_out}
@@ -1,4 +1,5 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, WebSocket, Request, Query, Header, BackgroundTasks
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
@@ -6,24 +7,215 @@ from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 from pathlib import Path
+from contextlib import asynccontextmanager
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any, Union
+from typing import List, Optional, Dict, Any, Union, Tuple
 import uuid
 from datetime import datetime, date
 from enum import Enum
-from emergentintegrations.llm.chat import LlmChat, UserMessage
 import json
 import asyncio
+import time
+import secrets
 from bson import ObjectId
+from feature_store import FeatureStore, compact_features, heuristic_insights, render_features
+from circuit_breaker import CircuitBreaker
+from progress_engine import ProgressEngine, public_progress
+from achievement_engine import AchievementEngine
+from leaderboard import BOARDS, Leaderboards
+from partner_graph import PartnerGraph
+from realtime import MongoBridge, RealtimeHub
+from live_sessions import LiveSessionRegistry
+from checkin_scheduler import CheckInScheduler
+from timeline import Timeline
+from data_export import DataExporter
+from bulk_import import BulkImporter
+from sleep_history import SleepHistory, stored_sleep_date
+from session_storage import SessionStorage
+from cold_storage import TIER_SOURCES, ColdStorage
+from metrics import CONTENT_TYPE, MetricsMiddleware, MetricsRegistry, MongoCommandMetrics, MongoPoolMetrics
+from db_monitor import CommandMonitor, DbAccountingMiddleware
+from profiler import Profiler, ProfilingMiddleware, collapsed
+from tracing import KIND_CLIENT, MongoTracing, Tracer, TracingMiddleware, traced_route
+from memory_engine import MemoryClient
+from lazy_imports import LazyModule
+from db_health import DbHealth, pool_options
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# Prometheus metrics served at /metrics
+metrics = MetricsRegistry()
+
+# Request profiling, triggered by X-Profile: <PROFILE_ADMIN_TOKEN> or for a
+# PROFILE_SAMPLE_RATE fraction of requests; not installed when neither is set
+profiler = Profiler(
+    directory=os.environ.get('PROFILE_DIR', str(ROOT_DIR / 'profiles')),
+    token=os.environ.get('PROFILE_ADMIN_TOKEN'),
+    sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', 0)),
+    interval=float(os.environ.get('PROFILE_INTERVAL_MS', 2)) / 1000,
+)
+
+# Request tracing, exported as OTLP JSON to TRACE_EXPORT (a file path or an
+# OTLP/HTTP collector URL); only traces slower than TRACE_SLOW_MS, failed ones
+# and a TRACE_SAMPLE_RATE fraction of the rest are kept. Off when unset
+tracer = Tracer(
+    service=os.environ.get('TRACE_SERVICE_NAME', 'taskflow-backend'),
+    export=os.environ.get('TRACE_EXPORT'),
+    slow_ms=float(os.environ.get('TRACE_SLOW_MS', 0)),
+    sample_rate=float(os.environ.get('TRACE_SAMPLE_RATE', 0)),
+)
+
+# Slow-query log and per-request DB call accounting
+command_monitor = CommandMonitor(slow_ms=float(os.environ.get('MONGO_SLOW_QUERY_MS', 100)))
+
+# Storage backend: 'mongo' (Motor) or 'memory', an in-process engine with the
+# same API used for benchmarks and local runs; its data lives as long as the process
+storage_backend = os.environ.get('STORAGE_BACKEND', 'mongo')
+pool_metrics = None
+if storage_backend == 'memory':
+    client = MemoryClient()
+elif storage_backend == 'mongo':
+    # MongoDB connection; pool sizing and timeouts from the MONGO_* pool
+    # variables (see db_health.POOL_SETTINGS), driver defaults otherwise
+    mongo_url = os.environ['MONGO_URL']
+    pool_metrics = MongoPoolMetrics(metrics)
+    mongo_listeners = [MongoCommandMetrics(metrics), pool_metrics, command_monitor]
+    if tracer.enabled:
+        mongo_listeners.append(MongoTracing(tracer))
+    client = AsyncIOMotorClient(mongo_url, event_listeners=mongo_listeners, **pool_options(os.environ))
+    metrics.gauge(
+        "mongo_pool_max_connections", "Configured maximum pool size per server",
+        collect=lambda: {(): client.options.pool_options.max_pool_size},
+    )
+else:
+    raise RuntimeError(f"Unknown STORAGE_BACKEND {storage_backend!r}; expected 'mongo' or 'memory'")
 db = client[os.environ['DB_NAME'].strip('"')]
 
+# Liveness and readiness probes; a worker stops being ready when its pool is
+# READY_MAX_POOL_SATURATION full, has more than READY_MAX_POOL_WAITERS queued
+# checkouts (default: the pool size) or a ping takes over READY_MAX_PING_MS
+db_health = DbHealth(
+    db,
+    pool=pool_metrics,
+    max_pool_size=client.options.pool_options.max_pool_size if pool_metrics else None,
+    max_saturation=float(os.environ.get('READY_MAX_POOL_SATURATION', 0.95)),
+    max_waiters=int(os.environ['READY_MAX_POOL_WAITERS']) if os.environ.get('READY_MAX_POOL_WAITERS') else None,
+    ping_timeout=float(os.environ.get('READY_PING_TIMEOUT_MS', 1000)) / 1000,
+    max_ping_ms=float(os.environ.get('READY_MAX_PING_MS', 500)),
+)
+
+# Storage layout of the session collections: documents, timeseries or buckets
+session_storage = SessionStorage(
+    db,
+    mode=os.environ.get('SESSION_STORAGE_MODE', 'documents'),
+    bucket_days=float(os.environ.get('SESSION_BUCKET_DAYS', 7)),
+    bucket_size=int(os.environ.get('SESSION_BUCKET_SIZE', 200)),
+)
+# Views and time-series collections need MongoDB
+if storage_backend == 'memory' and session_storage.mode != 'documents':
+    raise RuntimeError(
+        f"SESSION_STORAGE_MODE={session_storage.mode!r} is not supported with STORAGE_BACKEND='memory'; "
+        "use 'documents'"
+    )
+
+# Old sessions and coin transactions moved to compressed per-user archives;
+# bucketed collections are already compact and stay hot
+cold_storage = ColdStorage(
+    db,
+    sources={name: source for name, source in TIER_SOURCES.items() if not session_storage.uses_buckets(name)},
+    hot_days=float(os.environ.get('TIER_HOT_DAYS', 180)),
+    chunk_size=int(os.environ.get('TIER_CHUNK_SIZE', 500)),
+    interval=float(os.environ.get('TIER_INTERVAL_HOURS', 24)) * 3600,
+)
+# Set TIERING_ENABLED=true to run the archiving job on this worker
+tiering_enabled = os.environ.get('TIERING_ENABLED', 'false').lower() == 'true'
+
+# Precomputed per-user features for AI insights
+feature_store = FeatureStore(db, archive=cold_storage, storage=session_storage)
+
+# Streaks, level and skill levels on user_progress
+progress_engine = ProgressEngine(db, storage=session_storage, archive=cold_storage)
+
+# In-memory leaderboards over scores shared in Mongo; changes made by other
+# workers show up within LEADERBOARD_SYNC_SECONDS
+leaderboards = Leaderboards(db, sync_interval=float(os.environ.get('LEADERBOARD_SYNC_SECONDS', 5)))
+
+async def award_points(user_id: str, points: int):
+    """Add gamification points to a user's progress and the leaderboards"""
+    total = await progress_engine.add_points(user_id, points)
+    await leaderboards.record_points(user_id, points, total)
+
+# Accountability partnerships with a cached adjacency list per user
+partner_graph = PartnerGraph(
+    db,
+    max_entries=int(os.environ.get('PARTNER_CACHE_SIZE', 10000)),
+    ttl=float(os.environ.get('PARTNER_CACHE_TTL_SECONDS', 60)),
+)
+
+# WebSocket push of partner check-ins, achievements and coin events
+realtime_hub = RealtimeHub(
+    queue_size=int(os.environ.get('REALTIME_QUEUE_SIZE', 100)),
+    max_drops=int(os.environ.get('REALTIME_MAX_DROPS', 50)),
+)
+# Set REALTIME_BRIDGE=mongo to relay events between workers
+realtime_bridge = MongoBridge(db, realtime_hub) if os.environ.get('REALTIME_BRIDGE') == 'mongo' else None
+if realtime_bridge and storage_backend == 'memory':
+    raise RuntimeError("REALTIME_BRIDGE='mongo' relays through a capped collection and needs STORAGE_BACKEND='mongo'")
+
+# Rule-based achievements unlocked automatically from activity events
+achievement_engine = AchievementEngine(db, award_points, storage=session_storage, archive=cold_storage)
+
+# Running Pomodoro sessions, logged when finished or when heartbeats stop
+live_sessions = LiveSessionRegistry(
+    db,
+    on_complete=lambda session_dict: log_pomodoro_session(session_dict),
+    heartbeat_timeout=float(os.environ.get('LIVE_SESSION_TIMEOUT_SECONDS', 90)),
+    checkpoint_interval=float(os.environ.get('LIVE_SESSION_CHECKPOINT_SECONDS', 15)),
+)
+
+# Merged cross-module activity history
+timeline = Timeline(db, archive=cold_storage, storage=session_storage)
+
+# Streaming NDJSON/CSV exports
+data_exporter = DataExporter(db, archive=cold_storage, storage=session_storage)
+
+# Native-date sleep queries and rollups; backfills legacy string dates online
+sleep_history = SleepHistory(
+    db,
+    batch_size=int(os.environ.get('SLEEP_MIGRATION_BATCH_SIZE', 500)),
+    pause=float(os.environ.get('SLEEP_MIGRATION_PAUSE_SECONDS', 0.05)),
+)
+
+# Check-in reminders, sharded across workers by user id
+checkin_scheduler = CheckInScheduler(
+    db,
+    on_reminder=lambda reminder: send_check_in_reminder(reminder),
+    shards=int(os.environ.get('CHECKIN_SCHEDULER_SHARDS', 64)),
+    lead=float(os.environ.get('CHECKIN_REMINDER_LEAD_MINUTES', 10)) * 60,
+    horizon=float(os.environ.get('CHECKIN_SCHEDULER_HORIZON_SECONDS', 3600)),
+    refresh_interval=float(os.environ.get('CHECKIN_SCHEDULER_REFRESH_SECONDS', 60)),
+)
+
+# Circuit breaker around the LLM; when it is open or a call misses its
+# deadline, insights are served from local rules instead. Calls slower than
+# LLM_SLOW_CALL_SECONDS (default: 3/4 of the deadline) count as failures
+llm_breaker = CircuitBreaker(
+    "llm",
+    deadline=float(os.environ.get('LLM_DEADLINE_SECONDS', 8)),
+    window=int(os.environ.get('LLM_BREAKER_WINDOW', 20)),
+    min_calls=int(os.environ.get('LLM_BREAKER_MIN_CALLS', 5)),
+    failure_rate=float(os.environ.get('LLM_BREAKER_FAILURE_RATE', 0.5)),
+    slow_call_seconds=float(os.environ['LLM_SLOW_CALL_SECONDS']) if os.environ.get('LLM_SLOW_CALL_SECONDS') else None,
+    cooldown=float(os.environ.get('LLM_BREAKER_COOLDOWN_SECONDS', 30)),
+)
+llm_latency = metrics.histogram("llm_request_duration_seconds", "LLM call latency by outcome", ("outcome",))
+llm_errors = metrics.counter("llm_errors_total", "Failed LLM calls by exception type", ("error",))
+metrics.gauge(
+    "llm_breaker_state", "1 for the LLM circuit breaker's current state", ("state",),
+    collect=lambda: {(llm_breaker.stats()["state"],): 1},
+)
+
 # Helper function to clean MongoDB documents
 def clean_mongo_doc(doc):
     """Remove MongoDB ObjectId and other non-serializable fields"""
@@ -47,11 +239,54 @@ def clean_mongo_doc(doc):
         return cleaned
     return doc
 
+# Largest page any history route returns
+MAX_HISTORY_LIMIT = 500
+
+# (collection, time field) served by history routes; timeline indexes cover the timestamp ones
+HISTORY_INDEXES = [
+    ("behavioral_activations", "created_at"),
+    ("sleep_data", "sleep_date"),
+    ("achievements", "unlock_date"),
+    ("coin_transactions", "timestamp"),
+    ("store_purchases", "purchase_date"),
+]
+
+def history_query(user_id: Any, field: str, since: Optional[datetime], until: Optional[datetime]) -> Dict[str, Any]:
+    """Filter for a user's records with ``field`` in ``[since, until]``, served by a (user_id, field) index"""
+    if since and until and since > until:
+        raise HTTPException(status_code=400, detail="since must not be after until")
+    query = {"user_id": user_id}
+    bounds = {}
+    if since:
+        bounds["$gte"] = since
+    if until:
+        bounds["$lte"] = until
+    if bounds:
+        query[field] = bounds
+    return query
+
+async def session_history(collection: str, user_id: str, since: Optional[datetime], until: Optional[datetime],
+                          limit: int) -> List[Dict[str, Any]]:
+    """Newest sessions in ``[since, until]``, falling through to the cold archives past the hot horizon"""
+    query = history_query(user_id, "timestamp", since, until)
+    sessions = await session_storage.find(collection, query, limit)
+    return await cold_storage.fill(collection, query, sessions, limit)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Indexes and background workers for the life of the app; see ``startup`` and ``shutdown``"""
+    await startup()
+    try:
+        yield
+    finally:
+        await shutdown()
+
 # Create the main app without a prefix
-app = FastAPI(title="Anti-Procrastination Productivity App", version="1.0.0")
+app = FastAPI(title="Anti-Procrastination Productivity App", version="1.0.0", lifespan=lifespan)
+app.router.route_class = traced_route(tracer)
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", route_class=traced_route(tracer))
 
 # Security
 security = HTTPBearer()
@@ -191,6 +426,19 @@ class PomodoroSession(BaseModel):
     productivity_score: float
     timestamp: datetime = Field(default_factory=datetime.utcnow)
 
+class LivePomodoroStart(BaseModel):
+    user_id: str
+    task_name: str
+    work_duration: int = Field(25, gt=0)  # minutes
+    break_duration: int = Field(5, ge=0)  # minutes
+    cycles: int = Field(1, gt=0)
+
+class LivePomodoroHeartbeat(BaseModel):
+    focus_rating: Optional[int] = Field(None, ge=1, le=10)
+
+class LivePomodoroFinish(BaseModel):
+    break_activities: List[str] = []
+
 # ===============================
 # IMPLEMENTATION INTENTIONS MODELS
 # ===============================
@@ -327,6 +575,13 @@ class BehaviorPattern(BaseModel):
     interventions_suggested: List[str]
     effectiveness_data: Dict[str, Any] = Field(default_factory=dict)
 
+class CohortExportRequest(BaseModel):
+    user_ids: List[str]
+    format: str = "ndjson"  # ndjson, csv
+    collections: Optional[List[str]] = None
+    gzip: bool = False
+    offset: int = 0  # records already received, to resume an interrupted export
+
 class PersonalizedRecommendation(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
@@ -343,22 +598,123 @@ class PersonalizedRecommendation(BaseModel):
 # API ROUTES
 # ===============================
 
+def prepare_sleep_document(sleep_dict: Dict[str, Any]) -> Dict[str, Any]:
+    """Store the sleep date as a native date (midnight UTC) so it can be range-scanned"""
+    if 'sleep_date' in sleep_dict:
+        sleep_dict['sleep_date'] = stored_sleep_date(sleep_dict['sleep_date'])
+    return sleep_dict
+
+# Collections that accept bulk imports, with the model each row is validated against
+IMPORT_MODELS = {
+    "thought_records": ThoughtRecord,
+    "behavioral_activations": BehavioralActivation,
+    "meditation_sessions": MeditationSession,
+    "mindfulness_checkins": MindfulnessCheckIn,
+    "pomodoro_sessions": PomodoroSession,
+    "five_minute_sessions": FiveMinuteSession,
+    "activity_sessions": ActivitySession,
+    "sleep_data": SleepData,
+}
+IMPORT_PREPARE = {"sleep_data": prepare_sleep_document}
+
+bulk_importer = BulkImporter(
+    db, IMPORT_MODELS, IMPORT_PREPARE, batch_size=int(os.environ.get('IMPORT_BATCH_SIZE', 1000)),
+    storage=session_storage,
+    on_import=lambda collection, user_ids: refresh_imported_history(collection, user_ids),
+)
+
+# The LLM integration imports every provider SDK, so it is loaded on first use
+# (and preloaded in the background after startup unless LLM_PRELOAD=0)
+llm_chat_module = LazyModule("emergentintegrations.llm.chat")
+
 # AI Chat Helper
-async def get_ai_insights(prompt: str, context: Dict[str, Any] = None) -> str:
-    """Get AI insights using Emergent LLM integration"""
-    try:
-        chat = LlmChat(
-            api_key=os.environ['EMERGENT_LLM_KEY'],
-            session_id=str(uuid.uuid4()),
-            system_message="You are an expert behavioral psychologist and productivity coach specializing in evidence-based anti-procrastination interventions."
-        ).with_model("openai", "gpt-4o-mini")
-        
-        user_message = UserMessage(text=prompt)
-        response = await chat.send_message(user_message)
-        return response
-    except Exception as e:
-        logging.error(f"AI insights error: {e}")
-        return "AI insights temporarily unavailable"
+async def call_llm(prompt: str) -> str:
+    """Send a prompt to the Emergent LLM integration"""
+    llm_chat = await llm_chat_module.load()
+    chat = llm_chat.LlmChat(
+        api_key=os.environ['EMERGENT_LLM_KEY'],
+        session_id=str(uuid.uuid4()),
+        system_message="You are an expert behavioral psychologist and productivity coach specializing in evidence-based anti-procrastination interventions."
+    ).with_model("openai", "gpt-4o-mini")
+    
+    user_message = llm_chat.UserMessage(text=prompt)
+    started = time.perf_counter()
+    # Stays "cancelled" when the circuit breaker's deadline cancels the call
+    outcome = "cancelled"
+    with tracer.span("llm send_message", KIND_CLIENT, **{"llm.provider": "openai", "llm.model": "gpt-4o-mini"}):
+        try:
+            response = await chat.send_message(user_message)
+            outcome = "ok"
+            return response
+        except Exception as e:
+            outcome = "error"
+            llm_errors.inc(type(e).__name__)
+            raise
+        finally:
+            llm_latency.observe(time.perf_counter() - started, outcome)
+
+async def get_ai_insights(prompt: str, context: Dict[str, Any] = None) -> Tuple[str, str]:
+    """Get AI insights, falling back to local rules when the LLM is down or slow
+
+    Returns the insight text and its source ("llm" or "fallback").
+    """
+    def fallback():
+        if context is None:
+            return "AI insights temporarily unavailable"
+        return heuristic_insights(context)
+    
+    with tracer.span("llm insights") as span:
+        text, used_fallback = await llm_breaker.call_with_fallback(lambda: call_llm(prompt), fallback)
+        source = "fallback" if used_fallback else "llm"
+        if span:
+            span.set("llm.source", source)
+    return text, source
+
+async def notify_partners(user_id: str, event_type: str, data: Dict[str, Any]):
+    """Push an event to a user and their accountability partners"""
+    partner_ids = await partner_graph.partner_ids(user_id)
+    await realtime_hub.publish([user_id, *partner_ids], event_type, {"user_id": user_id, **data})
+
+async def send_check_in_reminder(reminder: Dict[str, Any]):
+    """Push a due check-in reminder to both partners"""
+    partnership = await partner_graph.get(reminder["partnership_id"])
+    if partnership:
+        await realtime_hub.publish(
+            [partnership["user_id"], partnership["partner_id"]], "check_in_reminder", reminder
+        )
+
+async def dispatch_achievements(user_id: str, event: str, doc: Dict[str, Any], progress: Dict[str, Any] = None):
+    """Evaluate achievement rules for an event and announce any unlocks"""
+    awarded = await achievement_engine.dispatch(user_id, event, doc, progress)
+    for achievement in awarded:
+        await notify_partners(user_id, "achievement", {"achievement": achievement})
+
+async def refresh_imported_history(collection: str, user_ids: List[str]):
+    """Recompute the state derived from history for users whose records were bulk imported"""
+    await progress_engine.backfill(user_ids=user_ids)
+    progress = {
+        doc["user_id"]: doc
+        async for doc in db.user_progress.find(
+            {"user_id": {"$in": user_ids}},
+            {"_id": 0, "user_id": 1, "total_points": 1, "current_streak": 1, "longest_streak": 1, "level": 1},
+        )
+    }
+    for user_id in user_ids:
+        await feature_store.rebuild(user_id)
+        if user_id in progress:
+            # Before reseeding: unlocks award their points through award_points, which updates the boards too
+            await leaderboards.record_total(user_id, progress[user_id].get("total_points", 0))
+        awarded = await achievement_engine.reseed(user_id, progress.get(user_id))
+        for achievement in awarded:
+            await notify_partners(user_id, "achievement", {"achievement": achievement})
+
+async def track_activity(user_id: str, module: ModuleType, when, doc: Dict[str, Any], *updates):
+    """Apply the derived-state updates that follow a qualifying activity write"""
+    progress, *_ = await asyncio.gather(
+        progress_engine.record_activity(user_id, module.value, when),
+        *updates
+    )
+    await dispatch_achievements(user_id, module.value, doc, progress)
 
 # User Management
 @api_router.post("/users", response_model=User)
@@ -390,14 +746,20 @@ async def get_user(user_id: str):
 @api_router.post("/cbt/thought-records", response_model=ThoughtRecord)
 async def create_thought_record(thought_record: ThoughtRecord):
     """Create a new thought record"""
-    await db.thought_records.insert_one(thought_record.dict())
+    record_dict = thought_record.dict()
+    await db.thought_records.insert_one(record_dict)
+    await track_activity(
+        thought_record.user_id, ModuleType.CBT, thought_record.timestamp, record_dict,
+        feature_store.record_thought_record(record_dict)
+    )
     return thought_record
 
 @api_router.get("/cbt/thought-records/{user_id}", response_model=List[ThoughtRecord])
-async def get_thought_records(user_id: str, limit: int = 50):
+async def get_thought_records(user_id: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                              limit: int = Query(50, ge=1, le=MAX_HISTORY_LIMIT)):
     """Get thought records for a user"""
     records = await db.thought_records.find(
-        {"user_id": user_id}
+        history_query(user_id, "timestamp", since, until)
     ).sort("timestamp", -1).limit(limit).to_list(limit)
     return [ThoughtRecord(**record) for record in records]
 
@@ -408,26 +770,28 @@ async def create_behavioral_activation(activation: BehavioralActivation):
     return activation
 
 @api_router.get("/cbt/behavioral-activation/{user_id}", response_model=List[BehavioralActivation])
-async def get_behavioral_activations(user_id: str):
+async def get_behavioral_activations(user_id: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                                     limit: int = Query(100, ge=1, le=MAX_HISTORY_LIMIT)):
     """Get behavioral activation plans for a user"""
     activations = await db.behavioral_activations.find(
-        {"user_id": user_id}
-    ).sort("created_at", -1).to_list(100)
+        history_query(user_id, "created_at", since, until)
+    ).sort("created_at", -1).limit(limit).to_list(limit)
     return [BehavioralActivation(**activation) for activation in activations]
 
 # Mindfulness Module Routes
 @api_router.post("/mindfulness/sessions", response_model=MeditationSession)
 async def create_meditation_session(session: MeditationSession):
     """Log a meditation session"""
-    await db.meditation_sessions.insert_one(session.dict())
+    session_dict = session.dict()
+    await session_storage.insert_one("meditation_sessions", session_dict)
+    await track_activity(session.user_id, ModuleType.MINDFULNESS, session.timestamp, session_dict)
     return session
 
 @api_router.get("/mindfulness/sessions/{user_id}", response_model=List[MeditationSession])
-async def get_meditation_sessions(user_id: str, limit: int = 50):
+async def get_meditation_sessions(user_id: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                                  limit: int = Query(50, ge=1, le=MAX_HISTORY_LIMIT)):
     """Get meditation sessions for a user"""
-    sessions = await db.meditation_sessions.find(
-        {"user_id": user_id}
-    ).sort("timestamp", -1).limit(limit).to_list(limit)
+    sessions = await session_history("meditation_sessions", user_id, since, until, limit)
     return [MeditationSession(**session) for session in sessions]
 
 @api_router.post("/mindfulness/check-ins", response_model=MindfulnessCheckIn)
@@ -437,20 +801,64 @@ async def create_mindfulness_checkin(checkin: MindfulnessCheckIn):
     return checkin
 
 # Pomodoro Module Routes
+async def log_pomodoro_session(session_dict: Dict[str, Any]):
+    """Store a finished Pomodoro session and update progress, features and achievements"""
+    await session_storage.insert_one("pomodoro_sessions", session_dict)
+    await track_activity(
+        session_dict["user_id"], ModuleType.POMODORO, session_dict["timestamp"], session_dict,
+        feature_store.record_pomodoro(session_dict)
+    )
+
 @api_router.post("/pomodoro/sessions", response_model=PomodoroSession)
 async def create_pomodoro_session(session: PomodoroSession):
     """Log a Pomodoro session"""
-    await db.pomodoro_sessions.insert_one(session.dict())
+    await log_pomodoro_session(session.dict())
     return session
 
 @api_router.get("/pomodoro/sessions/{user_id}", response_model=List[PomodoroSession])
-async def get_pomodoro_sessions(user_id: str, limit: int = 50):
+async def get_pomodoro_sessions(user_id: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                                limit: int = Query(50, ge=1, le=MAX_HISTORY_LIMIT)):
     """Get Pomodoro sessions for a user"""
-    sessions = await db.pomodoro_sessions.find(
-        {"user_id": user_id}
-    ).sort("timestamp", -1).limit(limit).to_list(limit)
+    sessions = await session_history("pomodoro_sessions", user_id, since, until, limit)
     return [PomodoroSession(**session) for session in sessions]
 
+async def _live_session(action, session_id: str, *args):
+    try:
+        return await action(session_id, *args)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Live session not found")
+
+@api_router.post("/pomodoro/live/start")
+async def start_live_pomodoro(request: LivePomodoroStart):
+    """Start a server-tracked Pomodoro session"""
+    session = live_sessions.start_session(
+        request.user_id, request.task_name, request.work_duration, request.break_duration, request.cycles
+    )
+    return {**session.describe(), "heartbeat_timeout_seconds": live_sessions.heartbeat_timeout}
+
+@api_router.post("/pomodoro/live/{session_id}/heartbeat")
+async def live_pomodoro_heartbeat(session_id: str, request: LivePomodoroHeartbeat = LivePomodoroHeartbeat()):
+    """Keep a live session alive, optionally recording a focus rating"""
+    session = await _live_session(live_sessions.heartbeat, session_id, request.focus_rating)
+    return session.describe()
+
+@api_router.post("/pomodoro/live/{session_id}/distraction")
+async def live_pomodoro_distraction(session_id: str, distraction: Dict[str, Any]):
+    """Record a distraction as it happens"""
+    session = await _live_session(live_sessions.distraction, session_id, distraction)
+    return session.describe()
+
+@api_router.post("/pomodoro/live/{session_id}/finish", response_model=PomodoroSession)
+async def finish_live_pomodoro(session_id: str, request: LivePomodoroFinish = LivePomodoroFinish()):
+    """Finish a live session and log it as a Pomodoro session"""
+    document = await _live_session(live_sessions.finish, session_id, request.break_activities)
+    return PomodoroSession(**document)
+
+@api_router.get("/pomodoro/live/metrics")
+async def get_live_pomodoro_metrics():
+    """Live session registry statistics for this worker"""
+    return live_sessions.stats()
+
 # Implementation Intentions Routes
 @api_router.post("/intentions", response_model=ImplementationIntention)
 async def create_implementation_intention(intention: ImplementationIntention):
@@ -489,89 +897,231 @@ async def update_intention_usage(intention_id: str, success: bool):
             {"id": intention_id},
             {"$set": {"effectiveness_score": effectiveness}}
         )
+        await feature_store.record_intention_usage(intention["user_id"], success)
 
 # Five Minute Rule Routes
 @api_router.post("/five-minute/sessions", response_model=FiveMinuteSession)
 async def create_five_minute_session(session: FiveMinuteSession):
     """Log a five-minute rule session"""
-    await db.five_minute_sessions.insert_one(session.dict())
+    session_dict = session.dict()
+    await session_storage.insert_one("five_minute_sessions", session_dict)
+    await track_activity(session.user_id, ModuleType.FIVE_MINUTE_RULE, session.timestamp, session_dict)
     return session
 
 @api_router.get("/five-minute/sessions/{user_id}", response_model=List[FiveMinuteSession])
-async def get_five_minute_sessions(user_id: str, limit: int = 50):
+async def get_five_minute_sessions(user_id: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                                   limit: int = Query(50, ge=1, le=MAX_HISTORY_LIMIT)):
     """Get five-minute rule sessions for a user"""
-    sessions = await db.five_minute_sessions.find(
-        {"user_id": user_id}
-    ).sort("timestamp", -1).limit(limit).to_list(limit)
+    sessions = await session_history("five_minute_sessions", user_id, since, until, limit)
     return [FiveMinuteSession(**session) for session in sessions]
 
 # Physical Activity Routes
 @api_router.post("/activity/sessions", response_model=ActivitySession)
 async def create_activity_session(session: ActivitySession):
     """Log a physical activity session"""
-    await db.activity_sessions.insert_one(session.dict())
+    session_dict = session.dict()
+    await session_storage.insert_one("activity_sessions", session_dict)
+    await track_activity(session.user_id, ModuleType.PHYSICAL_ACTIVITY, session.timestamp, session_dict)
     return session
 
 @api_router.get("/activity/sessions/{user_id}", response_model=List[ActivitySession])
-async def get_activity_sessions(user_id: str, limit: int = 50):
+async def get_activity_sessions(user_id: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                                limit: int = Query(50, ge=1, le=MAX_HISTORY_LIMIT)):
     """Get activity sessions for a user"""
-    sessions = await db.activity_sessions.find(
-        {"user_id": user_id}
-    ).sort("timestamp", -1).limit(limit).to_list(limit)
+    sessions = await session_history("activity_sessions", user_id, since, until, limit)
     return [ActivitySession(**session) for session in sessions]
 
 # Sleep Module Routes
 @api_router.post("/sleep/data", response_model=SleepData)
 async def create_sleep_data(sleep_data: SleepData):
     """Log sleep data"""
-    sleep_dict = sleep_data.dict()
-    # Convert date to string for MongoDB storage
-    if 'sleep_date' in sleep_dict and hasattr(sleep_dict['sleep_date'], 'isoformat'):
-        sleep_dict['sleep_date'] = sleep_dict['sleep_date'].isoformat()
+    sleep_dict = prepare_sleep_document(sleep_data.dict())
     await db.sleep_data.insert_one(sleep_dict)
+    await track_activity(
+        sleep_data.user_id, ModuleType.SLEEP_CIRCADIAN, sleep_data.sleep_date, sleep_dict,
+        feature_store.record_sleep(sleep_dict)
+    )
     return sleep_data
 
 @api_router.get("/sleep/data/{user_id}", response_model=List[SleepData])
-async def get_sleep_data(user_id: str, limit: int = 30):
+async def get_sleep_data(user_id: str, since: Optional[date] = None, until: Optional[date] = None,
+                         limit: int = Query(30, ge=1, le=MAX_HISTORY_LIMIT)):
     """Get sleep data for a user"""
-    data = await db.sleep_data.find(
-        {"user_id": user_id}
-    ).sort("sleep_date", -1).limit(limit).to_list(limit)
+    try:
+        query = sleep_history.range_query(user_id, since, until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    data = await db.sleep_data.find(query).sort("sleep_date", -1).limit(limit).to_list(limit)
     cleaned_data = clean_mongo_doc(data)
     return [SleepData(**item) for item in cleaned_data]
 
+@api_router.get("/sleep/summary/{user_id}")
+async def get_sleep_summary(user_id: str, period: str = "week", since: Optional[date] = None,
+                            until: Optional[date] = None):
+    """Get weekly or monthly sleep averages for a user, oldest period first"""
+    try:
+        periods = await sleep_history.summary(user_id, period, since, until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"user_id": user_id, "period": period, "periods": periods}
+
+@api_router.get("/sleep/migration")
+async def get_sleep_migration_status():
+    """Get progress of the sleep_date backfill"""
+    return await sleep_history.status()
+
+# Timeline Routes
+@api_router.get("/timeline/{user_id}")
+async def get_activity_timeline(user_id: str, limit: int = 20, types: Optional[str] = None, cursor: Optional[str] = None):
+    """Get one page of a user's activity across all modules, newest first"""
+    try:
+        return await timeline.page(
+            user_id, types=types.split(",") if types else None, limit=limit, cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@api_router.get("/db/metrics")
+async def get_db_metrics():
+    """Get Mongo command counts and the most recent slow queries"""
+    return command_monitor.stats()
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Admin routes need X-Admin-Token to match PROFILE_ADMIN_TOKEN"""
+    if not profiler.token or not x_admin_token or not secrets.compare_digest(x_admin_token, profiler.token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@api_router.get("/admin/profiles", dependencies=[Depends(require_admin)])
+async def list_profiles():
+    """List stored request profiles, newest first"""
+    return {"profiles": profiler.list()}
+
+@api_router.get("/admin/profiles/{name}", dependencies=[Depends(require_admin)])
+async def download_profile(name: str, format: str = "speedscope"):
+    """Download a profile as speedscope JSON or as collapsed stacks for flamegraph.pl"""
+    try:
+        path = profiler.path(name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "collapsed":
+        return PlainTextResponse(collapsed(json.loads(path.read_text())))
+    if format != "speedscope":
+        raise HTTPException(status_code=400, detail=f"Unknown profile format: {format}")
+    return FileResponse(path, media_type="application/json", filename=name)
+
+@api_router.get("/tiering/metrics")
+async def get_tiering_metrics():
+    """Get archive sizes and the last run of the hot/cold tiering job"""
+    return await cold_storage.stats()
+
+@api_router.get("/tracing/metrics")
+async def get_tracing_metrics():
+    """Get tail-sampling decisions and exporter counters for request tracing"""
+    return tracer.stats()
+
+# Export Routes
+def _export_response(user_ids: List[str], format: str, collections: Optional[List[str]], gzip: bool,
+                     offset: int, name: str) -> StreamingResponse:
+    try:
+        chunks = data_exporter.stream(user_ids, format, collections, offset, gzip)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filename = f"{name}.{format}" + (".gz" if gzip else "")
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"', "X-Export-Offset": str(offset)}
+    if gzip:
+        media_type = "application/gzip"
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
+
+@api_router.get("/export/{user_id}")
+async def export_user_data(user_id: str, format: str = "ndjson", collections: Optional[str] = None,
+                           gzip: bool = False, offset: int = 0):
+    """Stream all of a user's records as NDJSON (or one collection as CSV)"""
+    return _export_response(
+        [user_id], format, collections.split(",") if collections else None, gzip, offset, f"export-{user_id}"
+    )
+
+@api_router.post("/export/cohort")
+async def export_cohort_data(request: CohortExportRequest):
+    """Stream the records of a cohort of users"""
+    if not request.user_ids:
+        raise HTTPException(status_code=400, detail="user_ids must not be empty")
+    return _export_response(
+        request.user_ids, request.format, request.collections, request.gzip, request.offset, "export-cohort"
+    )
+
+# Import Routes
+@api_router.post("/import/{collection}")
+async def import_records(collection: str, request: Request, background_tasks: BackgroundTasks,
+                         format: str = "ndjson"):
+    """Bulk import historical records streamed in the request body as NDJSON or CSV"""
+    try:
+        report = await bulk_importer.import_stream(collection, request.stream(), format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Features, progress, achievements and leaderboards catch up after the response is sent
+    background_tasks.add_task(bulk_importer.refresh, report)
+    return report.to_dict()
+
 # Accountability Routes
 @api_router.post("/accountability/partners", response_model=AccountabilityPartner)
 async def create_accountability_partnership(partnership: AccountabilityPartner):
     """Create an accountability partnership"""
-    await db.accountability_partners.insert_one(partnership.dict())
+    partnership_dict = checkin_scheduler.stamp(partnership.dict(), partnership.user_id)
+    await partner_graph.add(partnership_dict)
+    checkin_scheduler.partnership_created(partnership_dict)
     return partnership
 
 @api_router.get("/accountability/partners/{user_id}", response_model=List[AccountabilityPartner])
 async def get_accountability_partners(user_id: str):
     """Get accountability partners for a user"""
-    partners = await db.accountability_partners.find(
-        {"$or": [{"user_id": user_id}, {"partner_id": user_id}], "active": True}
-    ).to_list(100)
+    partners = await partner_graph.partnerships(user_id)
     return [AccountabilityPartner(**partner) for partner in partners]
 
+@api_router.get("/accountability/partners/{user_id}/progress")
+async def get_partner_progress(user_id: str):
+    """Get each active partner's progress in one batched fetch"""
+    return {"partners": await partner_graph.partner_progress(user_id)}
+
+@api_router.put("/accountability/partners/{partnership_id}/deactivate", response_model=AccountabilityPartner)
+async def deactivate_accountability_partnership(partnership_id: str):
+    """Deactivate an accountability partnership"""
+    partnership = await partner_graph.deactivate(partnership_id)
+    if not partnership:
+        raise HTTPException(status_code=404, detail="Partnership not found")
+    return AccountabilityPartner(**partnership)
+
 @api_router.post("/accountability/check-ins", response_model=CheckInSession)
 async def create_check_in_session(session: CheckInSession):
     """Create a check-in session"""
-    await db.check_in_sessions.insert_one(session.dict())
+    session_dict = checkin_scheduler.stamp(session.dict(), session.initiator_id)
+    await db.check_in_sessions.insert_one(session_dict)
+    checkin_scheduler.check_in_created(session_dict)
+    
+    # Push the check-in to both partners
+    partnership = await partner_graph.get(session.partnership_id)
+    if partnership:
+        await realtime_hub.publish(
+            [partnership["user_id"], partnership["partner_id"]],
+            "check_in",
+            {"user_id": session.initiator_id, "check_in": session.dict()}
+        )
     return session
 
+@api_router.get("/accountability/scheduler/metrics")
+async def get_check_in_scheduler_metrics():
+    """Reminder scheduler shard ownership, lateness and tick drift for this worker"""
+    return checkin_scheduler.stats()
+
 # Gamification Routes
 @api_router.post("/gamification/achievements", response_model=Achievement)
 async def award_achievement(achievement: Achievement):
     """Award an achievement to a user"""
     await db.achievements.insert_one(achievement.dict())
     
-    # Update user progress
-    await db.user_progress.update_one(
-        {"user_id": achievement.user_id},
-        {"$inc": {"total_points": achievement.points_earned}}
-    )
+    # Update user progress, level and leaderboards
+    await award_points(achievement.user_id, achievement.points_earned)
+    await notify_partners(achievement.user_id, "achievement", {"achievement": achievement.dict()})
     
     return achievement
 
@@ -581,59 +1131,105 @@ async def get_user_progress(user_id: str):
     progress = await db.user_progress.find_one({"user_id": user_id})
     if not progress:
         # Create initial progress
-        progress = UserProgress(user_id=user_id)
-        await db.user_progress.insert_one(progress.dict())
-    return UserProgress(**progress)
+        progress = UserProgress(user_id=user_id).dict()
+        await db.user_progress.insert_one(progress)
+    return UserProgress(**public_progress(progress))
+
+@api_router.get("/gamification/achievement-rules")
+async def get_achievement_rules():
+    """List the achievements the server unlocks automatically"""
+    return {"rules": [rule.describe() for rule in achievement_engine.rules]}
 
 @api_router.get("/gamification/achievements/{user_id}", response_model=List[Achievement])
-async def get_user_achievements(user_id: str):
+async def get_user_achievements(user_id: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                                limit: int = Query(100, ge=1, le=MAX_HISTORY_LIMIT)):
     """Get user achievements"""
     achievements = await db.achievements.find(
-        {"user_id": user_id}
-    ).sort("unlock_date", -1).to_list(100)
+        history_query(user_id, "unlock_date", since, until)
+    ).sort("unlock_date", -1).limit(limit).to_list(limit)
     return [Achievement(**achievement) for achievement in achievements]
 
+def _get_board(board: str) -> str:
+    if board not in BOARDS:
+        raise HTTPException(status_code=404, detail=f"Unknown leaderboard. Choose from: {', '.join(BOARDS)}")
+    return board
+
+async def _with_usernames(entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Attach usernames to leaderboard entries with one batched lookup"""
+    user_ids = [entry["user_id"] for entry in entries]
+    users = await db.users.find(
+        {"id": {"$in": user_ids}}, {"_id": 0, "id": 1, "username": 1}
+    ).to_list(len(user_ids))
+    usernames = {user["id"]: user["username"] for user in users}
+    for entry in entries:
+        entry["username"] = usernames.get(entry["user_id"])
+    return entries
+
+@api_router.get("/gamification/leaderboard/{board}")
+async def get_leaderboard(board: str, limit: int = 10):
+    """Get the top entries of a leaderboard (global, weekly or coins)"""
+    limit = max(1, min(limit, 100))
+    entries = leaderboards.top(_get_board(board), limit)
+    return {"board": board, "total": len(leaderboards.board(board)), "entries": await _with_usernames(entries)}
+
+@api_router.get("/gamification/leaderboard/{board}/around/{user_id}")
+async def get_leaderboard_around_user(board: str, user_id: str, window: int = 5):
+    """Get a user's rank and the entries just above and below them"""
+    window = max(0, min(window, 25))
+    result = leaderboards.around(_get_board(board), user_id, window)
+    result["entries"] = await _with_usernames(result["entries"])
+    return {"board": board, **result}
+
+@api_router.get("/gamification/leaderboard/{board}/friends/{user_id}")
+async def get_friends_leaderboard(board: str, user_id: str):
+    """Get a leaderboard restricted to a user and their accountability partners"""
+    friend_ids = await partner_graph.partner_ids(user_id)
+    entries = leaderboards.friends(_get_board(board), user_id, friend_ids)
+    return {"board": board, "entries": await _with_usernames(entries)}
+
+# Realtime Routes
+@api_router.websocket("/ws/{user_id}")
+async def realtime_updates(websocket: WebSocket, user_id: str):
+    """Push partner check-ins, achievements and coin events to a client"""
+    await realtime_hub.serve(websocket, user_id)
+
+@api_router.get("/realtime/metrics")
+async def get_realtime_metrics():
+    """Get WebSocket connection counts, message rates and drops"""
+    return realtime_hub.stats()
+
 # Analytics Routes
 @api_router.get("/analytics/insights/{user_id}")
 async def get_personalized_insights(user_id: str):
     """Get AI-powered personalized insights for a user"""
-    # Gather user data from various collections
-    recent_sessions = await db.pomodoro_sessions.find(
-        {"user_id": user_id}
-    ).sort("timestamp", -1).limit(10).to_list(10)
-    
-    thought_records = await db.thought_records.find(
-        {"user_id": user_id}
-    ).sort("timestamp", -1).limit(5).to_list(5)
-    
-    sleep_data = await db.sleep_data.find(
-        {"user_id": user_id}
-    ).sort("sleep_date", -1).limit(7).to_list(7)
-    
-    # Create context for AI analysis
-    context = {
-        "recent_productivity_sessions": len(recent_sessions),
-        "thought_patterns": len(thought_records),
-        "sleep_quality_avg": sum([s.get("sleep_quality", 0) for s in sleep_data]) / len(sleep_data) if sleep_data else 0,
-        "user_activity_level": "moderate"  # This would be calculated based on actual data
-    }
-    
-    prompt = f"""
-    Analyze this user's recent behavioral data and provide personalized insights:
+    # The precomputed feature vector and progress document instead of scanning modules
+    features, progress = await asyncio.gather(
+        feature_store.get(user_id),
+        db.user_progress.find_one(
+            {"user_id": user_id}, {"_id": 0, "current_streak": 1, "longest_streak": 1, "last_activity_day": 1}
+        ),
+    )
+    context = compact_features(features, progress)
     
-    Context: {json.dumps(context, indent=2)}
+    prompt = (
+        "Analyze this user's behavioral data and give personalized insights.\n"
+        f"Data:\n{render_features(context)}\n"
+        "Give: 1) top 3 patterns, 2) 2-3 specific evidence-based anti-procrastination "
+        "recommendations, 3) one encouraging observation about their progress."
+    )
     
-    Please provide:
-    1. Top 3 patterns you notice
-    2. 2-3 specific actionable recommendations
-    3. One encouraging observation about their progress
+    insights, source = await get_ai_insights(prompt, context)
     
-    Keep recommendations evidence-based and specific to anti-procrastination strategies.
-    """
+    # Keep the summary fields the analytics screen already renders, counted
+    # over the last 10 focus sessions and 5 thought records as they always were
+    streak = context["streak_days"]
+    context.update({
+        "recent_productivity_sessions": min(context["focus_sessions"], 10),
+        "thought_patterns": min(context["thought_records"], 5),
+        "user_activity_level": "high" if streak >= 5 else "moderate" if streak >= 1 else "low",
+    })
     
-    insights = await get_ai_insights(prompt, context)
-    
-    return {"insights": insights, "context": context}
+    return {"insights": insights, "source": source, "context": context}
 
 @api_router.post("/analytics/patterns", response_model=BehaviorPattern)
 async def identify_behavior_pattern(pattern: BehaviorPattern):
@@ -660,6 +1256,11 @@ async def get_recommendations(user_id: str, viewed: bool = None):
     
     return [PersonalizedRecommendation(**rec) for rec in recommendations]
 
+@api_router.get("/analytics/llm-metrics")
+async def get_llm_metrics():
+    """Get LLM circuit breaker state, latency and fallback rate"""
+    return {**llm_breaker.stats(), "integration": llm_chat_module.stats()}
+
 # Dashboard Data Route
 @api_router.get("/dashboard/{user_id}")
 async def get_dashboard_data(user_id: str):
@@ -667,9 +1268,7 @@ async def get_dashboard_data(user_id: str):
     # Get latest data from each module
     progress = await db.user_progress.find_one({"user_id": user_id})
     
-    recent_pomodoros = await db.pomodoro_sessions.find(
-        {"user_id": user_id}
-    ).sort("timestamp", -1).limit(5).to_list(5)
+    recent_pomodoros = await session_storage.find("pomodoro_sessions", {"user_id": user_id}, 5)
     
     recent_thought_records = await db.thought_records.find(
         {"user_id": user_id}
@@ -689,11 +1288,12 @@ async def get_dashboard_data(user_id: str):
     
     # Clean all MongoDB documents
     dashboard_data = {
-        "user_progress": clean_mongo_doc(progress),
+        "user_progress": clean_mongo_doc(public_progress(progress)),
         "recent_pomodoros": clean_mongo_doc(recent_pomodoros),
         "recent_thought_records": clean_mongo_doc(recent_thought_records),
         "active_intentions": clean_mongo_doc(active_intentions),
-        "recent_sleep": clean_mongo_doc(recent_sleep),
+        # Through the model so sleep_date is a date, as /sleep/data returns it
+        "recent_sleep": [SleepData(**night) for night in clean_mongo_doc(recent_sleep)],
         "recent_achievements": clean_mongo_doc(recent_achievements),
         "timestamp": datetime.utcnow()
     }
@@ -790,6 +1390,15 @@ async def award_coins_for_task(request: dict):
         }
         
         await db.coin_transactions.insert_one(coin_transaction)
+        # The store addresses users by _id; leaderboards, partners and achievements use users.id
+        member_id = user.get("id") or user_id
+        await leaderboards.record_coins(member_id, lifetime_coins + coins_awarded)
+        await notify_partners(member_id, "coins", {
+            "coins_awarded": coins_awarded,
+            "task_type": task_type,
+            "module": module
+        })
+        await dispatch_achievements(member_id, "coins", coin_transaction)
         
         return {
             "coins_awarded": coins_awarded,
@@ -935,12 +1544,13 @@ async def make_purchase(request: dict):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/store/orders/{user_id}")
-async def get_user_orders(user_id: str):
+async def get_user_orders(user_id: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                          limit: int = Query(50, ge=1, le=MAX_HISTORY_LIMIT)):
     """Get user's purchase history"""
+    query = history_query(user_id, "purchase_date", since, until)
     try:
-        orders = await db.store_purchases.find(
-            {"user_id": ObjectId(user_id)}
-        ).sort("purchase_date", -1).to_list(length=50)
+        query["user_id"] = ObjectId(user_id)
+        orders = await db.store_purchases.find(query).sort("purchase_date", -1).limit(limit).to_list(length=limit)
         
         # Convert ObjectIds to strings
         for order in orders:
@@ -953,12 +1563,14 @@ async def get_user_orders(user_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/store/transactions/{user_id}")
-async def get_coin_transactions(user_id: str):
+async def get_coin_transactions(user_id: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                                limit: int = Query(100, ge=1, le=MAX_HISTORY_LIMIT)):
     """Get user's coin transaction history"""
+    query = history_query(user_id, "timestamp", since, until)
     try:
-        transactions = await db.coin_transactions.find(
-            {"user_id": ObjectId(user_id)}
-        ).sort("timestamp", -1).to_list(length=100)
+        query["user_id"] = ObjectId(user_id)
+        transactions = await db.coin_transactions.find(query).sort("timestamp", -1).limit(limit).to_list(length=limit)
+        transactions = await cold_storage.fill("coin_transactions", query, transactions, limit)
         
         # Convert ObjectIds to strings
         for transaction in transactions:
@@ -970,6 +1582,24 @@ async def get_coin_transactions(user_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/health", include_in_schema=False)
+@api_router.get("/health")
+async def get_health():
+    """Liveness: the process is serving; never touches the database"""
+    return db_health.health()
+
+@app.get("/ready", include_in_schema=False)
+@api_router.get("/ready")
+async def get_ready():
+    """Readiness: 503 while starting or stopping, when the pool is saturated or a ping is slow or failing"""
+    ready, report = await db_health.ready()
+    return JSONResponse(report, status_code=200 if ready else 503)
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(metrics.render(), media_type=CONTENT_TYPE)
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -980,6 +1610,17 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Set DB_DEBUG_HEADERS=true to add X-DB-Calls / X-DB-Time-Ms to every response
+app.add_middleware(
+    DbAccountingMiddleware,
+    headers=os.environ.get('DB_DEBUG_HEADERS', 'false').lower() == 'true',
+    warn_calls=int(os.environ.get('DB_CALLS_WARN_THRESHOLD', 25)),
+)
+app.add_middleware(MetricsMiddleware, registry=metrics)
+if tracer.enabled:
+    app.add_middleware(TracingMiddleware, tracer=tracer)
+if profiler.enabled:
+    app.add_middleware(ProfilingMiddleware, profiler=profiler)
 
 # Configure logging
 logging.basicConfig(
@@ -988,6 +1629,41 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
+async def startup():
+    await session_storage.ensure_layout()
+    await feature_store.ensure_indexes()
+    await progress_engine.ensure_indexes()
+    await achievement_engine.ensure_indexes()
+    await partner_graph.ensure_indexes()
+    await live_sessions.ensure_indexes()
+    await checkin_scheduler.ensure_indexes()
+    await timeline.ensure_indexes()
+    await data_exporter.ensure_indexes()
+    await bulk_importer.ensure_indexes()
+    await cold_storage.ensure_indexes()
+    for collection, field in HISTORY_INDEXES:
+        await db[collection].create_index([("user_id", 1), (field, -1)])
+    await leaderboards.start()
+    await live_sessions.start()
+    await checkin_scheduler.start()
+    await sleep_history.start()
+    await tracer.start()
+    if tiering_enabled:
+        await cold_storage.start()
+    if realtime_bridge:
+        await realtime_bridge.start()
+    if os.environ.get('LLM_PRELOAD', '1') == '1':
+        llm_chat_module.preload()
+    await db_health.start()
+
+async def shutdown():
+    await db_health.stop()
+    await live_sessions.stop()
+    await checkin_scheduler.stop()
+    await sleep_history.stop()
+    await cold_storage.stop()
+    await leaderboards.stop()
+    await tracer.stop()
+    if realtime_bridge:
+        await realtime_bridge.stop()
     client.close()
\ No newline at end of file
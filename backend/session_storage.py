@@ -0,0 +1,515 @@
+#!/usr/bin/env python3
+"""
+Storage layouts for the high-volume session collections.
+
+``pomodoro_sessions``, ``meditation_sessions``, ``five_minute_sessions`` and
+``activity_sessions`` can be stored in one of three modes:
+
+* ``documents`` (default): one document per session, as before
+* ``timeseries``: Mongo time-series collections (``timestamp`` as the time
+  field, ``user_id`` as the meta field); Mongo buckets internally and reads
+  and writes are plain ``find``/``insert`` calls
+* ``buckets``: per-user, per-period bucket documents in ``<name>_buckets``.
+  Field names are written once per bucket and each session is a row of
+  values, so a bucket of 200 sessions costs one index entry instead of 200.
+  ``<name>`` becomes a read-only view that unwinds the buckets for ad-hoc
+  queries. The app reads through ``SessionStorage`` instead: ``find`` for
+  the history routes and ``sessions``/``aggregate``/``count``/``distinct``
+  for the timeline, exports, rebuilds, backfills and import deduplication.
+  These narrow the buckets by user and time range before unwinding them, and
+  also read the sessions of a collection that has not been converted yet.
+
+An existing collection is converted online with ``convert`` (for
+``timeseries`` pause writes while it runs; a time-series collection cannot
+be renamed into place). ``bench`` writes the same synthetic sessions in each
+layout and compares storage size, index size and range-query latency.
+
+    python session_storage.py convert pomodoro_sessions --mode buckets
+    python session_storage.py bench --users 50 --sessions 2000
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import statistics
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+
+from streams import merge_sorted
+
+logger = logging.getLogger(__name__)
+
+SESSION_COLLECTIONS = ("pomodoro_sessions", "meditation_sessions", "five_minute_sessions", "activity_sessions")
+STORAGE_MODES = ("documents", "timeseries", "buckets")
+TIME_FIELD = "timestamp"
+META_FIELD = "user_id"
+COMMAND_NOT_SUPPORTED_ON_VIEW = 166
+CONVERT_BATCH_SIZE = 1000
+
+
+async def create_index(collection, keys, **kwargs):
+    """``create_index`` that skips views; their indexes belong to the source collection"""
+    try:
+        await collection.create_index(keys, **kwargs)
+    except OperationFailure as e:
+        if e.code != COMMAND_NOT_SUPPORTED_ON_VIEW:
+            raise
+
+
+def bucket_fields(doc: Dict[str, Any]) -> List[str]:
+    return sorted(key for key in doc if key not in ("_id", META_FIELD))
+
+
+def schema_id(fields: List[str]) -> str:
+    # Buckets only take rows with the same field list, so a model change opens new buckets
+    return format(zlib.crc32(",".join(fields).encode()), "08x")
+
+
+def view_pipeline() -> List[Dict[str, Any]]:
+    """Unwinds bucket rows back into one document per session"""
+    return [
+        {"$unwind": "$rows"},
+        {"$replaceRoot": {"newRoot": {"$mergeObjects": [
+            {META_FIELD: f"${META_FIELD}"},
+            {"$arrayToObject": {"$zip": {"inputs": ["$fields", "$rows"]}}},
+        ]}}},
+    ]
+
+
+class SessionStorage:
+    def __init__(self, db, mode: str = "documents", collections: Iterable[str] = SESSION_COLLECTIONS,
+                 bucket_days: float = 7, bucket_size: int = 200):
+        if mode not in STORAGE_MODES:
+            raise ValueError(f"Unknown session storage mode: {mode}")
+        self.db = db
+        self.mode = mode
+        self.collections = tuple(collections)
+        self.bucket_span = timedelta(days=bucket_days)
+        self.bucket_size = bucket_size
+        # Collections still holding plain documents while in buckets mode
+        self.legacy: Dict[str, bool] = {}
+
+    def manages(self, collection: str) -> bool:
+        return collection in self.collections
+
+    def buckets(self, collection: str):
+        return self.db[f"{collection}_buckets"]
+
+    def uses_buckets(self, collection: str) -> bool:
+        return self.mode == "buckets" and self.manages(collection)
+
+    async def collection_types(self) -> Dict[str, str]:
+        """``collection``, ``view`` or ``timeseries`` for each managed name that exists"""
+        cursor = await self.db.list_collections(filter={"name": {"$in": list(self.collections)}})
+        return {info["name"]: info.get("type", "collection") async for info in cursor}
+
+    async def ensure_layout(self):
+        if self.mode == "documents":
+            return
+        existing = await self.collection_types()
+        for collection in self.collections:
+            kind = existing.get(collection)
+            if self.mode == "timeseries":
+                if kind is None:
+                    await self.create_timeseries(collection)
+                elif kind != "timeseries":
+                    logger.warning(f"{collection} is a regular collection; run session_storage.py convert")
+                continue
+            await self.buckets(collection).create_index([(META_FIELD, 1), ("last", -1)])
+            await self.buckets(collection).create_index([(META_FIELD, 1), ("period", 1), ("schema", 1)])
+            if kind is None:
+                await self.create_view(collection)
+            self.legacy[collection] = kind == "collection"
+            if self.legacy[collection]:
+                logger.warning(f"{collection} still holds documents; run session_storage.py convert")
+
+    async def create_timeseries(self, name: str):
+        await self.db.create_collection(
+            name, timeseries={"timeField": TIME_FIELD, "metaField": META_FIELD, "granularity": "hours"}
+        )
+
+    async def create_view(self, collection: str):
+        await self.db.create_collection(
+            collection, viewOn=f"{collection}_buckets", pipeline=view_pipeline()
+        )
+
+    # ===============================
+    # WRITES
+    # ===============================
+
+    def period_start(self, when: datetime) -> datetime:
+        span = self.bucket_span.total_seconds()
+        epoch = datetime(1970, 1, 1)
+        return epoch + timedelta(seconds=(when - epoch).total_seconds() // span * span)
+
+    def _bucket_updates(self, documents: List[Dict[str, Any]]) -> List[UpdateOne]:
+        groups: Dict[Tuple[Any, datetime, str], Tuple[List[str], List[List[Any]], List[datetime]]] = {}
+        for doc in documents:
+            fields = bucket_fields(doc)
+            key = (doc[META_FIELD], self.period_start(doc[TIME_FIELD]), schema_id(fields))
+            _, rows, times = groups.setdefault(key, (fields, [], []))
+            rows.append([doc[field] for field in fields])
+            times.append(doc[TIME_FIELD])
+
+        updates = []
+        for (user_id, period, schema), (fields, rows, times) in groups.items():
+            for start in range(0, len(rows), self.bucket_size):
+                chunk = rows[start:start + self.bucket_size]
+                chunk_times = times[start:start + self.bucket_size]
+                # A full bucket no longer matches, so the upsert opens the next one. Concurrent
+                # writes that both find no room each open one; the extra part-filled bucket is
+                # accepted, since readers merge any number of buckets per period anyway
+                updates.append(UpdateOne(
+                    {META_FIELD: user_id, "period": period, "schema": schema,
+                     "count": {"$lte": self.bucket_size - len(chunk)}},
+                    {
+                        "$push": {"rows": {"$each": chunk}},
+                        "$inc": {"count": len(chunk)},
+                        "$min": {"first": min(chunk_times)},
+                        "$max": {"last": max(chunk_times)},
+                        "$setOnInsert": {"fields": fields},
+                    },
+                    upsert=True,
+                ))
+        return updates
+
+    async def insert_one(self, collection: str, doc: Dict[str, Any]):
+        if self.uses_buckets(collection):
+            await self.buckets(collection).bulk_write(self._bucket_updates([doc]))
+        else:
+            await self.db[collection].insert_one(doc)
+
+    async def insert_many(self, collection: str, documents: List[Dict[str, Any]]) -> int:
+        """Inserted count; in documents mode duplicate keys raise ``BulkWriteError`` as usual"""
+        if not documents:
+            return 0
+        if self.uses_buckets(collection):
+            await self.buckets(collection).bulk_write(self._bucket_updates(documents), ordered=False)
+            return len(documents)
+        result = await self.db[collection].insert_many(documents, ordered=False)
+        return len(result.inserted_ids)
+
+    # ===============================
+    # READS
+    # ===============================
+
+    async def find(self, collection: str, query: Dict[str, Any], limit: int) -> List[Dict[str, Any]]:
+        """Newest ``limit`` sessions matching a ``{user_id, timestamp: {$gte, $lte}}`` filter"""
+        if not self.uses_buckets(collection):
+            return await self.db[collection].find(query).sort(TIME_FIELD, -1).limit(limit).to_list(limit)
+
+        bounds = query.get(TIME_FIELD, {})
+        since, until = bounds.get("$gte"), bounds.get("$lte")
+        bucket_query: Dict[str, Any] = {META_FIELD: query[META_FIELD]}
+        if since:
+            bucket_query["last"] = {"$gte": since}
+        if until:
+            bucket_query["first"] = {"$lte": until}
+
+        sessions: List[Dict[str, Any]] = []
+        cursor = self.buckets(collection).find(bucket_query).sort("last", -1)
+        async for bucket in cursor:
+            # Buckets arrive newest-last first; once we hold a full page that is
+            # newer than everything this bucket contains, no later bucket can matter
+            if len(sessions) >= limit and sessions[limit - 1][TIME_FIELD] > bucket["last"]:
+                break
+            for row in bucket["rows"]:
+                session = dict(zip(bucket["fields"], row))
+                when = session[TIME_FIELD]
+                if (since and when < since) or (until and when > until):
+                    continue
+                session[META_FIELD] = bucket[META_FIELD]
+                sessions.append(session)
+            sessions.sort(key=lambda session: session[TIME_FIELD], reverse=True)
+        if self.legacy.get(collection):
+            sessions += await self.db[collection].find(query).sort(TIME_FIELD, -1).limit(limit).to_list(limit)
+            sessions.sort(key=lambda session: session[TIME_FIELD], reverse=True)
+        return sessions[:limit]
+
+    def bucket_query(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        """Buckets that can hold sessions matching ``query``: the same users and an overlapping time range"""
+        bucket_query: Dict[str, Any] = {}
+        if META_FIELD in query:
+            bucket_query[META_FIELD] = query[META_FIELD]
+        bounds = query.get(TIME_FIELD)
+        if isinstance(bounds, dict):
+            since = bounds.get("$gte", bounds.get("$gt"))
+            until = bounds.get("$lte", bounds.get("$lt"))
+            if since is not None:
+                bucket_query["last"] = {"$gte": since}
+            if until is not None:
+                bucket_query["first"] = {"$lte": until}
+        return bucket_query
+
+    def aggregate(self, collection: str, query: Dict[str, Any], pipeline: Iterable[Dict[str, Any]] = ()) -> List[Any]:
+        """Cursors running ``pipeline`` over the sessions matching ``query``
+
+        One cursor per place the sessions are kept: the collection itself, or
+        in buckets mode the buckets plus, until it is converted, the legacy
+        collection. Callers combine the results of the cursors.
+        """
+        stages = [{"$match": query}, *pipeline]
+        if not self.uses_buckets(collection):
+            return [self.db[collection].aggregate(stages, allowDiskUse=True)]
+        cursors = [self.buckets(collection).aggregate(
+            [{"$match": self.bucket_query(query)}, *view_pipeline(), *stages], allowDiskUse=True
+        )]
+        if self.legacy.get(collection):
+            cursors.append(self.db[collection].aggregate(stages, allowDiskUse=True))
+        return cursors
+
+    async def sessions(self, collection: str, query: Dict[str, Any], sort: Optional[List[Tuple[str, int]]] = None,
+                       skip: int = 0, limit: int = 0) -> AsyncIterator[Dict[str, Any]]:
+        """Sessions matching ``query``, ordered by ``sort`` (all keys in the same direction) if given"""
+        if not self.uses_buckets(collection):
+            cursor = self.db[collection].find(query)
+            if sort:
+                cursor = cursor.sort(sort)
+            async for doc in cursor.skip(skip).limit(limit):
+                yield doc
+            return
+
+        pipeline: List[Dict[str, Any]] = [{"$sort": dict(sort)}] if sort else []
+        single = not self.legacy.get(collection)
+        if single and skip:
+            pipeline.append({"$skip": skip})
+        if limit:
+            pipeline.append({"$limit": limit if single else skip + limit})
+        cursors = self.aggregate(collection, query, pipeline)
+        if sort:
+            fields = [field for field, _ in sort]
+            docs = merge_sorted(cursors, key=lambda doc: tuple(doc.get(field) for field in fields),
+                                reverse=sort[0][1] < 0)
+        else:
+            docs = _chain(cursors)
+        position = 0
+        async for doc in docs:
+            position += 1
+            if not single and position <= skip:
+                continue
+            yield doc
+            if limit and position >= (limit if single else skip + limit):
+                break
+
+    async def count(self, collection: str, query: Dict[str, Any]) -> int:
+        if not self.uses_buckets(collection):
+            return await self.db[collection].count_documents(query)
+        total = 0
+        for cursor in self.aggregate(collection, query, [{"$count": "sessions"}]):
+            async for row in cursor:
+                total += row["sessions"]
+        return total
+
+    async def distinct(self, collection: str, field: str, query: Dict[str, Any]) -> List[Any]:
+        if not self.uses_buckets(collection):
+            return await self.db[collection].distinct(field, query)
+        values = set()
+        for cursor in self.aggregate(collection, query, [{"$group": {"_id": f"${field}"}}]):
+            async for row in cursor:
+                values.add(row["_id"])
+        return list(values)
+
+    # ===============================
+    # CONVERSION
+    # ===============================
+
+    async def convert(self, collection: str) -> int:
+        """Move an existing document collection into this storage mode; returns sessions moved"""
+        existing = (await self.collection_types()).get(collection)
+        if existing != "collection":
+            return 0
+        moved = 0
+        if self.mode == "buckets":
+            source = self.db[collection]
+            while True:
+                docs = await source.find().sort("_id", 1).to_list(CONVERT_BATCH_SIZE)
+                if not docs:
+                    break
+                moved += await self.insert_many(collection, docs)
+                await source.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+            await source.drop()
+            await self.create_view(collection)
+            self.legacy[collection] = False
+        elif self.mode == "timeseries":
+            staging = f"{collection}_documents"
+            await self.db[collection].rename(staging)
+            await self.create_timeseries(collection)
+            source = self.db[staging]
+            async for docs in _batches(source.find().sort("_id", 1), CONVERT_BATCH_SIZE):
+                moved += len((await self.db[collection].insert_many(docs, ordered=False)).inserted_ids)
+            await source.drop()
+        return moved
+
+
+async def _chain(cursors: List[Any]) -> AsyncIterator[Dict[str, Any]]:
+    for cursor in cursors:
+        async for doc in cursor:
+            yield doc
+
+
+async def _batches(cursor, size: int):
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ===============================
+# BENCHMARK
+# ===============================
+
+def synthetic_sessions(users: int, sessions: int, days: int = 365) -> List[Dict[str, Any]]:
+    """Pomodoro-shaped sessions spread over ``days`` for each user"""
+    rng = random.Random(42)
+    start = datetime(2024, 1, 1)
+    docs = []
+    for user in range(users):
+        user_id = str(uuid.UUID(int=user))
+        for _ in range(sessions):
+            docs.append({
+                "id": str(uuid.uuid4()),
+                "user_id": user_id,
+                "task_name": rng.choice(["Write report", "Study", "Email triage", "Code review"]),
+                "work_duration": 25,
+                "break_duration": 5,
+                "focus_quality_ratings": [rng.randint(1, 10) for _ in range(rng.randint(1, 4))],
+                "distractions": [{"type": "phone", "minute": rng.randint(0, 24)}] * rng.randint(0, 2),
+                "break_activities": ["stretch"],
+                "completion_status": rng.choice(["completed", "partial"]),
+                "productivity_score": round(rng.uniform(1, 10), 1),
+                "timestamp": start + timedelta(seconds=rng.randint(0, days * 86400)),
+            })
+    docs.sort(key=lambda doc: doc[TIME_FIELD])
+    return docs
+
+
+async def _storage_stats(db, name: str) -> Dict[str, Any]:
+    try:
+        stats = await db.command({"collStats": name})
+    except OperationFailure:
+        return {}
+    return {
+        "data_bytes": stats.get("size"),
+        "storage_bytes": stats.get("storageSize"),
+        "index_bytes": stats.get("totalIndexSize"),
+    }
+
+
+async def benchmark(db, users: int, sessions: int, queries: int, modes: Iterable[str] = STORAGE_MODES,
+                    window_days: int = 7, limit: int = 50, bucket_days: float = 7,
+                    bucket_size: int = 200) -> List[Dict[str, Any]]:
+    docs = synthetic_sessions(users, sessions)
+    user_ids = sorted({doc["user_id"] for doc in docs})
+    rng = random.Random(7)
+    first, last = docs[0][TIME_FIELD], docs[-1][TIME_FIELD]
+    windows = []
+    for _ in range(queries):
+        since = first + timedelta(seconds=rng.uniform(0, (last - first).total_seconds()))
+        windows.append((rng.choice(user_ids), since, since + timedelta(days=window_days)))
+
+    results = []
+    for mode in modes:
+        name = f"bench_sessions_{mode}"
+        await db.drop_collection(name)
+        await db.drop_collection(f"{name}_buckets")
+        storage = SessionStorage(db, mode, collections=[name], bucket_days=bucket_days, bucket_size=bucket_size)
+        try:
+            await storage.ensure_layout()
+        except OperationFailure as e:
+            results.append({"mode": mode, "error": str(e)})
+            continue
+        if mode != "buckets":
+            await db[name].create_index([(META_FIELD, 1), (TIME_FIELD, -1)])
+
+        started = time.perf_counter()
+        for offset in range(0, len(docs), CONVERT_BATCH_SIZE):
+            # Copies, so the _id added by insert_many does not leak into the next mode
+            await storage.insert_many(name, [dict(doc) for doc in docs[offset:offset + CONVERT_BATCH_SIZE]])
+        write_seconds = time.perf_counter() - started
+
+        latencies = []
+        for user_id, since, until in windows:
+            query = {META_FIELD: user_id, TIME_FIELD: {"$gte": since, "$lte": until}}
+            started = time.perf_counter()
+            await storage.find(name, query, limit)
+            latencies.append((time.perf_counter() - started) * 1000)
+        latencies.sort()
+
+        stored = f"{name}_buckets" if mode == "buckets" else name
+        results.append({
+            "mode": mode,
+            "documents": await db[stored].count_documents({}),
+            **await _storage_stats(db, stored),
+            "write_seconds": round(write_seconds, 3),
+            "query_p50_ms": round(statistics.median(latencies), 3),
+            "query_p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 3),
+        })
+        await db.drop_collection(name)
+        await db.drop_collection(f"{name}_buckets")
+    return results
+
+
+async def _main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert = commands.add_parser("convert")
+    convert.add_argument("collections", nargs="*", default=list(SESSION_COLLECTIONS))
+    convert.add_argument("--mode", choices=["timeseries", "buckets"], required=True)
+    convert.add_argument("--bucket-days", type=float, default=7)
+    convert.add_argument("--bucket-size", type=int, default=200)
+    bench = commands.add_parser("bench")
+    bench.add_argument("--users", type=int, default=50)
+    bench.add_argument("--sessions", type=int, default=2000, help="sessions per user")
+    bench.add_argument("--queries", type=int, default=500)
+    bench.add_argument("--bucket-days", type=float, default=7)
+    bench.add_argument("--bucket-size", type=int, default=200)
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME'].strip('"')]
+    try:
+        if args.command == "convert":
+            unknown = [name for name in args.collections if name not in SESSION_COLLECTIONS]
+            if unknown:
+                parser.error(f"not a session collection: {', '.join(unknown)}")
+            storage = SessionStorage(db, args.mode, args.collections, args.bucket_days, args.bucket_size)
+            await storage.ensure_layout()
+            for collection in args.collections:
+                moved = await storage.convert(collection)
+                print(f"{collection}: moved {moved} sessions to {args.mode}")
+        else:
+            results = await benchmark(db, args.users, args.sessions, args.queries,
+                                      bucket_days=args.bucket_days, bucket_size=args.bucket_size)
+            print(f"{args.users} users x {args.sessions} sessions, {args.queries} 7-day range queries")
+            for row in results:
+                if "error" in row:
+                    print(f"  {row['mode']:<11} unavailable: {row['error']}")
+                    continue
+                print(
+                    f"  {row['mode']:<11} docs={row['documents']:<8} data={row.get('data_bytes')} "
+                    f"storage={row.get('storage_bytes')} indexes={row.get('index_bytes')} "
+                    f"write={row['write_seconds']}s p50={row['query_p50_ms']}ms p95={row['query_p95_ms']}ms"
+                )
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Native date storage for ``sleep_data.sleep_date`` and Mongo-side sleep rollups.
+
+Sleep nights used to be stored with ``sleep_date`` as an ISO string. New
+writes store midnight UTC as a BSON date, and ``SleepHistory.migrate``
+converts the old documents in place, online: batches are read in ``_id`` order,
+rewritten with a conditional bulk update (only if the string is still
+there) and throttled between batches. Progress is kept in ``migrations`` so
+a restart resumes where it left off. Until the backfill is done, range
+queries cover both representations; each half is still an index range on
+``(user_id, sleep_date)`` because Mongo only compares values of the same type.
+
+Weekly and monthly summaries are grouped and averaged by an aggregation
+pipeline, so only one row per period leaves the database.
+
+    python sleep_history.py migrate [--batch-size 500] [--pause 0.05]
+    python sleep_history.py status
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+from datetime import date, datetime, time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_COLLECTION = "migrations"
+MIGRATION_ID = "sleep_date_native"
+SUMMARY_PERIODS = ("week", "month")
+
+# Nightly fields averaged per period: output name -> document field
+SUMMARY_AVERAGES = {
+    "avg_sleep_duration": "sleep_duration",
+    "avg_sleep_quality": "sleep_quality",
+    "avg_bedtime_procrastination_minutes": "bedtime_procrastination_minutes",
+    "avg_sleep_environment_score": "sleep_environment_score",
+    "avg_next_day_procrastination_score": "next_day_procrastination_score",
+}
+
+
+def stored_sleep_date(value: Any) -> Any:
+    """The stored form of a sleep date: midnight UTC as a BSON date"""
+    if isinstance(value, datetime):
+        return datetime.combine(value.date(), time())
+    if isinstance(value, date):
+        return datetime.combine(value, time())
+    if isinstance(value, str):
+        return datetime.combine(date.fromisoformat(value[:10]), time())
+    return value
+
+
+class SleepHistory:
+    def __init__(self, db, batch_size: int = 500, pause: float = 0.05):
+        self.db = db
+        self.batch_size = batch_size
+        self.pause = pause
+        self.migrated = False
+        self.converted = 0
+        self.invalid: set = set()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def state(self):
+        return self.db[MIGRATIONS_COLLECTION]
+
+    async def load(self) -> bool:
+        doc = await self.state.find_one({"_id": MIGRATION_ID})
+        self.migrated = bool(doc and doc.get("done"))
+        return self.migrated
+
+    # ===============================
+    # QUERIES
+    # ===============================
+
+    def range_query(self, user_id: str, since: Optional[date] = None, until: Optional[date] = None) -> Dict[str, Any]:
+        """Filter for a user's nights in ``[since, until]``; raises ``ValueError`` if since > until"""
+        if since and until and since > until:
+            raise ValueError("since must not be after until")
+        query: Dict[str, Any] = {"user_id": user_id}
+        if not since and not until:
+            return query
+        native, legacy = {}, {}
+        if since:
+            native["$gte"] = stored_sleep_date(since)
+            legacy["$gte"] = since.isoformat()
+        if until:
+            native["$lte"] = stored_sleep_date(until)
+            legacy["$lte"] = until.isoformat()
+        if self.migrated:
+            query["sleep_date"] = native
+        else:
+            # Strings and dates never compare equal, so each branch is its own index range
+            query["$or"] = [{"sleep_date": native}, {"sleep_date": legacy}]
+        return query
+
+    async def summary(self, user_id: str, period: str = "week", since: Optional[date] = None,
+                      until: Optional[date] = None) -> List[Dict[str, Any]]:
+        """Per-week (ISO, Monday start) or per-month sleep aggregates, oldest first
+
+        Raises ``ValueError`` for an unknown period or an inverted range.
+        """
+        if period not in SUMMARY_PERIODS:
+            raise ValueError(f"Unknown summary period: {period}")
+        match = self.range_query(user_id, since, until)
+        # Converts legacy strings too, so the pipeline is correct mid-migration;
+        # a string that is not a date becomes null and the night is left out
+        night = {"$convert": {"input": "$sleep_date", "to": "date", "onError": None, "onNull": None}}
+        if period == "week":
+            start = {"$dateFromParts": {
+                "isoWeekYear": {"$isoWeekYear": "$night"},
+                "isoWeek": {"$isoWeek": "$night"},
+                "isoDayOfWeek": 1,
+            }}
+        else:
+            start = {"$dateFromParts": {"year": {"$year": "$night"}, "month": {"$month": "$night"}, "day": 1}}
+
+        group: Dict[str, Any] = {
+            "_id": "$period_start",
+            "nights": {"$sum": 1},
+            "min_sleep_duration": {"$min": "$sleep_duration"},
+            "max_sleep_duration": {"$max": "$sleep_duration"},
+            "first_night": {"$min": "$night"},
+            "last_night": {"$max": "$night"},
+        }
+        group.update({name: {"$avg": f"${field}"} for name, field in SUMMARY_AVERAGES.items()})
+        rounded = {name: {"$round": [f"${name}", 2]} for name in SUMMARY_AVERAGES}
+
+        pipeline = [
+            {"$match": match},
+            {"$project": {"_id": 0, "night": night, "sleep_duration": 1, **{
+                field: 1 for field in SUMMARY_AVERAGES.values()
+            }}},
+            {"$match": {"night": {"$ne": None}}},
+            {"$addFields": {"period_start": start}},
+            {"$group": group},
+            {"$sort": {"_id": 1}},
+            {"$project": {
+                "_id": 0,
+                "period_start": "$_id",
+                "nights": 1,
+                "min_sleep_duration": 1,
+                "max_sleep_duration": 1,
+                "first_night": 1,
+                "last_night": 1,
+                **rounded,
+            }},
+        ]
+        rows = await self.db.sleep_data.aggregate(pipeline).to_list(None)
+        for row in rows:
+            row["period"] = period
+        return rows
+
+    # ===============================
+    # BACKFILL MIGRATION
+    # ===============================
+
+    async def migrate_batch(self, after: Any = None) -> Optional[Any]:
+        """Convert one batch of string dates; returns the last ``_id`` seen, or None when done"""
+        # {"$gte": ""} only matches strings, so this selects exactly the legacy documents
+        query: Dict[str, Any] = {"sleep_date": {"$gte": ""}}
+        if after is not None:
+            query["_id"] = {"$gt": after}
+        docs = await self.db.sleep_data.find(query, {"_id": 1, "sleep_date": 1}).sort("_id", 1).to_list(self.batch_size)
+        if not docs:
+            return None
+        updates = []
+        for doc in docs:
+            try:
+                value = stored_sleep_date(doc["sleep_date"])
+            except ValueError:
+                self.invalid.add(doc["_id"])
+                continue
+            # Conditional on the old value, so a concurrent edit is never overwritten
+            updates.append(UpdateOne(
+                {"_id": doc["_id"], "sleep_date": doc["sleep_date"]},
+                {"$set": {"sleep_date": value}},
+            ))
+        if updates:
+            result = await self.db.sleep_data.bulk_write(updates, ordered=False)
+            self.converted += result.modified_count
+        return docs[-1]["_id"]
+
+    async def migrate(self) -> Dict[str, Any]:
+        """Run the backfill to completion, resuming from the saved position"""
+        doc = await self.state.find_one({"_id": MIGRATION_ID}) or {}
+        if doc.get("done"):
+            self.migrated = True
+            return doc
+        await self.state.update_one(
+            {"_id": MIGRATION_ID},
+            {"$setOnInsert": {"started_at": datetime.utcnow(), "done": False, "last_id": None}},
+            upsert=True,
+        )
+        after = doc.get("last_id")
+        # ObjectIds from other hosts can sort behind the saved position, so a
+        # resumed run ends with one more pass from the start
+        rescan = after is not None
+        while True:
+            last = await self.migrate_batch(after)
+            if last is None:
+                if not rescan:
+                    break
+                rescan = False
+            after = last
+            await self.state.update_one(
+                {"_id": MIGRATION_ID},
+                {"$set": {"last_id": after}, "$inc": {"converted": self.converted}},
+            )
+            self.converted = 0
+            await asyncio.sleep(self.pause)
+        await self.state.update_one(
+            {"_id": MIGRATION_ID},
+            {"$set": {"done": True, "finished_at": datetime.utcnow(), "invalid": len(self.invalid)},
+             "$inc": {"converted": self.converted}},
+        )
+        self.converted = 0
+        self.migrated = True
+        logger.info("sleep_date migration finished")
+        return await self.state.find_one({"_id": MIGRATION_ID})
+
+    async def _run(self):
+        try:
+            await self.migrate()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"sleep_date migration failed: {e}")
+
+    async def start(self):
+        if not await self.load():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def status(self) -> Dict[str, Any]:
+        doc = await self.state.find_one({"_id": MIGRATION_ID}) or {}
+        remaining = 0 if doc.get("done") else await self.db.sleep_data.count_documents({"sleep_date": {"$gte": ""}})
+        return {
+            "done": bool(doc.get("done")),
+            "converted": doc.get("converted", 0),
+            "invalid": doc.get("invalid", len(self.invalid)),
+            "remaining": remaining,
+            "started_at": doc.get("started_at"),
+            "finished_at": doc.get("finished_at"),
+        }
+
+
+async def _main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["migrate", "status"])
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--pause", type=float, default=0.05, help="seconds to wait between batches")
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME'].strip('"')]
+    history = SleepHistory(db, batch_size=args.batch_size, pause=args.pause)
+    try:
+        if args.command == "migrate":
+            await history.migrate()
+        status = await history.status()
+    finally:
+        client.close()
+    print(
+        f"sleep_date migration: {'done' if status['done'] else 'in progress'}, "
+        f"{status['converted']} converted, {status['invalid']} invalid, {status['remaining']} remaining"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark for a worker process.
+
+Each run starts a fresh interpreter that imports server.py, runs the app's
+lifespan startup and sends two requests through the ASGI app in-process,
+then reports per stage, in milliseconds:
+
+* ``interpreter``: from spawning the process until its first line runs
+* ``import``: ``import server``
+* ``startup``: the lifespan startup (indexes, background workers)
+* ``first_request`` / ``second_request``: ``GET /api/dashboard/{user_id}``
+* ``ready``: spawn to the first response, what an autoscaler waits for
+* ``llm_ready``: from the end of startup until the LLM integration has been
+  imported by the background preload
+
+Runs use the in-memory storage engine unless ``--backend mongo``. The real
+``emergentintegrations`` is imported when it is installed, since its import
+is most of what this measures; otherwise (or with ``--stub-llm``) the stub
+from loadtest.py stands in and ``llm_ready`` is close to zero.
+
+    python startup_bench.py run [--runs 5] [--backend memory|mongo] [--save benchmarks/startup_baseline.json]
+    python startup_bench.py compare [--baseline benchmarks/startup_baseline.json] [--threshold 0.25]
+
+``compare`` exits non-zero when the median of a stage is slower than the
+baseline's by more than the threshold (and by at least 5ms, so stages that
+take next to nothing do not flap). Baselines are per machine, as for
+microbench.py.
+"""
+
+import time
+
+# Taken before the other imports so that ``interpreter`` covers only the interpreter itself
+STARTED_AT = time.time()
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List
+
+BASELINE = Path(__file__).parent / "benchmarks" / "startup_baseline.json"
+STAGES = ("interpreter", "import", "startup", "first_request", "second_request", "ready", "llm_ready")
+USER_ID = "2b1f0f1e-5c55-4c1b-9f7e-0d6c1f3a9e10"
+# Stages within this many milliseconds of the baseline never count as regressions
+NOISE_FLOOR_MS = 5.0
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 2)
+
+
+async def _serve(server, timings: Dict[str, float]):
+    from microbench import request
+
+    app = server.app
+    started = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        timings["startup"] = _ms(time.perf_counter() - started)
+        started_up = started = time.perf_counter()
+        status = await request(app, f"/api/dashboard/{USER_ID}")
+        timings["first_request"] = _ms(time.perf_counter() - started)
+        timings["ready"] = _ms(time.time() - float(os.environ["STARTUP_BENCH_SPAWNED_AT"]))
+        if status != 200:
+            raise RuntimeError(f"the first request answered {status}")
+        started = time.perf_counter()
+        await request(app, f"/api/dashboard/{USER_ID}")
+        timings["second_request"] = _ms(time.perf_counter() - started)
+        await server.llm_chat_module.load()
+        timings["llm_ready"] = _ms(time.perf_counter() - started_up)
+
+
+def child(args):
+    """One cold start; prints the timings as a JSON line"""
+    timings = {"interpreter": _ms(STARTED_AT - float(os.environ["STARTUP_BENCH_SPAWNED_AT"]))}
+    sys.path.insert(0, str(Path(__file__).parent))
+    started = time.perf_counter()
+    import server
+    timings["import"] = _ms(time.perf_counter() - started)
+
+    # Installed after the import on purpose: server.py only imports the integration on first use
+    if args.stub_llm:
+        from loadtest import install_stub_llm
+        install_stub_llm(0)
+    asyncio.run(_serve(server, timings))
+    print(json.dumps(timings))
+
+
+def _llm_installed() -> bool:
+    try:
+        import importlib.util
+        return importlib.util.find_spec("emergentintegrations.llm.chat") is not None
+    except ImportError:
+        return False
+
+
+def run(args) -> Dict[str, Any]:
+    stub = args.stub_llm or not _llm_installed()
+    env = {
+        **os.environ,
+        "STORAGE_BACKEND": args.backend,
+        "MONGO_URL": args.mongo_url,
+        "DB_NAME": args.db_name,
+        "EMERGENT_LLM_KEY": os.environ.get("EMERGENT_LLM_KEY", "startup-bench"),
+    }
+    command = [sys.executable, __file__, "child", *(["--stub-llm"] if stub else [])]
+    runs: List[Dict[str, float]] = []
+    for _ in range(args.runs):
+        env["STARTUP_BENCH_SPAWNED_AT"] = repr(time.time())
+        completed = subprocess.run(command, env=env, capture_output=True, text=True)
+        if completed.returncode:
+            sys.exit(f"cold start failed:\n{completed.stderr[-2000:]}")
+        runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    results = {
+        stage: {
+            "best_ms": min(run[stage] for run in runs),
+            "median_ms": round(statistics.median(run[stage] for run in runs), 2),
+        }
+        for stage in STAGES
+    }
+    return {
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}",
+        "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "backend": args.backend,
+        "llm": "stub" if stub else "emergentintegrations",
+        "runs": args.runs,
+        "results": results,
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    rows = []
+    for stage, result in current["results"].items():
+        before = baseline["results"].get(stage)
+        if not before:
+            continue
+        ratio = result["median_ms"] / before["median_ms"] if before["median_ms"] else 1.0
+        slower = result["median_ms"] - before["median_ms"]
+        rows.append({
+            "stage": stage,
+            "baseline_ms": before["median_ms"],
+            "current_ms": result["median_ms"],
+            "ratio": round(ratio, 3),
+            "regressed": ratio > 1 + threshold and slower > NOISE_FLOOR_MS,
+        })
+    return rows
+
+
+def _main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["run", "compare", "child"])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--backend", choices=["memory", "mongo"], default="memory")
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--db-name", default="taskflow_startup_bench")
+    parser.add_argument("--stub-llm", action="store_true", help="use the stub LLM even when the real one is installed")
+    parser.add_argument("--save", help="write the results to this file")
+    parser.add_argument("--baseline", default=str(BASELINE))
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown as a fraction")
+    args = parser.parse_args()
+
+    if args.command == "child":
+        child(args)
+        return
+
+    current = run(args)
+    if args.save:
+        Path(args.save).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.save).write_text(json.dumps(current, indent=2) + "\n")
+    print(f"{current['runs']} cold starts, {current['backend']} backend, {current['llm']} LLM")
+    if args.command == "run":
+        print(f"{'stage':<15} {'best ms':>10} {'median ms':>10}")
+        for stage, result in current["results"].items():
+            print(f"{stage:<15} {result['best_ms']:>10} {result['median_ms']:>10}")
+        return
+
+    baseline = json.loads(Path(args.baseline).read_text())
+    rows = compare(baseline, current, args.threshold)
+    print(f"baseline: {baseline['created_at']} (Python {baseline['python']}, {baseline['machine']}, "
+          f"{baseline['llm']} LLM)")
+    print(f"{'stage':<15} {'baseline ms':>12} {'current ms':>11} {'ratio':>7}")
+    for row in rows:
+        flag = "  REGRESSED" if row["regressed"] else ""
+        print(f"{row['stage']:<15} {row['baseline_ms']:>12} {row['current_ms']:>11} {row['ratio']:>7}{flag}")
+    regressed = [row["stage"] for row in rows if row["regressed"]]
+    if regressed:
+        print(f"\n{len(regressed)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    _main()
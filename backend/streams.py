@@ -0,0 +1,55 @@
+"""
+Helpers for streaming over several sorted async sources at once.
+"""
+
+import heapq
+from typing import Any, AsyncIterator, Callable, List
+
+
+async def merge_sorted(
+    sources: List[AsyncIterator[Any]],
+    key: Callable[[Any], Any],
+    reverse: bool = False,
+) -> AsyncIterator[Any]:
+    """K-way merge of async iterators that are each already sorted by ``key``
+
+    Only one pending item per source is held in memory, so the merge streams
+    regardless of how large the sources are. With ``reverse=True`` the sources
+    must be sorted descending and the output is descending too.
+    """
+    heap = []
+    iterators = [source.__aiter__() for source in sources]
+
+    async def push(index: int):
+        try:
+            item = await iterators[index].__anext__()
+        except StopAsyncIteration:
+            return
+        item_key = key(item)
+        if reverse:
+            item_key = _Reversed(item_key)
+        # The source index breaks ties so items themselves are never compared
+        heapq.heappush(heap, (item_key, index, item))
+
+    for index in range(len(iterators)):
+        await push(index)
+
+    while heap:
+        _, index, item = heapq.heappop(heap)
+        yield item
+        await push(index)
+
+
+class _Reversed:
+    """Inverts the ordering of a key so a min-heap pops the largest first"""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
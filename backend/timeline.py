@@ -0,0 +1,137 @@
+"""
+Unified activity timeline across the module collections.
+
+Each collection is read through a ``(user_id, time, id)`` index in descending
+order, limited to one page, and the cursors are merged with a heap so only
+the requested page is ever materialised. Pages are continued with an opaque
+cursor holding the ``(time, id)`` of the last item returned, which every
+source resumes from with an index range scan. Once a page reaches past the
+hot horizon, records moved to cold storage are merged in as well. Session
+collections are read through ``SessionStorage``, so bucketed sessions are
+included.
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from session_storage import create_index
+from streams import merge_sorted
+
+MAX_PAGE_SIZE = 100
+
+
+class TimelineSource:
+    def __init__(self, collection: str, time_field: str = "timestamp"):
+        self.collection = collection
+        self.time_field = time_field
+
+
+TIMELINE_SOURCES: Dict[str, TimelineSource] = {
+    "pomodoro": TimelineSource("pomodoro_sessions"),
+    "meditation": TimelineSource("meditation_sessions"),
+    "five_minute": TimelineSource("five_minute_sessions"),
+    "activity": TimelineSource("activity_sessions"),
+    "sleep": TimelineSource("sleep_data", "bedtime"),
+    "thought_record": TimelineSource("thought_records"),
+}
+
+
+def encode_cursor(when: datetime, item_id: str) -> str:
+    raw = json.dumps([when.isoformat(), item_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """Raises ``ValueError`` for a malformed cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        when, item_id = json.loads(raw)
+        return datetime.fromisoformat(when), str(item_id)
+    except (TypeError, json.JSONDecodeError, UnicodeDecodeError, base64.binascii.Error) as e:
+        raise ValueError(f"Invalid timeline cursor: {e}")
+
+
+class Timeline:
+    def __init__(self, db, sources: Optional[Dict[str, TimelineSource]] = None, archive=None, storage=None):
+        self.db = db
+        self.sources = sources or TIMELINE_SOURCES
+        self.archive = archive
+        self.storage = storage
+
+    async def ensure_indexes(self):
+        for source in self.sources.values():
+            await create_index(
+                self.db[source.collection], [("user_id", 1), (source.time_field, -1), ("id", -1)]
+            )
+
+    async def _items(self, kind: str, source: TimelineSource, query: Dict[str, Any], limit: int):
+        sort = [(source.time_field, -1), ("id", -1)]
+        if self.storage and self.storage.manages(source.collection):
+            docs = self.storage.sessions(source.collection, query, sort, limit=limit)
+        else:
+            docs = self.db[source.collection].find(query).sort(sort).limit(limit)
+        async for doc in docs:
+            doc.pop("_id", None)
+            yield {"type": kind, "timestamp": doc[source.time_field], "id": doc["id"], "data": doc}
+
+    async def _with_archived(self, user_id: str, kinds: List[str], after, items: List[Dict[str, Any]],
+                             limit: int) -> List[Dict[str, Any]]:
+        """Merge the newest archived records after the cursor into a page that reached cold data"""
+        seen = {(item["type"], item["id"]) for item in items}
+        for kind in kinds:
+            source = self.sources[kind]
+            if not self.archive.manages(source.collection):
+                continue
+            for doc in await self.archive.page(source.collection, user_id, limit, before=after):
+                doc.pop("_id", None)
+                if (kind, doc["id"]) not in seen:
+                    items.append({"type": kind, "timestamp": doc[source.time_field], "id": doc["id"], "data": doc})
+        items.sort(key=lambda item: (item["timestamp"], item["id"]), reverse=True)
+        return items[:limit]
+
+    async def page(self, user_id: str, types: Optional[Iterable[str]] = None, limit: int = 20,
+                   cursor: Optional[str] = None) -> Dict[str, Any]:
+        """One page of the user's activity, newest first
+
+        ``types`` restricts the modules included; unknown names raise ``ValueError``.
+        """
+        kinds = list(types) if types else list(self.sources)
+        unknown = [kind for kind in kinds if kind not in self.sources]
+        if unknown:
+            raise ValueError(f"Unknown timeline types: {', '.join(unknown)}")
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        after = decode_cursor(cursor) if cursor else None
+
+        sources = []
+        for kind in kinds:
+            source = self.sources[kind]
+            if after:
+                when, item_id = after
+                # The redundant upper bound lets bucketed storage skip newer buckets
+                query = {"user_id": user_id, source.time_field: {"$lte": when}, "$or": [
+                    {source.time_field: {"$lt": when}},
+                    {source.time_field: when, "id": {"$lt": item_id}},
+                ]}
+            else:
+                query = {"user_id": user_id, source.time_field: {"$exists": True}}
+            # One extra item tells us whether there is another page
+            sources.append(self._items(kind, source, query, limit + 1))
+
+        items: List[Dict[str, Any]] = []
+        merged = merge_sorted(sources, key=lambda item: (item["timestamp"], item["id"]), reverse=True)
+        async for item in merged:
+            items.append(item)
+            if len(items) > limit:
+                break
+        await merged.aclose()
+        if self.archive and (len(items) <= limit or items[-1]["timestamp"] < self.archive.cutoff()):
+            items = await self._with_archived(user_id, kinds, after, items, limit + 1)
+
+        has_more = len(items) > limit
+        items = items[:limit]
+        return {
+            "items": items,
+            "next_cursor": encode_cursor(items[-1]["timestamp"], items[-1]["id"]) if has_more else None,
+        }
@@ -0,0 +1,136 @@
+"""
+Hierarchical timing wheel for large numbers of cheap timers.
+
+Scheduling and cancelling a timer are O(1) dictionary operations, and each
+tick only touches the slot that is due (plus an occasional cascade of one
+higher-level slot), so tens of thousands of timers cost no more per tick than
+a handful. Deadlines are wall-clock epoch seconds rounded up to the tick.
+"""
+
+import asyncio
+import logging
+import math
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _Timer:
+    __slots__ = ("key", "tick", "deadline", "payload", "bucket")
+
+    def __init__(self, key: Hashable, tick: int, deadline: float, payload: Any):
+        self.key = key
+        self.tick = tick
+        self.deadline = deadline
+        self.payload = payload
+        self.bucket: Optional[Dict[Hashable, "_Timer"]] = None
+
+
+class TimerWheel:
+    """Timers keyed by an id; re-scheduling a key replaces its previous timer"""
+
+    def __init__(self, tick: float = 1.0, wheel_sizes: Tuple[int, ...] = (64, 64, 64, 64), now: Optional[float] = None):
+        self.tick_seconds = tick
+        self.sizes = wheel_sizes
+        # spans[level] = ticks covered by one slot at that level
+        self.spans = [1]
+        for size in wheel_sizes[:-1]:
+            self.spans.append(self.spans[-1] * size)
+        self.horizon = self.spans[-1] * wheel_sizes[-1]
+        self.wheels: List[List[Dict[Hashable, _Timer]]] = [[{} for _ in range(size)] for size in wheel_sizes]
+        self.overflow: Dict[Hashable, _Timer] = {}
+        self.timers: Dict[Hashable, _Timer] = {}
+        self.current_tick = self._to_tick(time.time() if now is None else now, math.floor)
+        # How late the real-time driver woke up for its ticks
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def __len__(self) -> int:
+        return len(self.timers)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.timers
+
+    def _to_tick(self, seconds: float, rounding=math.ceil) -> int:
+        return int(rounding(seconds / self.tick_seconds))
+
+    def _place(self, timer: _Timer):
+        delta = timer.tick - self.current_tick
+        if delta >= self.horizon:
+            bucket = self.overflow
+        else:
+            level = 0
+            while level < len(self.sizes) - 1 and delta >= self.spans[level + 1]:
+                level += 1
+            bucket = self.wheels[level][(timer.tick // self.spans[level]) % self.sizes[level]]
+        bucket[timer.key] = timer
+        timer.bucket = bucket
+
+    def schedule(self, key: Hashable, deadline: float, payload: Any = None):
+        """Fire ``key`` at epoch time ``deadline`` (past deadlines fire on the next tick)"""
+        self.cancel(key)
+        tick = max(self._to_tick(deadline), self.current_tick + 1)
+        timer = _Timer(key, tick, deadline, payload)
+        self.timers[key] = timer
+        self._place(timer)
+
+    def cancel(self, key: Hashable) -> bool:
+        timer = self.timers.pop(key, None)
+        if timer is None:
+            return False
+        del timer.bucket[key]
+        timer.bucket = None
+        return True
+
+    def deadline(self, key: Hashable) -> Optional[float]:
+        timer = self.timers.get(key)
+        return timer.deadline if timer else None
+
+    def _cascade(self, bucket: Dict[Hashable, _Timer]):
+        timers = list(bucket.values())
+        bucket.clear()
+        for timer in timers:
+            self._place(timer)
+
+    def advance(self, now: Optional[float] = None) -> List[Tuple[Hashable, float, Any]]:
+        """Move the wheel up to ``now`` and return the expired ``(key, deadline, payload)``
+
+        Timers come out in deadline order.
+        """
+        target = self._to_tick(time.time() if now is None else now, math.floor)
+        expired: List[Tuple[Hashable, float, Any]] = []
+        while self.current_tick < target:
+            if not self.timers:
+                self.current_tick = target
+                break
+            self.current_tick += 1
+            tick = self.current_tick
+            if tick % self.horizon == 0 and self.overflow:
+                self._cascade(self.overflow)
+            # Pull the now-current slot of each higher level down, highest first
+            for level in range(len(self.sizes) - 1, 0, -1):
+                if tick % self.spans[level] == 0:
+                    self._cascade(self.wheels[level][(tick // self.spans[level]) % self.sizes[level]])
+            bucket = self.wheels[0][tick % self.sizes[0]]
+            if bucket:
+                for timer in sorted(bucket.values(), key=lambda timer: timer.deadline):
+                    del self.timers[timer.key]
+                    timer.bucket = None
+                    expired.append((timer.key, timer.deadline, timer.payload))
+                bucket.clear()
+        return expired
+
+    async def run(self, on_expire: Callable[[Hashable, float, Any], Awaitable[None]]):
+        """Drive the wheel in real time, awaiting ``on_expire`` for each timer"""
+        while True:
+            now = time.time()
+            due = now - (now % self.tick_seconds) + self.tick_seconds
+            await asyncio.sleep(due - now)
+            self.last_lag = max(time.time() - due, 0.0)
+            self.max_lag = max(self.max_lag, self.last_lag)
+            for key, deadline, payload in self.advance():
+                try:
+                    await on_expire(key, deadline, payload)
+                except Exception as e:
+                    logger.error(f"Timer {key!r} callback failed: {e}")
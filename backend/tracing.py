@@ -0,0 +1,394 @@
+"""
+Lightweight request tracing exported as OTLP JSON.
+
+Each HTTP request becomes a trace: ``TracingMiddleware`` opens the server
+span (continuing a W3C ``traceparent`` from the caller when there is one),
+``traced_route`` adds a span around the route handler, ``MongoTracing`` adds
+one per Mongo command and ``Tracer.span`` is used around LLM calls and
+anything else worth timing. The current span lives in a context variable, so
+tasks created with ``asyncio.create_task`` / ``gather`` and Motor's executor
+threads all attach their spans to the right parent.
+
+Sampling happens at the tail: spans are buffered until the root span ends,
+then the whole trace is kept when it failed, took at least ``slow_ms`` or is
+picked by ``sample_rate``; everything else is dropped. Kept traces are
+batched in the background and written as ``ExportTraceServiceRequest`` JSON,
+either appended one per line to a file (the collector's ``otlpjsonfile``
+format) or posted to an OTLP/HTTP collector at ``<endpoint>/v1/traces``.
+"""
+
+import asyncio
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from fastapi.routing import APIRoute
+from pymongo import monitoring
+
+from db_monitor import command_shape
+from metrics import command_collection
+
+logger = logging.getLogger(__name__)
+
+# OTLP span kinds and status codes
+KIND_INTERNAL, KIND_SERVER, KIND_CLIENT = 1, 2, 3
+STATUS_UNSET, STATUS_OK, STATUS_ERROR = 0, 1, 2
+
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+MAX_SPANS_PER_TRACE = 1000
+
+
+def _attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+class Trace:
+    """Spans of one trace buffered until the root ends; shared across tasks and threads"""
+
+    __slots__ = ("trace_id", "spans", "dropped", "done", "kept", "lock")
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans: List["Span"] = []
+        self.dropped = 0
+        self.done = False
+        self.kept = False
+        self.lock = threading.Lock()
+
+    def add(self, span: "Span") -> bool:
+        """Buffer a finished span; False once the trace has been decided"""
+        with self.lock:
+            if self.done:
+                return False
+            if len(self.spans) >= MAX_SPANS_PER_TRACE:
+                self.dropped += 1
+            else:
+                self.spans.append(span)
+            return True
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes",
+                 "status", "message")
+
+    def __init__(self, trace: Trace, name: str, kind: int = KIND_INTERNAL, parent_id: Optional[str] = None,
+                 attributes: Optional[Dict[str, Any]] = None, start_ns: Optional[int] = None):
+        self.trace = trace
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes or {}
+        self.status = STATUS_UNSET
+        self.message = ""
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def fail(self, message: str):
+        self.status = STATUS_ERROR
+        self.message = message
+
+    @property
+    def seconds(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e9
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": self.status, "message": self.message} if self.message else {"code": self.status},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class Tracer:
+    def __init__(self, service: str = "taskflow-backend", export: Optional[str] = None, slow_ms: float = 0,
+                 sample_rate: float = 0.0, flush_interval: float = 2.0, max_queue: int = 10000):
+        self.service = service
+        self.export = export
+        self.slow_seconds = slow_ms / 1000
+        self.sample_rate = sample_rate
+        self.flush_interval = flush_interval
+        # Finished spans of kept traces waiting for the exporter; bounded so a dead collector cannot grow it
+        self._queue: deque = deque(maxlen=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        # httpx.AsyncClient, imported on the first collector export only
+        self._client: Optional[Any] = None
+        self.traces_kept = 0
+        self.traces_dropped = 0
+        self.spans_exported = 0
+        self.export_failures = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.export)
+
+    # -- spans -------------------------------------------------------------
+
+    def start_span(self, name: str, kind: int = KIND_INTERNAL, parent: Optional[Span] = None,
+                   attributes: Optional[Dict[str, Any]] = None, start_ns: Optional[int] = None) -> Optional[Span]:
+        """A child of ``parent`` (default: the current span); None outside a trace"""
+        parent = parent or current_span.get()
+        if parent is None:
+            return None
+        return Span(parent.trace, name, kind, parent.span_id, attributes, start_ns)
+
+    def start_trace(self, name: str, traceparent: Optional[str] = None,
+                    attributes: Optional[Dict[str, Any]] = None) -> Span:
+        """A root span; continues the caller's trace when given a valid ``traceparent``"""
+        match = TRACEPARENT.match(traceparent or "")
+        if match:
+            return Span(Trace(match.group(1)), name, KIND_SERVER, match.group(2), attributes)
+        return Span(Trace(f"{random.getrandbits(128):032x}"), name, KIND_SERVER, None, attributes)
+
+    def end_span(self, span: Span, end_ns: Optional[int] = None):
+        span.end_ns = end_ns or time.time_ns()
+        trace = span.trace
+        if trace.add(span):
+            return
+        # Finished after its trace was decided (a task that outlived the request)
+        if trace.kept:
+            self._queue.append(span)
+
+    def end_trace(self, root: Span):
+        """End the root span and make the tail-sampling decision for the whole trace"""
+        root.end_ns = time.time_ns()
+        trace = root.trace
+        with trace.lock:
+            trace.spans.append(root)
+            trace.done = True
+            trace.kept = (
+                root.seconds >= self.slow_seconds
+                or any(span.status == STATUS_ERROR for span in trace.spans)
+                or random.random() < self.sample_rate
+            )
+            spans = trace.spans
+        if not trace.kept:
+            self.traces_dropped += 1
+            return
+        self.traces_kept += 1
+        if trace.dropped:
+            root.set("tracing.dropped_spans", trace.dropped)
+        self._queue.extend(spans)
+
+    @contextmanager
+    def span(self, name: str, kind: int = KIND_INTERNAL, **attributes) -> Iterator[Optional[Span]]:
+        """Time a block as a child of the current span; yields None when not tracing"""
+        span = self.start_span(name, kind, attributes=attributes) if self.enabled else None
+        if span is None:
+            yield None
+            return
+        token = current_span.set(span)
+        try:
+            yield span
+        except asyncio.CancelledError:
+            span.fail("cancelled")
+            raise
+        except Exception as e:
+            span.fail(f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            current_span.reset(token)
+            self.end_span(span)
+
+    # -- export ------------------------------------------------------------
+
+    def payload(self, spans: List[Span]) -> Dict[str, Any]:
+        return {"resourceSpans": [{
+            "resource": {"attributes": [_attribute("service.name", self.service)]},
+            "scopeSpans": [{
+                "scope": {"name": "taskflow.tracing"},
+                "spans": [span.to_otlp() for span in spans],
+            }],
+        }]}
+
+    def _append(self, line: str):
+        path = Path(self.export)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("a") as f:
+            f.write(line + "\n")
+
+    async def flush(self):
+        spans = []
+        while self._queue:
+            spans.append(self._queue.popleft())
+        if not spans:
+            return
+        payload = self.payload(spans)
+        try:
+            if self.export.startswith(("http://", "https://")):
+                if self._client is None:
+                    import httpx
+
+                    self._client = httpx.AsyncClient(timeout=10)
+                response = await self._client.post(f"{self.export.rstrip('/')}/v1/traces", json=payload)
+                response.raise_for_status()
+            else:
+                await asyncio.to_thread(self._append, json.dumps(payload, separators=(",", ":")))
+            self.spans_exported += len(spans)
+        except Exception as e:
+            self.export_failures += 1
+            logger.warning(f"Exporting {len(spans)} spans to {self.export} failed: {e}")
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self):
+        if self.enabled:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.enabled:
+            await self.flush()
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "export": self.export,
+            "slow_ms": self.slow_seconds * 1000,
+            "sample_rate": self.sample_rate,
+            "traces_kept": self.traces_kept,
+            "traces_dropped": self.traces_dropped,
+            "spans_queued": len(self._queue),
+            "spans_exported": self.spans_exported,
+            "export_failures": self.export_failures,
+        }
+
+
+class TracingMiddleware:
+    """Opens the server span of each HTTP request and names it after the route template"""
+
+    def __init__(self, app, tracer: Tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        root = self.tracer.start_trace(
+            f"{scope['method']} {scope['path']}",
+            headers.get(b"traceparent", b"").decode("latin-1"),
+            {"http.method": scope["method"], "http.target": scope["path"]},
+        )
+        token = current_span.set(root)
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                root.set("http.status_code", message["status"])
+                if message["status"] >= 500:
+                    root.fail(f"HTTP {message['status']}")
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        except BaseException as e:
+            root.fail(f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            current_span.reset(token)
+            route = getattr(scope.get("route"), "path", None)
+            if route:
+                root.name = f"{scope['method']} {route}"
+                root.set("http.route", route)
+            self.tracer.end_trace(root)
+
+
+def traced_route(tracer: Tracer) -> type:
+    """A route class adding a ``handler <name>`` span around the endpoint; plain routes when tracing is off"""
+    if not tracer.enabled:
+        return APIRoute
+
+    class TracedRoute(APIRoute):
+        def get_route_handler(self):
+            handler = super().get_route_handler()
+            name = f"handler {self.name}"
+
+            async def traced_handler(request):
+                with tracer.span(name, **{"code.function": self.endpoint.__name__}):
+                    return await handler(request)
+
+            return traced_handler
+
+    return TracedRoute
+
+
+class MongoTracing(monitoring.CommandListener):
+    """A client span per Mongo command issued inside a trace, with the redacted command as its statement"""
+
+    def __init__(self, tracer: Tracer):
+        self.tracer = tracer
+        # (connection, request id) -> span; reply events carry neither the command nor the context
+        self._pending: Dict[Tuple[Any, int], Span] = {}
+
+    def started(self, event):
+        span = self.tracer.start_span(f"mongo {event.command_name}", KIND_CLIENT)
+        if span is None:
+            return
+        collection = command_collection(event.command_name, event.command)
+        span.name = f"mongo {event.command_name} {collection}"
+        span.attributes.update({
+            "db.system": "mongodb",
+            "db.name": event.database_name,
+            "db.operation": event.command_name,
+            "db.mongodb.collection": collection,
+            "db.statement": json.dumps(command_shape(event.command_name, event.command), default=str),
+        })
+        self._pending[(event.connection_id, event.request_id)] = span
+
+    def _finished(self, event, error: Optional[str] = None):
+        span = self._pending.pop((event.connection_id, event.request_id), None)
+        if span is None:
+            return
+        if error:
+            span.fail(error)
+        # The driver's own duration; the listener runs after the reply is decoded
+        self.tracer.end_span(span, span.start_ns + event.duration_micros * 1000)
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event, error=str(event.failure.get("errmsg", event.failure)) if event.failure else "failed")
@@ -0,0 +1,20 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The backend modules import each other by bare name, as server.py does
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from memory_engine import MemoryClient  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def db():
+    """A fresh in-memory database, as with STORAGE_BACKEND=memory"""
+    return MemoryClient()["taskflow_test"]
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+pytestmark = pytest.mark.anyio
+
+
+async def ok():
+    return "ok"
+
+
+async def fail():
+    raise RuntimeError("downstream error")
+
+
+async def slow():
+    await asyncio.sleep(0.05)
+    return "late"
+
+
+async def test_opens_when_the_failure_rate_trips():
+    breaker = CircuitBreaker("test", deadline=1.0, window=4, min_calls=4, failure_rate=0.5, cooldown=60)
+    await breaker.call(ok)
+    await breaker.call(ok)
+    with pytest.raises(RuntimeError):
+        await breaker.call(fail)
+    assert breaker.state == CLOSED
+    with pytest.raises(RuntimeError):
+        await breaker.call(fail)
+    assert breaker.state == OPEN
+
+    with pytest.raises(CircuitOpenError):
+        await breaker.call(ok)
+    assert await breaker.call_with_fallback(ok, lambda: "fallback") == ("fallback", True)
+    stats = breaker.stats()
+    assert (stats["rejections"], stats["fallbacks"], stats["times_opened"]) == (2, 1, 1)
+
+
+async def test_half_open_probe_closes_or_reopens():
+    breaker = CircuitBreaker("test", deadline=1.0, window=2, min_calls=2, failure_rate=0.5, cooldown=0.01)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            await breaker.call(fail)
+    assert breaker.state == OPEN
+
+    await asyncio.sleep(0.02)
+    assert breaker.stats()["state"] == HALF_OPEN
+    with pytest.raises(RuntimeError):
+        await breaker.call(fail)
+    assert breaker.state == OPEN
+    assert breaker.times_opened == 2
+
+    await asyncio.sleep(0.02)
+    assert await breaker.call(ok) == "ok"
+    assert breaker.state == CLOSED
+
+
+async def test_timeouts_and_slow_calls_count_as_failures():
+    breaker = CircuitBreaker("test", deadline=0.01, window=10, min_calls=10)
+    with pytest.raises(asyncio.TimeoutError):
+        await breaker.call(slow)
+    assert breaker.timeouts == 1
+
+    breaker = CircuitBreaker("test", deadline=1.0, slow_call_seconds=0.01, window=2, min_calls=2)
+    assert await breaker.call(slow) == "late"
+    assert await breaker.call(slow) == "late"
+    assert breaker.slow_calls == 2
+    assert breaker.state == OPEN
+
+
+def test_slow_call_threshold_defaults_to_a_fraction_of_the_deadline():
+    assert CircuitBreaker("test", deadline=8.0).slow_call_seconds == 6.0
@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from cold_storage import TIER_SOURCES, ColdStorage
+
+pytestmark = pytest.mark.anyio
+
+USER_ID = "user-1"
+SOURCE = TIER_SOURCES["pomodoro_sessions"]
+
+
+@pytest.fixture
+def now():
+    return datetime.utcnow().replace(microsecond=0)
+
+
+async def seed(db, now: datetime, days: int = 20):
+    """One session a day, two on every fifth day sharing a timestamp"""
+    docs = []
+    for day in range(days):
+        when = now - timedelta(days=day, hours=1)
+        docs.append({"id": f"a{day:02d}", "user_id": USER_ID, "timestamp": when})
+        if day % 5 == 0:
+            docs.append({"id": f"b{day:02d}", "user_id": USER_ID, "timestamp": when})
+    await db.pomodoro_sessions.insert_many(docs)
+    return sorted(docs, key=SOURCE.key, reverse=True)
+
+
+async def archived(db, now, hot_days: float = 7, chunk_size: int = 3) -> ColdStorage:
+    storage = ColdStorage(db, {"pomodoro_sessions": SOURCE}, hot_days=hot_days, chunk_size=chunk_size)
+    await storage.ensure_indexes()
+    await storage.archive_user(SOURCE, USER_ID, storage.cutoff())
+    return storage
+
+
+def ids(docs):
+    return [doc["id"] for doc in docs]
+
+
+async def test_archiving_moves_old_records_in_chunks(db, now):
+    expected = await seed(db, now)
+    storage = await archived(db, now)
+
+    old = [doc for doc in expected if doc["timestamp"] < storage.cutoff()]
+    assert await db.pomodoro_sessions.count_documents({}) == len(expected) - len(old)
+    assert await storage.count("pomodoro_sessions", USER_ID) == len(old)
+    assert await db.cold_archives.count_documents({}) == -(-len(old) // 3)
+    assert ids([doc async for doc in storage.iter_records("pomodoro_sessions", USER_ID)]) == ids(old[::-1])
+    assert ids([doc async for doc in storage.iter_records("pomodoro_sessions", USER_ID, skip=4)]) == ids(old[::-1][4:])
+
+    # Archiving again is a no-op
+    await storage.archive_user(SOURCE, USER_ID, storage.cutoff())
+    assert await storage.count("pomodoro_sessions", USER_ID) == len(old)
+
+
+async def test_page_boundaries(db, now):
+    expected = await seed(db, now)
+    storage = await archived(db, now)
+    old = [doc for doc in expected if doc["timestamp"] < storage.cutoff()]
+
+    # Walk the archives page by page with the (time, id) position of the last record
+    pages, before = [], None
+    while True:
+        page = await storage.page("pomodoro_sessions", USER_ID, 4, before=before)
+        if not page:
+            break
+        assert len(page) <= 4
+        pages += page
+        before = SOURCE.key(page[-1])
+    assert ids(pages) == ids(old)
+
+    # Inclusive time bounds, including a timestamp shared by two records
+    shared = next(doc["timestamp"] for doc in old if doc["id"].startswith("b"))
+    page = await storage.page("pomodoro_sessions", USER_ID, 10, since=shared, until=shared)
+    assert sorted(ids(page)) == sorted(doc["id"] for doc in old if doc["timestamp"] == shared)
+    page = await storage.page("pomodoro_sessions", USER_ID, 10, until=shared - timedelta(seconds=1))
+    assert ids(page) == ids([doc for doc in old if doc["timestamp"] < shared][:10])
+
+
+async def test_fill_completes_hot_pages_from_the_archives(db, now):
+    expected = await seed(db, now)
+    storage = await archived(db, now)
+
+    query = {"user_id": USER_ID, "timestamp": {"$gte": now - timedelta(days=30), "$lte": now}}
+    hot = await db.pomodoro_sessions.find(query).sort([("timestamp", -1), ("id", -1)]).to_list(None)
+    for limit in (3, len(hot), len(hot) + 5, 100):
+        filled = await storage.fill("pomodoro_sessions", query, hot[:limit], limit)
+        assert ids(filled) == ids(expected[:limit])
+
+    # A page still inside the hot horizon is left alone
+    decompressed = storage.decompressed
+    assert await storage.fill("pomodoro_sessions", query, hot[:2], 2) == hot[:2]
+    assert storage.decompressed == decompressed
@@ -0,0 +1,47 @@
+import random
+
+from leaderboard import SortedSet
+
+
+def test_rank_is_by_score_then_member():
+    board = SortedSet()
+    for member, score in [("carol", 30), ("alice", 50), ("bob", 30), ("dave", 10)]:
+        board.add(member, score)
+
+    assert len(board) == 4
+    assert [board.rank(member) for member in ("alice", "bob", "carol", "dave")] == [0, 1, 2, 3]
+    assert board.rank("nobody") is None
+
+
+def test_updates_reposition_members():
+    board = SortedSet()
+    board.add("alice", 50)
+    board.add("bob", 40)
+    assert board.incr("bob", 15) == 55
+    assert board.rank("bob") == 0
+    board.add("alice", 60)
+    assert board.range(0, 2) == [("alice", 60), ("bob", 55)]
+    board.remove("alice")
+    assert "alice" not in board
+    assert board.range(0, 10) == [("bob", 55)]
+
+
+def test_range_matches_a_sorted_list():
+    rng = random.Random(7)
+    board = SortedSet()
+    scores = {}
+    for _ in range(2000):
+        member = f"user{rng.randrange(300)}"
+        if rng.random() < 0.1:
+            board.remove(member)
+            scores.pop(member, None)
+        else:
+            scores[member] = rng.randrange(100)
+            board.add(member, scores[member])
+
+    expected = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+    assert list(board.items()) == expected
+    for start, stop in [(0, 10), (25, 60), (len(expected) - 5, len(expected) + 5), (-3, 4), (10, 10)]:
+        assert board.range(start, stop) == expected[max(start, 0):stop]
+    for rank, (member, _) in enumerate(expected):
+        assert board.rank(member) == rank
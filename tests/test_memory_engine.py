@@ -0,0 +1,120 @@
+import pytest
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+pytestmark = pytest.mark.anyio
+
+
+async def ids(cursor):
+    return sorted(doc["id"] for doc in await cursor.to_list(None))
+
+
+async def test_array_equality_and_element_matches(db):
+    await db.items.insert_many([
+        {"id": "a", "tags": ["x", "y"]},
+        {"id": "b", "tags": ["y", "x"]},
+        {"id": "c", "tags": [["x", "y"], "z"]},
+        {"id": "d", "tags": "x"},
+    ])
+
+    # A whole array matches the field itself, in order, or an element that is that array
+    assert await ids(db.items.find({"tags": ["x", "y"]})) == ["a", "c"]
+    # A scalar matches the field or any element of it
+    assert await ids(db.items.find({"tags": "x"})) == ["a", "b", "d"]
+    assert await ids(db.items.find({"tags": {"$all": ["y", "x"]}})) == ["a", "b"]
+    assert await ids(db.items.find({"tags": {"$size": 2}})) == ["a", "b", "c"]
+
+
+async def test_null_matches_missing_but_exists_does_not(db):
+    await db.items.insert_many([{"id": "set", "value": 1}, {"id": "null", "value": None}, {"id": "missing"}])
+
+    assert await ids(db.items.find({"value": None})) == ["missing", "null"]
+    assert await ids(db.items.find({"value": {"$ne": None}})) == ["set"]
+    assert await ids(db.items.find({"value": {"$exists": True}})) == ["null", "set"]
+    assert await ids(db.items.find({"value": {"$exists": False}})) == ["missing"]
+    # Comparisons only match values of the same type, never null against a number
+    assert await ids(db.items.find({"value": {"$lt": 5}})) == ["set"]
+
+
+async def test_push_each_sort_and_slice(db):
+    await db.items.insert_one({"id": "a", "recent": [1, 2]})
+
+    await db.items.update_one({"id": "a"}, {"$push": {"recent": {"$each": [3, 4, 5], "$slice": -3}}})
+    assert (await db.items.find_one({"id": "a"}))["recent"] == [3, 4, 5]
+
+    await db.items.update_one({"id": "a"}, {"$push": {"recent": {"$each": [0], "$sort": -1, "$slice": 2}}})
+    assert (await db.items.find_one({"id": "a"}))["recent"] == [5, 4]
+
+    # Pushing onto a missing field starts an array
+    await db.items.update_one({"id": "a"}, {"$push": {"other": 7}})
+    assert (await db.items.find_one({"id": "a"}))["other"] == [7]
+
+
+async def test_upsert_seeds_from_equality_conditions(db):
+    result = await db.items.update_one(
+        {"user_id": "u1", "day": {"$eq": 3}, "count": {"$gt": 0}, "meta.kind": "daily", "$or": [{"x": 1}, {"x": 2}]},
+        {"$inc": {"total": 5}, "$setOnInsert": {"created": True}},
+        upsert=True,
+    )
+    assert result.upserted_id is not None
+    doc = await db.items.find_one({"_id": result.upserted_id}, {"_id": 0})
+    assert doc == {"user_id": "u1", "day": 3, "meta": {"kind": "daily"}, "total": 5, "created": True}
+
+    # The next write finds the seeded document, and $setOnInsert no longer applies
+    await db.items.update_one({"user_id": "u1", "day": 3}, {"$inc": {"total": 1}, "$setOnInsert": {"created": False}},
+                              upsert=True)
+    assert await db.items.count_documents({}) == 1
+    assert (await db.items.find_one({"user_id": "u1"}))["total"] == 6
+    assert (await db.items.find_one({"user_id": "u1"}))["created"] is True
+
+
+async def test_unique_index_rejects_duplicates(db):
+    await db.items.create_index("id", unique=True)
+    await db.items.insert_one({"id": "a"})
+
+    with pytest.raises(DuplicateKeyError) as error:
+        await db.items.insert_one({"id": "a"})
+    assert error.value.code == 11000
+    with pytest.raises(DuplicateKeyError):
+        await db.items.update_one({"id": "b"}, {"$set": {"id": "a"}}, upsert=True)
+
+    # Unordered inserts keep going past the duplicate and report it
+    with pytest.raises(BulkWriteError) as error:
+        await db.items.insert_many([{"id": "c"}, {"id": "a"}, {"id": "d"}], ordered=False)
+    assert [e["code"] for e in error.value.details["writeErrors"]] == [11000]
+    assert await ids(db.items.find()) == ["a", "c", "d"]
+
+    # An index cannot be built over data that already breaks it
+    await db.others.insert_many([{"id": "x"}, {"id": "x"}])
+    with pytest.raises(DuplicateKeyError):
+        await db.others.create_index("id", unique=True)
+
+
+async def test_group_accumulators(db):
+    await db.items.insert_many([
+        {"user_id": "u1", "minutes": 25, "tag": "a"},
+        {"user_id": "u1", "minutes": 50, "tag": "b"},
+        {"user_id": "u1", "minutes": None, "tag": "a"},
+        {"user_id": "u2", "minutes": 10},
+    ])
+    pipeline = [
+        {"$sort": {"minutes": 1}},
+        {"$group": {
+            "_id": "$user_id",
+            "total": {"$sum": "$minutes"},
+            "sessions": {"$sum": 1},
+            "average": {"$avg": "$minutes"},
+            "shortest": {"$min": "$minutes"},
+            "longest": {"$max": "$minutes"},
+            "first": {"$first": "$minutes"},
+            "tags": {"$addToSet": "$tag"},
+            "all_tags": {"$push": "$tag"},
+        }},
+        {"$sort": {"_id": 1}},
+    ]
+    u1, u2 = await db.items.aggregate(pipeline).to_list(None)
+
+    # Nulls and missing values are skipped by $sum/$avg/$min/$max but still counted as documents
+    assert u1 == {"_id": "u1", "total": 75, "sessions": 3, "average": 37.5, "shortest": 25, "longest": 50,
+                  "first": None, "tags": ["a", "b"], "all_tags": ["a", "a", "b"]}
+    assert u2 == {"_id": "u2", "total": 10, "sessions": 1, "average": 10, "shortest": 10, "longest": 10,
+                  "first": 10, "tags": [], "all_tags": []}
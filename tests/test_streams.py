@@ -0,0 +1,50 @@
+import random
+
+import pytest
+
+from streams import merge_sorted
+
+pytestmark = pytest.mark.anyio
+
+
+async def iterate(items):
+    for item in items:
+        yield item
+
+
+async def collect(source):
+    return [item async for item in source]
+
+
+async def test_merges_sorted_sources():
+    rng = random.Random(3)
+    lists = [sorted(rng.randrange(50) for _ in range(rng.randrange(20))) for _ in range(6)]
+    merged = await collect(merge_sorted([iterate(items) for items in lists], key=lambda item: item))
+    assert merged == sorted(item for items in lists for item in items)
+
+
+async def test_descending_merge():
+    lists = [[9, 5, 1], [8, 8, 2], [], [10]]
+    merged = await collect(merge_sorted([iterate(items) for items in lists], key=lambda item: item, reverse=True))
+    assert merged == [10, 9, 8, 8, 5, 2, 1]
+
+
+async def test_ties_keep_source_order_without_comparing_items():
+    # Dicts are not orderable; equal keys must be broken by the source index
+    sources = [iterate([{"k": 1, "src": 0}]), iterate([{"k": 1, "src": 1}]), iterate([{"k": 0, "src": 2}])]
+    merged = await collect(merge_sorted(sources, key=lambda item: item["k"]))
+    assert [item["src"] for item in merged] == [2, 0, 1]
+
+
+async def test_sources_are_read_lazily():
+    pulled = []
+
+    async def counted(name, items):
+        for item in items:
+            pulled.append(name)
+            yield item
+
+    merged = merge_sorted([counted("a", range(0, 1000, 2)), counted("b", range(1, 1000, 2))], key=lambda item: item)
+    assert [await merged.__anext__() for _ in range(3)] == [0, 1, 2]
+    await merged.aclose()
+    assert len(pulled) <= 5
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from cold_storage import TIER_SOURCES, ColdStorage
+from timeline import Timeline, decode_cursor
+
+pytestmark = pytest.mark.anyio
+
+USER_ID = "user-1"
+
+
+async def seed(db, now: datetime):
+    """Pomodoros and sleep logs, with several items sharing a timestamp across collections"""
+    pomodoros, nights = [], []
+    for i in range(25):
+        when = now - timedelta(hours=6 * (i // 2))
+        pomodoros.append({"id": f"p{i:02d}", "user_id": USER_ID, "timestamp": when})
+        if i % 3 == 0:
+            nights.append({"id": f"s{i:02d}", "user_id": USER_ID, "bedtime": when})
+    pomodoros.append({"id": "other", "user_id": "user-2", "timestamp": now})
+    await db.pomodoro_sessions.insert_many(pomodoros)
+    await db.sleep_data.insert_many(nights)
+    return sorted(
+        [("pomodoro", doc["timestamp"], doc["id"]) for doc in pomodoros if doc["user_id"] == USER_ID]
+        + [("sleep", doc["bedtime"], doc["id"]) for doc in nights],
+        key=lambda item: (item[1], item[2]),
+        reverse=True,
+    )
+
+
+async def read_all(timeline: Timeline, limit: int, **kwargs):
+    items, cursor, pages = [], None, 0
+    while True:
+        page = await timeline.page(USER_ID, limit=limit, cursor=cursor, **kwargs)
+        assert len(page["items"]) <= limit
+        items += [(item["type"], item["timestamp"], item["id"]) for item in page["items"]]
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return items, pages
+
+
+@pytest.mark.parametrize("limit", [1, 4, 7, 100])
+async def test_pages_cover_everything_once_newest_first(db, limit):
+    now = datetime(2024, 6, 1, 12, 0)
+    expected = await seed(db, now)
+    timeline = Timeline(db)
+    await timeline.ensure_indexes()
+
+    items, pages = await read_all(timeline, limit)
+    assert items == expected
+    assert pages == max(1, -(-len(expected) // limit))
+
+
+async def test_type_filter_and_cursor_position(db):
+    expected = await seed(db, datetime(2024, 6, 1, 12, 0))
+    timeline = Timeline(db)
+
+    page = await timeline.page(USER_ID, types=["sleep"], limit=3)
+    assert [item["id"] for item in page["items"]] == [item[2] for item in expected if item[0] == "sleep"][:3]
+    last = page["items"][-1]
+    assert decode_cursor(page["next_cursor"]) == (last["timestamp"], last["id"])
+    with pytest.raises(ValueError):
+        await timeline.page(USER_ID, types=["nope"])
+
+
+async def test_pages_continue_into_cold_storage(db):
+    now = datetime.utcnow().replace(microsecond=0)
+    expected = await seed(db, now - timedelta(days=2))
+    archive = ColdStorage(db, {"pomodoro_sessions": TIER_SOURCES["pomodoro_sessions"]}, hot_days=2.5, chunk_size=4)
+    moved = await archive.archive_user(TIER_SOURCES["pomodoro_sessions"], USER_ID, archive.cutoff())
+    assert 0 < moved < 25
+
+    items, _ = await read_all(Timeline(db, archive=archive), 5)
+    assert items == expected
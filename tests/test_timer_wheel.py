@@ -0,0 +1,47 @@
+from timer_wheel import TimerWheel
+
+START = 1_700_000_000.0
+
+
+def test_timers_fire_in_deadline_order_across_levels():
+    wheel = TimerWheel(tick=1.0, wheel_sizes=(8, 8, 8), now=START)
+    # Within the first slot, a few wheel turns out, and past the horizon (512 ticks)
+    delays = [3.5, 1.2, 70, 9, 600, 65, 3.1, 1000, 8]
+    for i, delay in enumerate(delays):
+        wheel.schedule(f"t{i}", START + delay, payload=delay)
+
+    fired = []
+    for step in range(1, 1001):
+        expired = wheel.advance(START + step)
+        for key, deadline, payload in expired:
+            # Never early, and no later than the tick the deadline rounds up to
+            assert START + step - 1 < deadline <= START + step
+            fired.append(payload)
+
+    assert fired == sorted(delays)
+    assert len(wheel) == 0
+
+
+def test_cancel_and_reschedule():
+    wheel = TimerWheel(tick=1.0, wheel_sizes=(8, 8), now=START)
+    wheel.schedule("a", START + 5)
+    wheel.schedule("b", START + 5)
+    wheel.schedule("c", START + 40)
+    assert wheel.cancel("b")
+    assert not wheel.cancel("b")
+    wheel.schedule("a", START + 20)
+    assert wheel.deadline("a") == START + 20
+    assert "b" not in wheel
+
+    assert wheel.advance(START + 10) == []
+    assert [key for key, _, _ in wheel.advance(START + 20)] == ["a"]
+    wheel.cancel("c")
+    assert wheel.advance(START + 100) == []
+    assert len(wheel) == 0
+
+
+def test_past_deadlines_fire_on_the_next_tick():
+    wheel = TimerWheel(tick=1.0, now=START)
+    wheel.schedule("late", START - 30)
+    assert wheel.advance(START) == []
+    assert wheel.advance(START + 1) == [("late", START - 30, None)]